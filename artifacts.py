@@ -0,0 +1,139 @@
+"""Per-stage artifacts of the daily run, so that a failed run resumes where it
+stopped instead of starting over.
+
+    run = artifacts.Run(date_str)  # cache/run-<date>/
+    if not run.done("score"):
+        run.save("score", scored)
+    scored = run.load("score")
+
+A stage's output is written atomically once the stage is complete. Stages that
+work item by item (fetch, summarize, post) also append each finished item to a
+log, so a resumed run skips the items already done.
+"""
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+STAGES = [
+    "ingest",
+    "resolve",
+    "score",
+    "fetch",
+    "cluster",
+    "summarize",
+    "compose",
+    "post",
+]
+
+
+class DateTimeEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        return super(DateTimeEncoder, self).default(obj)
+
+
+class Run:
+    def __init__(self, date_str, root="cache"):
+        self.date_str = date_str
+        self.dir = os.path.join(root, f"run-{date_str}")
+        os.makedirs(self.dir, exist_ok=True)
+        self._item_logs = {}
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def done(self, stage):
+        return os.path.exists(self.path(f"{stage}.json"))
+
+    def save(self, stage, data):
+        path = self.path(f"{stage}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f, cls=DateTimeEncoder)
+        os.replace(path + ".tmp", path)
+        logger.info(f"Stage {stage} done")
+
+    def load(self, stage):
+        logger.info(f"Stage {stage} already done, resuming after it")
+        with open(self.path(f"{stage}.json"), "r") as f:
+            return json.load(f)
+
+    def items(self, stage):
+        """The log of the items of stage done so far."""
+        return self._log(f"{stage}.items.jsonl")
+
+    def failures(self, stage):
+        """The log of how many attempts at each item of stage failed."""
+        return self._log(f"{stage}.failures.jsonl")
+
+    def _log(self, name):
+        with self._lock:
+            if name not in self._item_logs:
+                self._item_logs[name] = ItemLog(self.path(name))
+            return self._item_logs[name]
+
+    def reset(self, from_stage):
+        """Forget from_stage and the stages after it, so they run again. What
+        was posted is never forgotten, so nothing is posted twice."""
+        for stage in STAGES[STAGES.index(from_stage) :]:
+            names = [f"{stage}.json"]
+            if stage != "post":
+                names += [f"{stage}.items.jsonl", f"{stage}.failures.jsonl"]
+            for name in names:
+                self._item_logs.pop(name, None)
+                if os.path.exists(self.path(name)):
+                    os.remove(self.path(name))
+
+
+class ItemLog:
+    """Append-only JSONL of the finished items of a stage, by key. Without a
+    path, items are only kept in memory."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.items = {}
+        self._torn = False
+        if path is None:
+            return
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn by a crash mid-write; the item is redone.
+                        self._torn = not line.endswith("\n")
+                        continue
+                    self.items[item["key"]] = item["value"]
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, default=None):
+        return self.items.get(key, default)
+
+    def add(self, key, value):
+        line = json.dumps({"key": key, "value": value}, cls=DateTimeEncoder)
+        with self.lock:
+            if self.path is None:
+                self.items[key] = value
+                return
+            with open(self.path, "a") as f:
+                if self._torn:
+                    f.write("\n")
+                    self._torn = False
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.items[key] = value
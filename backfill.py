@@ -0,0 +1,270 @@
+"""Candidate links of past days, from archived toot dumps.
+
+    python lotd.py backfill cache/toots.json archive/*.jsonl
+
+Dumps are JSON arrays of statuses (the old cache/toots.json) or JSONL of
+statuses or toot records (the cache/toots.jsonl store). Links are extracted,
+canonicalized and counted in a pool of processes (map), and the partial
+counts are merged by toot uri in the main process (reduce), so that a toot
+found in several dumps, or several times in one, counts once with its highest
+counts. DOI links are then resolved in one batch, and the most popular links
+of each day are written to <out_dir>/lotd-candidates-<date>.json, like the
+score stage of a daily run.
+
+Dumps are split into byte ranges that the workers read and decode themselves.
+JSONL ranges start and end at line breaks. JSON arrays are cut before a "{"
+that follows "}," - the start of the next toot, usually, which is only known
+once decoded: a cut inside a string or a nested object makes the ranges on
+both sides fail to decode, and they are decoded again as one range.
+
+The per-toot rules are those of get_toots.stage_score, applied before DOIs are
+resolved, and days are local calendar days.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import heapq
+import json
+import logging
+import os
+import re
+
+from canonical_url import canonicalize
+from doi_resolver import is_doi_link
+from toot_store import TootRecord
+
+logger = logging.getLogger(__name__)
+
+# Bytes of a dump per task.
+CHUNK_BYTES = 8 << 20
+# "}," then "{" between toots of a JSON array, or maybe not.
+CUT_RE = re.compile(rb"\}\s*,\s*\{")
+# Bytes read at once when looking for a cut.
+CUT_WINDOW = 64 * 1024
+
+
+class BadCut(ValueError):
+    """A range of a JSON array that isn't a list of toots, for a cut."""
+
+
+def backfill(
+    paths,
+    out_dir,
+    workers=None,
+    resolve=None,
+    candidates=30,
+    excluded=(),
+    chunk_bytes=CHUNK_BYTES,
+):
+    """Write the candidate links of every day in the dumps at paths, returns
+    {date: path of its file}. `resolve` maps DOI links to their landing page
+    (e.g. DoiResolver.resolve_many), they are left as is without it. Links
+    starting with one of `excluded` are not counted."""
+    workers = workers or os.cpu_count()
+    excluded = tuple(excluded)
+    days = {}
+    bad_cuts = []
+
+    def reduce(future, task):
+        try:
+            reduce_counts(days, future.result())
+        except BadCut:
+            bad_cuts.append(task)
+
+    with ProcessPoolExecutor(workers) as pool:
+        # A few tasks per worker in flight, so that dumps are read as they
+        # are counted rather than queued up in memory.
+        pending = {}
+        for task in iter_tasks(paths, chunk_bytes):
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    reduce(future, pending.pop(future))
+            pending[pool.submit(map_task, task, excluded)] = task
+        for future, task in pending.items():
+            reduce(future, task)
+
+        # The ranges on both sides of a bad cut failed: together they decode.
+        if bad_cuts:
+            logger.info(f"Decoding again {len(bad_cuts)} ranges cut within a toot")
+        merged = [pool.submit(map_task, task, excluded) for task in merge(bad_cuts)]
+        for future in merged:
+            reduce_counts(days, future.result())
+
+    if resolve is not None:
+        resolve_dois(days, resolve)
+
+    os.makedirs(out_dir, exist_ok=True)
+    written = {}
+    for day, links in sorted(days.items()):
+        written[day] = os.path.join(out_dir, f"lotd-candidates-{day}.json")
+        with open(written[day] + ".tmp", "w") as f:
+            json.dump(top_links(links, candidates), f)
+        os.replace(written[day] + ".tmp", written[day])
+    logger.info(f"Wrote the candidates of {len(written)} days to {out_dir}")
+    return written
+
+
+def iter_tasks(paths, chunk_bytes=CHUNK_BYTES):
+    """("lines", path, start, end) tasks for JSONL dumps, ("array", path,
+    start, end) ones for JSON arrays, about chunk_bytes each."""
+    for path in paths:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            is_array = f.read(64).lstrip()[:1] == b"["
+            if not is_array:
+                for start in range(0, size, chunk_bytes):
+                    yield ("lines", path, start, min(start + chunk_bytes, size))
+                continue
+            start = 0
+            while start < size:
+                end = size
+                if start + chunk_bytes < size:
+                    end = find_cut(f, start + chunk_bytes)
+                yield ("array", path, start, end)
+                start = end
+
+
+def find_cut(f, pos):
+    """Offset of the first "{" after "}," from pos on in file f, or of its
+    end."""
+    while True:
+        f.seek(pos)
+        # Overlapping windows, for a cut across two of them.
+        window = f.read(CUT_WINDOW)
+        match = CUT_RE.search(window)
+        if match:
+            return pos + match.end() - 1
+        if len(window) < CUT_WINDOW:
+            return pos + len(window)
+        pos += CUT_WINDOW - 1024
+
+
+def merge(tasks):
+    """Consecutive ranges of the same file as one."""
+    merged = []
+    for task in sorted(tasks):
+        if merged and merged[-1][1] == task[1] and merged[-1][3] == task[2]:
+            merged[-1] = (*merged[-1][:3], task[3])
+        else:
+            merged.append(task)
+    return merged
+
+
+def map_task(task, excluded=()):
+    kind, path, start, end = task
+    if kind == "lines":
+        statuses = (json.loads(line) for line in read_range(path, start, end))
+    else:
+        statuses = read_array_range(path, start, end)
+    return count_links(statuses, excluded)
+
+
+def read_range(path, start, end):
+    """The lines of a file that start within [start, end)."""
+    with open(path, "rb") as f:
+        pos = start
+        if start > 0:
+            # The line running over start belongs to the range before.
+            f.seek(start - 1)
+            pos += len(f.readline()) - 1
+        while pos < end:
+            line = f.readline()
+            if not line:
+                return
+            pos += len(line)
+            if line.strip():
+                yield line
+
+
+def read_array_range(path, start, end):
+    """The toots in [start, end) of a JSON array: from its "[" or a cut, to a
+    cut or its "]". Raises BadCut when that isn't a list of objects."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).strip()
+    if text.startswith(b"["):
+        text = text[1:]
+    if text.endswith(b"]"):
+        text = text[:-1]
+    else:
+        text = text.rstrip(b",")
+    try:
+        statuses = json.loads(b"[" + text + b"]")
+    except ValueError as e:
+        raise BadCut(f"{path} [{start}, {end}): {e}")
+    if not all(isinstance(status, dict) for status in statuses):
+        raise BadCut(f"{path} [{start}, {end}) isn't a list of objects")
+    return statuses
+
+
+def count_links(statuses, excluded=()):
+    """{day: {link: {toot uri: (acct, popularity)}}} of statuses (or toot
+    records): the map step."""
+    days = {}
+    for status in statuses:
+        toot = TootRecord.from_dict(status)
+        if toot.visibility != "public" or toot.nobot:
+            continue
+        day = toot.created_at.astimezone().date().isoformat()
+        links = days.setdefault(day, {})
+        # DOI links are kept as they are, to be resolved in one batch.
+        canonical = set(
+            link if is_doi_link(link) else canonicalize(link)
+            for link in toot.links
+            if not link.endswith(".pdf")
+        )
+        for link in sorted(canonical, key=lambda x: "rxiv" not in x):
+            if link.startswith(excluded) or "/@" in link:
+                continue
+            links.setdefault(link, {})[toot.uri] = (toot.acct, toot.popularity)
+            if "rxiv" in link:
+                break
+    return days
+
+
+def reduce_counts(days, partial):
+    """Merge a partial count into days; a toot counted twice keeps its
+    highest popularity, counts only go up."""
+    for day, links in partial.items():
+        into = days.setdefault(day, {})
+        for link, toots in links.items():
+            _merge_toots(into.setdefault(link, {}), toots)
+
+
+def resolve_dois(days, resolve):
+    dois = set(link for links in days.values() for link in links if is_doi_link(link))
+    if not dois:
+        return
+    logger.info(f"Resolving {len(dois)} DOIs")
+    resolved = resolve(dois)
+    for links in days.values():
+        for link in [link for link in links if link in dois]:
+            target = canonicalize(resolved.get(link, link))
+            if target != link:
+                _merge_toots(links.setdefault(target, {}), links.pop(link))
+
+
+def top_links(links, n):
+    """The n most popular links, as the score stage lists them."""
+    scored = []
+    for link, toots in links.items():
+        popularity = sum(popularity for _, popularity in toots.values())
+        if popularity >= 1:
+            scored.append((popularity, link))
+    top = []
+    for popularity, link in heapq.nlargest(n, scored):
+        backlinks = sorted(links[link])
+        top.append(
+            {
+                "url": link,
+                "backlinks": backlinks,
+                "linked_by": [links[link][uri][0] for uri in backlinks],
+                "popularity": popularity,
+            }
+        )
+    return top
+
+
+def _merge_toots(into, toots):
+    for uri, (acct, popularity) in toots.items():
+        if uri not in into or into[uri][1] < popularity:
+            into[uri] = (acct, popularity)
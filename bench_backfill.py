@@ -0,0 +1,63 @@
+"""Backfill throughput as the number of worker processes grows, on a JSONL
+dump of synthetic statuses (or a JSON array of them, with --array).
+
+    python bench_backfill.py --toots 1000000 --workers 1 2 4 8
+
+DOIs are not resolved, so only extraction, canonicalization and counting are
+measured. Speedup is relative to the first worker count.
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+import random
+import tempfile
+import time
+
+import backfill
+from artifacts import DateTimeEncoder
+from bench_toot_store import make_status
+
+
+def write_dump(path, n_toots, array=False):
+    rng = random.Random(0)
+    now = datetime.now(timezone.utc)
+    with open(path, "w") as f:
+        f.write("[" if array else "")
+        for i in range(n_toots):
+            if array and i:
+                f.write(", ")
+            f.write(json.dumps(make_status(i, now, rng), cls=DateTimeEncoder))
+            f.write("" if array else "\n")
+        f.write("]" if array else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--toots", type=int, default=200_000)
+    parser.add_argument("--array", action="store_true", help="a JSON array dump")
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()]
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, "toots.json" if args.array else "toots.jsonl")
+        write_dump(dump, args.toots, args.array)
+        size = os.path.getsize(dump) / 1e6
+        print(f"{args.toots} toots, {size:.0f} MB, {os.cpu_count()} cores")
+        print(f"{'workers':>8} {'seconds':>8} {'toots/s':>10} {'speedup':>8}")
+        baseline = None
+        for workers in sorted(set(args.workers)):
+            start = time.perf_counter()
+            backfill.backfill([dump], os.path.join(tmp, "out"), workers=workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(
+                f"{workers:>8} {elapsed:>8.2f} {args.toots / elapsed:>10.0f} "
+                f"{baseline / elapsed:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Scaling of the old substring stemming loop vs canonical URL grouping.
+
+    python bench_canonical_url.py
+"""
+import random
+import time
+
+from canonical_url import group_links
+
+
+def stem_links_quadratic(popular_links):
+    """The stemming pass get_toots.main used before canonical URLs."""
+    banned_links = set()
+    for i, popular_link in enumerate(popular_links):
+        leaf = popular_link.split("://")[-1]
+        for j, popular_link2 in enumerate(popular_links):
+            if i != j and leaf in popular_link2:
+                banned_links.add(popular_link)
+    return [x for x in popular_links if x not in banned_links]
+
+
+def synthetic_links(n, seed=0):
+    rng = random.Random(seed)
+    templates = [
+        "https://arxiv.org/abs/23{:02d}.{:05d}",
+        "https://arxiv.org/pdf/23{:02d}.{:05d}v2.pdf",
+        "https://www.biorxiv.org/content/10.1101/2023.{:02d}.{:05d}v1",
+        "http://www.nature.com/articles/s41586-023-{:02d}{:05d}/",
+        "https://news.example.com/{:02d}/{:05d}?utm_source=mastodon",
+    ]
+    return [
+        rng.choice(templates).format(rng.randint(1, 12), rng.randint(0, n))
+        for _ in range(n)
+    ]
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{'links':>8} {'substring loop':>16} {'canonical':>12}")
+    quadratic = None
+    for n in [1000, 2000, 4000, 8000, 16000, 100000]:
+        links = list(set(synthetic_links(n)))
+        canonical = timed(group_links, links)
+        if n <= 8000:
+            quadratic, quadratic_n = timed(stem_links_quadratic, links), len(links)
+            quadratic_str = f"{quadratic:.3f} s"
+        else:
+            # Too slow to run; extrapolate from the largest measured size.
+            estimate = quadratic * (len(links) / quadratic_n) ** 2
+            quadratic_str = f"~{estimate:.0f} s"
+        print(f"{len(links):>8} {quadratic_str:>16} {canonical:>10.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Scaling of near-duplicate clustering with the number of candidate pages,
+against comparing every pair of MinHash signatures.
+
+    python bench_cluster.py
+"""
+import itertools
+import random
+import time
+
+import cluster
+
+WORDS = [f"w{i}" for i in range(5000)]
+
+
+def synthetic_pages(n, seed=0):
+    """n pages, a tenth of them edited copies of another."""
+    rng = random.Random(seed)
+    pages = []
+    for i in range(n):
+        if pages and rng.random() < 0.1:
+            words = rng.choice(pages)["body"].split()
+            words[rng.randrange(len(words))] = "edited"
+        else:
+            words = [rng.choice(WORDS) for _ in range(rng.randint(200, 1500))]
+        pages.append({"url": f"https://example.com/{i}", "body": " ".join(words)})
+    return pages
+
+
+def cluster_pairwise(pages, threshold=0.5):
+    signatures = [
+        cluster.minhash(cluster.shingles(cluster.page_text(page))) for page in pages
+    ]
+    return [
+        (i, j)
+        for i, j in itertools.combinations(range(len(pages)), 2)
+        if cluster.similarity(signatures[i], signatures[j]) >= threshold
+    ]
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{'pages':>8} {'pairwise':>12} {'LSH':>10} {'ms/page':>8}")
+    for n in [30, 100, 300, 1000, 3000]:
+        pages = synthetic_pages(n)
+        pairwise = f"{timed(cluster_pairwise, pages):.3f} s" if n <= 1000 else "-"
+        lsh = timed(cluster.cluster, pages)
+        print(f"{n:>8} {pairwise:>12} {lsh:>8.3f} s {1000 * lsh / n:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
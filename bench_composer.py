@@ -0,0 +1,79 @@
+"""Rendering thousands of digests with the composer, against the f-strings
+post_toots used before (no escaping, no length checks).
+
+    python -m pytest bench_composer.py
+"""
+import random
+
+import pytest
+
+from composer import Composer
+
+N_DIGESTS = 2000
+DATE = "2023-04-01"
+
+
+def make_lotd(rng):
+    return [
+        {
+            "url": f"https://example.com/article/{rng.randrange(10**6)}?ref=a&b=c",
+            "title": f"Grid cells & place cells in bats, part {i}",
+            "website": "Example",
+            "tldr": "Bats navigate with grid cells, and it's not what we thought.",
+            "summary": " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120))),
+            "linked_by": [f"user{j}" for j in range(rng.randint(1, 6))],
+            "popularity": rng.randint(1, 200),
+            "backlinks": [f"https://fake.social/users/user1/statuses/{i}"],
+            "is_scientific_article": rng.random() < 0.5,
+            "is_news": rng.random() < 0.3,
+        }
+        for i in range(10)
+    ]
+
+
+WORDS = "grid cells bats neurons cortex <model> data memory's spikes brain".split()
+DIGESTS = [make_lotd(random.Random(i)) for i in range(N_DIGESTS)]
+
+
+def get_formatted_toots(lotd):
+    """How post_toots formatted the toots before the composer."""
+    toots = []
+    for link in lotd:
+        accounts = ["@" + username for username in link["linked_by"]]
+        if len(accounts) == 1:
+            accounts = accounts[0]
+        elif len(accounts) > 3:
+            accounts = ", ".join(accounts[:3]) + f" and {len(accounts) - 3} others"
+        else:
+            accounts = ", ".join(accounts[:-1]) + f" and {accounts[-1]}"
+        tags = ["#lotd"]
+        if link["is_scientific_article"]:
+            tags.append("#science")
+        if link["is_news"]:
+            tags.append("#news")
+        tags = " ".join(tags)
+
+        content = f"""
+<h1><a href='{link['url']}'>{link['title']} - {link['website']}</a></h1>
+<h2>TL;DR {link['tldr']}</h2>
+<p>Linked by {accounts} ({link['popularity']}⭐)</p>
+<p>{link['summary']}</p>
+<p>{tags}</p>
+<p>Original link: <a href='{link['backlinks'][0]}'>{link['backlinks'][0]}</a></p>
+"""
+
+        toots.append(content)
+    return toots
+
+
+@pytest.mark.benchmark(group="compose")
+def test_fstrings(benchmark):
+    benchmark(lambda: [get_formatted_toots(lotd) for lotd in DIGESTS])
+
+
+@pytest.mark.parametrize("max_characters", [500, 1000])
+@pytest.mark.benchmark(group="compose")
+def test_composer(benchmark, max_characters):
+    composer = Composer(max_characters)
+    summary = "Bats, brains"
+    benchmark(lambda: [composer.digest(lotd, summary, DATE) for lotd in DIGESTS])
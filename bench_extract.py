@@ -0,0 +1,103 @@
+"""Speed and output parity of the streaming extractor against the original
+multi-pass cleanup, on the saved pages in fixtures/pages.
+
+    python -m pytest bench_extract.py
+"""
+import glob
+
+from bs4 import BeautifulSoup, Comment, NavigableString
+import pytest
+
+from extract import extract_content, extract_links
+
+PAGES = {}
+for path in sorted(glob.glob("fixtures/pages/*.html")):
+    with open(path, encoding="utf-8") as f:
+        PAGES[path.split("/")[-1][:-5]] = f.read()
+# A long page, the size of a full-text article.
+PAGES["large"] = "<html><body><main>" + "".join(PAGES.values()) * 50 + "</main></body></html>"
+
+TOOTS = [
+    '<p>Check out <a href="https://arxiv.org/abs/2304.{:05d}" rel="nofollow noopener" '
+    'target="_blank"><span class="invisible">https://</span>arxiv.org/abs/2304.{:05d}</a> '
+    'by <span class="h-card"><a href="https://neuromatch.social/@bob" class="u-url mention">'
+    "@<span>bob</span></a></span></p>".format(i, i)
+    for i in range(1000)
+]
+
+
+def multipass_extract_content(html):
+    """The cleanup extract_content did before it was streamed."""
+    soup = BeautifulSoup(html, "html.parser")
+
+    title_tag = soup.find("title")
+    title = title_tag.text.strip() if title_tag else ""
+
+    for tag in [
+        "link", "style", "script", "noscript", "iframe", "img", "picture", "svg",
+        "math", "form", "input", "header", "footer", "nav", "ul", "ol",
+    ]:
+        for match in soup.find_all(tag):
+            match.decompose()
+
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+
+    for element in soup():
+        for attr in list(element.attrs.keys()):
+            if attr.startswith("data-") or attr.startswith("aria-"):
+                del element.attrs[attr]
+
+    for attr in ["class", "style", "onclick", "id"]:
+        for tag in soup.find_all(attrs={attr: True}):
+            del tag[attr]
+
+    for text_node in soup.find_all(string=True):
+        if isinstance(text_node, NavigableString):
+            text_node.replace_with(" ".join(text_node.split()))
+
+    for tag in soup.find_all():
+        if not tag.contents:
+            tag.extract()
+
+    for div in soup.find_all("div"):
+        div.unwrap()
+
+    main_tag = soup.find("main")
+    if main_tag:
+        body = "".join([str(x) for x in main_tag.contents])
+    else:
+        body_tag = soup.find("body")
+        body = "".join([str(x) for x in body_tag.contents]) if body_tag else ""
+
+    return {"title": title, "body": body}
+
+
+def soup_extract_links(html_string):
+    soup = BeautifulSoup(html_string, "html.parser")
+    return [a.get("href") for a in soup.find_all("a")]
+
+
+@pytest.mark.parametrize("page", PAGES)
+@pytest.mark.benchmark(group="extract_content")
+def test_streaming(benchmark, page):
+    result = benchmark(extract_content, PAGES[page])
+    del result["description"], result["identifiers"]
+    assert result == multipass_extract_content(PAGES[page])
+
+
+@pytest.mark.parametrize("page", PAGES)
+@pytest.mark.benchmark(group="extract_content")
+def test_multipass(benchmark, page):
+    benchmark(multipass_extract_content, PAGES[page])
+
+
+@pytest.mark.benchmark(group="extract_links")
+def test_href_scanner(benchmark):
+    result = benchmark(lambda: [extract_links(toot) for toot in TOOTS])
+    assert result == [soup_extract_links(toot) for toot in TOOTS]
+
+
+@pytest.mark.benchmark(group="extract_links")
+def test_soup_links(benchmark):
+    benchmark(lambda: [soup_extract_links(toot) for toot in TOOTS])
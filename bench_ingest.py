@@ -0,0 +1,78 @@
+"""Benchmark full-day vs incremental timeline ingestion against a fake instance.
+
+    python bench_ingest.py --toots 20000 --latency 0.05
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+import os
+import tempfile
+import time
+
+from mastodon import Mastodon
+
+import fake_mastodon
+import get_toots
+import ingest
+
+
+def report(name, fake, requests_before, start):
+    elapsed = time.time() - start
+    pages = fake.requests - requests_before
+    print(f"{name:<28} {pages:>6} pages {elapsed:>8.2f} s {pages / elapsed:>8.1f} pages/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--toots", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--sleep", type=float, default=1.0, help="legacy per-page sleep")
+    args = parser.parse_args()
+
+    fake = fake_mastodon.FakeMastodon(
+        fake_mastodon.make_timeline(args.toots, hours=36),
+        ratelimit_limit=100000,
+        latency=args.latency,
+    )
+    server, url = fake_mastodon.serve(fake)
+    mastodon = Mastodon(api_base_url=url, version_check_mode="none")
+
+    # The full-day walk, with the fixed sleep the loop used to have.
+    original_timeline_local = mastodon.timeline_local
+
+    def timeline_local_with_sleep(*a, **kw):
+        time.sleep(args.sleep)
+        return original_timeline_local(*a, **kw)
+
+    mastodon.timeline_local = timeline_local_with_sleep
+    requests_before, start = fake.requests, time.time()
+    get_toots.fetch_toots_from_last_day(mastodon)
+    report(f"full day (sleep {args.sleep}s)", fake, requests_before, start)
+    mastodon.timeline_local = original_timeline_local
+
+    requests_before, start = fake.requests, time.time()
+    get_toots.fetch_toots_from_last_day(mastodon)
+    report("full day (header pacing)", fake, requests_before, start)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = dict(
+            checkpoint_path=os.path.join(tmp, "min_id.txt"),
+            store_path=os.path.join(tmp, "toots.jsonl"),
+        )
+        requests_before, start = fake.requests, time.time()
+        ingest.ingest(mastodon, overlap=timedelta(0), **paths)
+        report("incremental, first run", fake, requests_before, start)
+
+        # An hour's worth of new toots.
+        later = datetime.now(timezone.utc) + timedelta(hours=1)
+        fake.add_toots(
+            fake_mastodon.make_timeline(args.toots // 36, hours=1, seed=1, now=later)
+        )
+        requests_before, start = fake.requests, time.time()
+        ingest.ingest(mastodon, overlap=timedelta(0), **paths)
+        report("incremental, hourly run", fake, requests_before, start)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Query time of the link history with a year of synthetic daily scores.
+
+    python bench_link_history.py --days 365 --links 5000
+
+Each day scores --links links: most of them seen on earlier days, with a
+long-tailed popularity, a few new ones. Reports the size of the database and
+the median time of each query on the last day.
+"""
+import argparse
+from datetime import date, timedelta
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from link_history import LinkHistory
+
+
+def fill(history, days, links, rng):
+    start = date.today() - timedelta(days=days - 1)
+    next_link = 0
+    for i in range(days):
+        day = (start + timedelta(days=i)).isoformat()
+        # A tenth of the day's links are new, the rest come back.
+        new = links // 10 if next_link else links
+        urls = [f"https://example.com/{next_link + j}" for j in range(new)]
+        next_link += new
+        urls += [
+            f"https://example.com/{rng.randrange(next_link)}"
+            for _ in range(links - new)
+        ]
+        scores = {
+            url: (round(rng.paretovariate(1.2), 1), rng.randint(1, 20)) for url in urls
+        }
+        history.record_scores(day, scores)
+        history.record_featured(day, [{"url": url} for url in urls[:10]])
+    return day
+
+
+def timed(query, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = query()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--links", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "history.sqlite")
+        history = LinkHistory(path, keep_days=args.days)
+        start = time.perf_counter()
+        day = fill(history, args.days, args.links, random.Random(0))
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path) / 1e6
+        print(
+            f"{args.days} days of {args.links} links: {size:.0f} MB, "
+            f"written in {elapsed:.1f} s"
+        )
+        queries = {
+            "featured_within(7)": lambda: history.featured_within(day, 7),
+            "new_links": lambda: history.new_links(day),
+            "rising(7)": lambda: history.rising(day, 7),
+            "trend": lambda: history.trend("https://example.com/0"),
+        }
+        print(f"{'query':>20} {'ms':>8} {'rows':>6}")
+        for name, query in queries.items():
+            ms, result = timed(query, args.repeat)
+            print(f"{name:>20} {ms:>8.2f} {len(result):>6}")
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Latency and throughput of LLM requests with and without hedging, against a
+mock backend where some requests are much slower than the rest.
+
+    python bench_llm.py --requests 200 --latency 0.05 --slow-every 50 --slow-latency 2
+
+Each request takes latency plus up to jitter seconds, and every slow_every-th
+slow_latency more.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import llm
+import mock_llm
+
+
+def run(args, hedge_percentile):
+    backend = mock_llm.MockBackend(
+        mock_llm.MockLLM(latency=args.latency),
+        jitter=args.jitter,
+        slow_every=args.slow_every,
+        slow_latency=args.slow_latency,
+    )
+    client = llm.LLM(
+        backend,
+        max_concurrency=args.concurrency,
+        hedge_percentile=hedge_percentile,
+    )
+
+    def request(i):
+        start = time.perf_counter()
+        client.complete(f"Summarize page {i}", ["mock"])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        latencies = sorted(pool.map(request, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    return latencies, elapsed, backend.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--slow-every", type=int, default=50)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(
+        f"{'hedging':>10} {'p50':>7} {'p95':>7} {'max':>7} {'req/s':>7} {'sent':>6}"
+    )
+    for hedge_percentile in [None, 0.95, 0.9]:
+        latencies, elapsed, calls = run(args, hedge_percentile)
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        label = "off" if hedge_percentile is None else f"p{hedge_percentile * 100:.0f}"
+        print(
+            f"{label:>10} {p50:>7.3f} {p95:>7.3f} {latencies[-1]:>7.3f} "
+            f"{args.requests / elapsed:>7.1f} {calls:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
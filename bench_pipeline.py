@@ -0,0 +1,64 @@
+"""End-to-end benchmark of get_toots and post_toots, replayed offline.
+
+    python bench_pipeline.py --bundle fixtures/replay/2023-05-01
+    python bench_pipeline.py --toots 20000 --page-latency 0.3 --llm-latency 2
+
+Without --bundle, a synthetic bundle is generated (see replay.make_bundle).
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+import replay
+
+
+def print_report(name, report):
+    print(f"{name}: {report['wall_time']:.2f} s")
+    spans = sorted(report["spans"].items(), key=lambda x: x[1]["total"], reverse=True)
+    for span, timing in spans:
+        print(
+            f"  {span:<36} {timing['count']:>6} calls {timing['total']:>8.2f} s total "
+            f"{timing['p95']:>7.3f} s p95"
+        )
+    for counter, value in sorted(report["counters"].items()):
+        print(f"  {counter:<36} {value:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bundle")
+    parser.add_argument("--toots", type=int, default=5000)
+    parser.add_argument("--mastodon-latency", type=float, default=0.05)
+    parser.add_argument("--page-latency", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bundle = args.bundle and os.path.abspath(args.bundle)
+        if bundle is None:
+            bundle = os.path.join(tmp, "bundle")
+            replay.make_bundle(bundle, args.toots)
+
+        with replay.replaying(
+            bundle,
+            mastodon_latency=args.mastodon_latency,
+            page_latency=args.page_latency,
+            llm_latency=args.llm_latency,
+        ) as stand_ins:
+            reports = replay.run(stand_ins.mastodon)
+            n_toots = reports["get_toots"]["counters"].get("mastodon.toots", 0)
+            wall_time = sum(report["wall_time"] for report in reports.values())
+            print(
+                f"{n_toots} toots, {len(stand_ins.fake.posted)} posts, "
+                f"{stand_ins.fake.requests} Mastodon requests, "
+                f"{stand_ins.llm.requests} LLM requests in {wall_time:.2f} s "
+                f"({n_toots / wall_time:.0f} toots/s)"
+            )
+            for name, report in reports.items():
+                print_report(name, report)
+
+
+if __name__ == "__main__":
+    main()
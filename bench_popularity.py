@@ -0,0 +1,115 @@
+"""Update and query cost of the popularity index, against rebuilding the
+scores from scratch every run as get_toots.main used to.
+
+    python bench_popularity.py --toots 10000 100000 1000000
+
+The toots are spread over a week and link to a long-tailed pool of links. An
+hourly run brings 1% new toots and new counts for another 1%.
+"""
+import argparse
+import collections
+import random
+import time
+
+from popularity import DAY, HOUR, WEEK, PopularityIndex
+
+NOW = 1_700_000_000 // HOUR * HOUR
+
+
+def make_toots(n_toots, rng):
+    n_links = max(n_toots // 5, 10)
+    toots = []
+    for i in range(n_toots):
+        created_at = NOW - rng.random() * WEEK
+        links = {f"https://example.com/{int(rng.paretovariate(1.2)) % n_links}"}
+        if rng.random() < 0.2:
+            links.add(f"https://example.org/{rng.randrange(n_links)}")
+        toots.append((i, created_at, sorted(links), rng.randint(0, 20)))
+    return toots
+
+
+def rebuild(toots, now, half_life=6 * HOUR):
+    """The scores the index keeps, recomputed in one pass over every toot."""
+    windows = {window: collections.defaultdict(int) for window in (HOUR, DAY, WEEK)}
+    decayed = collections.defaultdict(float)
+    for _, created_at, links, score in toots:
+        weight = 2 ** ((created_at - now) / half_life)
+        for link in links:
+            decayed[link] += score * weight
+        for window, popularity in windows.items():
+            if created_at > now - window:
+                for link in links:
+                    popularity[link] += score
+    return {
+        window: sorted(popularity.items(), key=lambda x: x[1], reverse=True)[:10]
+        for window, popularity in windows.items()
+    }
+
+
+def timed(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def bench(n_toots):
+    rng = random.Random(0)
+    toots = make_toots(n_toots, rng)
+
+    index = PopularityIndex()
+
+    def build():
+        for toot in toots:
+            index.update(*toot)
+        index.advance(NOW)
+
+    build_time, _ = timed(build)
+    rebuild_time, expected = timed(lambda: rebuild(toots, NOW))
+    assert index.top(10, DAY)[-1][1] == expected[DAY][-1][1]
+
+    # An hour later: 1% new toots, and new counts for 1% of the existing ones.
+    n_delta = max(n_toots // 100, 1)
+    new = [
+        (n_toots + i, NOW + rng.random() * HOUR, links, score)
+        for i, (_, _, links, score) in enumerate(rng.sample(toots, n_delta))
+    ]
+    changed = [
+        (toot_id, created_at, links, score + rng.randint(1, 5))
+        for toot_id, created_at, links, score in rng.sample(toots, n_delta)
+    ]
+
+    def hourly():
+        for toot in new + changed:
+            index.update(*toot)
+        index.advance(NOW + HOUR)
+
+    delta_time, _ = timed(hourly)
+
+    print(f"{n_toots:>8} toots, {len(index.decayed)} links")
+    print(f"  {'build index':<28} {build_time * 1000:>10.1f} ms")
+    print(f"  {'rebuild from scratch':<28} {rebuild_time * 1000:>10.1f} ms")
+    print(f"  {'hourly delta':<28} {delta_time * 1000:>10.1f} ms")
+    for name, query in [
+        ("top 10, 1h", lambda: index.top(10, HOUR)),
+        ("top 10, 24h", lambda: index.top(10, DAY)),
+        ("top 10, 7d", lambda: index.top(10, WEEK)),
+        ("top 10, 6h (untracked)", lambda: index.top(10, 6 * HOUR)),
+        ("top 10, decayed", lambda: index.top_decayed(10)),
+    ]:
+        query_time, _ = timed(query, repeat=5)
+        print(f"  {name:<28} {query_time * 1000:>10.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--toots", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    args = parser.parse_args()
+    for n_toots in args.toots:
+        bench(n_toots)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark per-link vs batched summarization against a mock LLM API.
+
+    python bench_summarize.py --links 10 --latency 1.0 --latency-per-page 0.2
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import openai
+
+import get_toots
+import llm
+import mock_llm
+import summary_cache
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--links", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--latency-per-page", type=float, default=0.2)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 5, 10])
+    args = parser.parse_args()
+
+    mock = mock_llm.MockLLM(
+        latency=args.latency, latency_per_page=args.latency_per_page
+    )
+    server, url = mock_llm.serve(mock)
+    openai.api_base = url
+    openai.api_key_path = None
+    openai.api_key = "sk-mock"
+
+    pages = {
+        f"https://example.com/post-{i}": f"<title>Post {i}</title>"
+        f"<body><p>{'Some words about bats. ' * 200}{i}</p></body>"
+        for i in range(args.links)
+    }
+
+    for batch_size in args.batch_sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            summary_cache._summary_cache = summary_cache.SummaryCache(
+                os.path.join(tmp, "summaries.sqlite")
+            )
+            # Hedged requests would be counted twice.
+            llm._llm = llm.LLM(llm.OpenAIBackend(), hedge_percentile=None)
+            requests_before, start = mock.requests, time.time()
+            summarized = get_toots.summarize_links(
+                list(pages), fetch=pages.get, batch_size=batch_size
+            )
+            elapsed = time.time() - start
+            requests = mock.requests - requests_before
+            print(
+                f"batch size {batch_size:>3} {len(summarized):>4} links "
+                f"{requests:>4} requests {len(summarized) / requests:>6.1f} links/request "
+                f"{elapsed:>8.2f} s"
+            )
+            summary_cache._summary_cache.close()
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
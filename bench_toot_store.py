@@ -0,0 +1,174 @@
+"""Peak memory and disk usage of a day of toots: full status objects kept in
+a list and dumped as JSON, against compact records streamed to JSONL.
+
+    python bench_toot_store.py --toots 50000
+
+Each variant runs in its own process so that peak RSS is measured separately.
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+import collections
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+
+import fake_mastodon
+from artifacts import DateTimeEncoder
+from toot_store import TootRecord, write_records
+
+
+def make_status(i, now, rng):
+    """A synthetic status with roughly the size and shape of a real one."""
+    created_at = now - timedelta(seconds=i)
+    toot_id = (int(created_at.timestamp() * 1000) << 16) + i
+    status = fake_mastodon.make_toot(toot_id, created_at, rng)
+    status["created_at"] = created_at
+    status["content"] += "<p>" + "Some thoughts about the paper. " * 10 + "</p>"
+    username = status["account"]["username"]
+    files = f"https://files.fake.social/accounts/{username}"
+    status["account"].update(
+        {
+            "display_name": username.title(),
+            "locked": False,
+            "bot": False,
+            "created_at": now - timedelta(days=300),
+            "url": f"https://fake.social/@{username}",
+            "avatar": f"{files}/avatars/original/avatar.png",
+            "avatar_static": f"{files}/avatars/original/avatar.png",
+            "header": f"{files}/headers/original/header.png",
+            "header_static": f"{files}/headers/original/header.png",
+            "followers_count": rng.randint(0, 5000),
+            "following_count": rng.randint(0, 5000),
+            "statuses_count": rng.randint(0, 5000),
+            "emojis": [],
+            "fields": [
+                {
+                    "name": "Website",
+                    "value": "<a href='https://example.com'>example.com</a>",
+                    "verified_at": None,
+                }
+            ],
+        }
+    )
+    status.update(
+        {
+            "in_reply_to_id": None,
+            "in_reply_to_account_id": None,
+            "sensitive": False,
+            "spoiler_text": "",
+            "language": "en",
+            "replies_count": rng.randint(0, 5),
+            "media_attachments": [
+                {
+                    "id": str(i),
+                    "type": "image",
+                    "url": f"https://files.fake.social/media/{i}.png",
+                    "preview_url": f"https://files.fake.social/media/small/{i}.png",
+                    "meta": {
+                        "original": {"width": 1200, "height": 800},
+                        "small": {"width": 400, "height": 266},
+                    },
+                    "description": "A figure from the paper",
+                    "blurhash": "UBL_:rOpGG-oBUNG,qRj2so|=eE1w^n4S5NH",
+                }
+            ]
+            if rng.random() < 0.3
+            else [],
+            "mentions": [],
+            "tags": [
+                {"name": "neuroscience", "url": "https://fake.social/tags/neuroscience"}
+            ],
+            "emojis": [],
+            "card": None,
+            "application": {"name": "Web", "website": None},
+            "poll": None,
+        }
+    )
+    return status
+
+
+def statuses(n_toots):
+    rng = random.Random(0)
+    now = datetime.now(timezone.utc)
+    return (make_status(i, now, rng) for i in range(n_toots))
+
+
+def top_backlinks(toots, links_of, n_links=10):
+    backlinks = collections.defaultdict(list)
+    for toot in toots:
+        for link in links_of(toot):
+            backlinks[link].append(toot)
+    return sorted(backlinks.items(), key=lambda x: len(x[1]), reverse=True)[:n_links]
+
+
+def run_before(n_toots, directory):
+    toots = list(statuses(n_toots))
+    with open(os.path.join(directory, "toots.json"), "w") as f:
+        json.dump(toots, f, cls=DateTimeEncoder)
+    lotd = [
+        {"url": link, "backlinks": linked}
+        for link, linked in top_backlinks(
+            toots, lambda t: TootRecord.from_status(t).links
+        )
+    ]
+    with open(os.path.join(directory, "lotd.json"), "w") as f:
+        json.dump(lotd, f, cls=DateTimeEncoder)
+
+
+def run_after(n_toots, directory):
+    records = write_records(
+        map(TootRecord.from_status, statuses(n_toots)),
+        os.path.join(directory, "toots.jsonl"),
+        append=False,
+    )
+    lotd = [
+        {
+            "url": link,
+            "backlinks": [record.uri for record in linked],
+            "linked_by": [record.acct for record in linked],
+        }
+        for link, linked in top_backlinks(records, lambda r: r.links)
+    ]
+    with open(os.path.join(directory, "lotd.json"), "w") as f:
+        json.dump(lotd, f)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--toots", type=int, default=50000)
+    parser.add_argument("--variant", choices=["before", "after"])
+    parser.add_argument("--dir")
+    args = parser.parse_args()
+
+    if args.variant:
+        {"before": run_before, "after": run_after}[args.variant](args.toots, args.dir)
+        # ru_maxrss is in kilobytes on Linux.
+        print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        return
+
+    for variant in ["before", "after"]:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = subprocess.run(
+                [sys.executable, __file__, "--toots", str(args.toots)]
+                + ["--variant", variant, "--dir", tmp],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            peak_mb = int(output.split()[-1]) / 1024
+            sizes = {
+                name: os.path.getsize(os.path.join(tmp, name)) / 1e6
+                for name in sorted(os.listdir(tmp))
+            }
+            print(
+                f"{variant:<7} {args.toots} toots  peak RSS {peak_mb:>7.1f} MB  "
+                + "  ".join(f"{name} {size:.1f} MB" for name, size in sizes.items())
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Token-budget truncation against the old regex word counting, on pages
+from a few kilobytes to several megabytes.
+
+    python -m pytest bench_truncation.py
+"""
+import glob
+import re
+
+import pytest
+
+from extract import extract_content
+from truncation import truncate_body
+
+PAGES = {}
+for path in sorted(glob.glob("fixtures/pages/*.html")):
+    with open(path, encoding="utf-8") as f:
+        PAGES[path.split("/")[-1][:-5]] = extract_content(f.read())
+PAGES["large"] = {
+    "description": "",
+    "body": "".join(page["body"] for page in PAGES.values()) * 500,
+}
+PAGES["huge"] = {"description": "", "body": PAGES["large"]["body"] * 10}
+
+
+def truncate_paragraph(paragraph, max_words=1000):
+    """How get_toots truncated page bodies before counting tokens."""
+    words = re.findall(r"\b\w+\b|[<>]", paragraph)
+    words = [x.strip() for x in words if x.strip()]
+    if len(words) > max_words:
+        words = words[:max_words]
+        total_len = sum([len(x) for x in words])
+        total_len += len(words) - 1
+        if total_len < len(paragraph):
+            idx = paragraph[total_len:].find(" ")
+            return paragraph[: (total_len + idx)] + "..."
+    return paragraph
+
+
+@pytest.mark.parametrize("page", PAGES)
+@pytest.mark.benchmark(group="truncate")
+def test_truncate_body(benchmark, page):
+    benchmark(truncate_body, PAGES[page], 1500)
+
+
+@pytest.mark.parametrize("page", PAGES)
+@pytest.mark.benchmark(group="truncate")
+def test_truncate_paragraph(benchmark, page):
+    benchmark(truncate_paragraph, PAGES[page]["body"])
@@ -1,4 +1,4 @@
 #!/bin/bash
 
 # Run the Python script
-/home/pmin/miniconda3/bin/conda run -n gpt python boost_digest.py
\ No newline at end of file
+/home/pmin/miniconda3/bin/conda run -n gpt python lotd.py boost
\ No newline at end of file
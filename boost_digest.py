@@ -1,17 +1,20 @@
-from mastodon import Mastodon
+"""Boost today's digest again, e.g. a few hours after it was posted."""
+import time
+
+import artifacts
+from publisher import Publisher
 import settings
 
 
-if __name__ == "__main__":
+def main():
     with open(".access.secret", "r") as f:
-        access_token = f.read()
+        access_token = f.read().strip()
 
-    mastodon = Mastodon(
-        access_token=access_token,
-        api_base_url=settings.mastodon_url
-    )
+    publisher = Publisher(settings.mastodon_url, access_token)
+    run = artifacts.Run(time.strftime("%Y-%m-%d", time.localtime()))
+    publisher.reblog(run.items("post").get("intro"))
 
-    with open('cache/first_toot_id.txt', 'r') as f:
-        first_toot_id = int(f.read())
 
-    mastodon.status_reblog(first_toot_id)
\ No newline at end of file
+if __name__ == "__main__":
+    settings.load()
+    main()
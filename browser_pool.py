@@ -0,0 +1,172 @@
+"""A fixed pool of long-lived headless Chrome drivers for JavaScript-heavy sites.
+
+Starting Chrome costs seconds, so drivers are reused across pages and always
+quit when the pool is closed. Instead of sleeping after document.readyState,
+a page is considered rendered once a per-domain CSS selector shows up (for
+example the citation meta tags that preprint servers inject with JS).
+"""
+from contextlib import contextmanager
+import logging
+import queue
+import threading
+import time
+from urllib.parse import urlparse
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+logger = logging.getLogger(__name__)
+
+# Hosts that only serve their content through JavaScript, with the selector
+# that signals the content is there.
+JS_RENDERED_HOSTS = {
+    # Dreaded javacript nonsense from psyarxiv and elsevier
+    "psyarxiv.com": "meta[name='citation_title']",
+    "osf.io": "meta[name='citation_title']",
+    "linkinghub.elsevier.com": "meta[name='citation_title'], #abstracts",
+}
+
+
+def js_wait_selector(url):
+    """The selector to wait for if url needs JS rendering, otherwise None."""
+    host = urlparse(url).netloc.lower().split(":")[0]
+    for domain, selector in JS_RENDERED_HOSTS.items():
+        if host == domain or host.endswith("." + domain):
+            return selector
+    return None
+
+
+def make_chrome_driver():
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    return webdriver.Chrome(options=chrome_options)
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        size=2,
+        timeout=10,
+        driver_factory=make_chrome_driver,
+        page_load_timeout=30,
+        checkout_timeout=120,
+    ):
+        self.size = size
+        self.timeout = timeout
+        self.driver_factory = driver_factory
+        self.page_load_timeout = page_load_timeout
+        self.checkout_timeout = checkout_timeout
+        self._idle = queue.Queue()
+        self._drivers = []
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.render_time = 0.0
+
+    @contextmanager
+    def driver(self):
+        """Check out a driver, start one if the pool isn't full yet. Raises
+        TimeoutException when none is free within checkout_timeout.
+
+        A driver that raised anything (a WebDriverException, chromedriver gone,
+        an interrupt) is quit and replaced, so its slot is never lost.
+        """
+        driver = self._checkout()
+        try:
+            yield driver
+        except BaseException:
+            self._discard(driver)
+            raise
+        else:
+            self._idle.put(driver)
+
+    def render(self, url, wait_selector=None):
+        """outerHTML of url once it's loaded and wait_selector (if any) is present."""
+        start = time.time()
+        with self.driver() as driver:
+            try:
+                driver.get(url)
+            except TimeoutException:
+                # Past page_load_timeout: use what has loaded.
+                logger.info("Timed out loading page")
+            try:
+                WebDriverWait(driver, self.timeout).until(
+                    lambda d: d.execute_script("return document.readyState")
+                    == "complete"
+                    and (
+                        wait_selector is None
+                        or d.find_elements(By.CSS_SELECTOR, wait_selector)
+                    )
+                )
+                logger.info("Webpage loaded through Selenium successfully")
+            except TimeoutException:
+                logger.info("Timed out waiting for page to load")
+            html = driver.execute_script(
+                "return document.documentElement.outerHTML"
+            )
+        with self._lock:
+            self.renders += 1
+            self.render_time += time.time() - start
+        return html
+
+    def stats(self):
+        return {
+            "renders": self.renders,
+            "drivers": len(self._drivers),
+            "mean_render_latency": self.render_time / self.renders
+            if self.renders
+            else None,
+        }
+
+    def close(self):
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+            while not self._idle.empty():
+                self._idle.get_nowait()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                if len(self._drivers) < self.size:
+                    driver = self.driver_factory()
+                    driver.set_page_load_timeout(self.page_load_timeout)
+                    self._drivers.append(driver)
+                    return driver
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise TimeoutException(
+                    f"No browser free after {self.checkout_timeout} s"
+                )
+            try:
+                return self._idle.get(timeout=min(left, 1))
+            except queue.Empty:
+                # A driver may have been discarded meanwhile, freeing a slot.
+                continue
+
+    def _discard(self, driver):
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            # chromedriver may be gone already.
+            pass
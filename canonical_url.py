@@ -0,0 +1,109 @@
+"""Canonical URLs, so that different spellings of a link count as one.
+
+canonicalize() normalizes the scheme, host (lowercase, no www., no default
+port), trailing slashes, fragments and tracking query parameters, and maps
+known mirrors (arXiv abs/pdf/html, bioRxiv/medRxiv versions) onto one page.
+Grouping is then a dict lookup per link instead of a substring test against
+every other link.
+
+The canonical form is a grouping key, not always a URL that works (http-only
+sites, hosts that are only served with their www.): representative() picks
+the link of a group to fetch and show.
+"""
+import collections
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+TRACKING_PARAMS = {
+    "fbclid",
+    "gclid",
+    "dclid",
+    "msclkid",
+    "mc_cid",
+    "mc_eid",
+    "igshid",
+    "ref_src",
+    "cmpid",
+    "sc_cid",
+}
+
+ARXIV_HOSTS = {"arxiv.org", "export.arxiv.org"}
+ARXIV_PATH = re.compile(r"^/(?:abs|pdf|html|format)/(.+?)(?:v\d+)?(?:\.pdf)?$")
+
+RXIV_HOSTS = {"biorxiv.org", "medrxiv.org"}
+RXIV_PATH = re.compile(
+    r"^/content/(10\.1101/[\d.]+?)(?:v\d+)?(?:\.full|\.abstract|\.full\.pdf|\.full-text|\.supplementary-material)?$"
+)
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name.startswith("utm_") or name in TRACKING_PARAMS
+
+
+def canonicalize(url):
+    """Canonical form of url. Anything that isn't http(s) is returned as is."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https"):
+        return url
+
+    host = (parts.hostname or "").rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = re.sub(r"/{2,}", "/", parts.path).rstrip("/")
+    query = urlencode(
+        sorted(
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not is_tracking_param(key)
+        )
+    )
+
+    if host in ARXIV_HOSTS:
+        match = ARXIV_PATH.match(path)
+        if match:
+            host, path, query = "arxiv.org", f"/abs/{match.group(1)}", ""
+    elif host in RXIV_HOSTS:
+        match = RXIV_PATH.match(path)
+        if match:
+            path, query = f"/content/{match.group(1)}", ""
+
+    return urlunsplit(("https", host, path, query, ""))
+
+
+def strip_tracking(url):
+    """url without its tracking parameters and fragment, otherwise as spelled."""
+    parts = urlsplit(url.strip())
+    if parts.scheme.lower() not in ("http", "https"):
+        return url
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    query = parts.query
+    if any(is_tracking_param(key) for key, _ in params):
+        query = urlencode(
+            [(key, value) for key, value in params if not is_tracking_param(key)]
+        )
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ""))
+
+
+def representative(canonical, links):
+    """The link to fetch and show for links of the same canonical form: their
+    most common spelling, without tracking parameters. Papers on arXiv and
+    bioRxiv/medRxiv get their canonical URL, the abstract page, instead of a
+    PDF or an old version."""
+    host = urlsplit(canonical).hostname
+    if not links or host in ARXIV_HOSTS or host in RXIV_HOSTS:
+        return canonical
+    spellings = collections.Counter(strip_tracking(link) for link in links)
+    return spellings.most_common(1)[0][0]
+
+
+def group_links(links):
+    """Map each canonical URL to the list of links that canonicalize to it."""
+    groups = collections.defaultdict(list)
+    for link in links:
+        groups[canonicalize(link)].append(link)
+    return groups
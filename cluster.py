@@ -0,0 +1,179 @@
+"""Grouping the candidate links of the day that are the same story, before they
+are summarized, so that each story takes one slot and one LLM call.
+
+Two pages are the same story when they share an identifier (a DOI or arXiv id,
+from their URL or their <meta> tags: a preprint and its journal version) or
+when their text is nearly the same (syndicated news): the Jaccard similarity
+of their word shingles, estimated from MinHash signatures, is at least
+`threshold`. Pairs to compare come from locality-sensitive hashing of the
+signatures (banding), so the cost grows linearly with the number of pages
+rather than with the number of pairs.
+
+    groups = cluster.cluster(pages)  # [[0, 3], [1], [2], ...]
+    link = cluster.merge([scored[i] for i in groups[0]])
+"""
+from collections import defaultdict
+import hashlib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Words per shingle. Long enough that pages on the same topic don't match
+# unless they share whole sentences.
+SHINGLE_WORDS = 5
+# MinHash signature length, split into bands for LSH. With 4 rows per band,
+# pages at 0.5 similarity are compared with probability ~0.9.
+N_BINS = 128
+BANDS = 32
+# Pages with less text than this are only matched by their identifiers.
+MIN_SHINGLES = 20
+
+TAG_RE = re.compile(r"<[^>]+>")
+WORD_RE = re.compile(r"\w+")
+DOI_PREFIX_RE = re.compile(r"^(?:doi:\s*|https?://(?:dx\.)?doi\.org/)")
+ARXIV_DOI_RE = re.compile(r"^10\.48550/arxiv\.(.+)$")
+ARXIV_URL_RE = re.compile(r"^https://(?:www\.)?arxiv\.org/abs/(.+)$")
+DOI_URL_RE = re.compile(
+    r"^https://(?:(?:www\.)?(?:bio|med)rxiv\.org/content/|doi\.org/)(10\..+)$"
+)
+VERSION_RE = re.compile(r"v\d+$")
+
+
+def cluster(pages, threshold=0.5):
+    """Groups of indices of pages that are the same story. Each group is in
+    the order of pages, and groups are in the order of their first page."""
+    parent = list(range(len(pages)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        i, j = find(i), find(j)
+        if i != j:
+            parent[max(i, j)] = min(i, j)
+
+    first_with = {}
+    signatures = []
+    buckets = defaultdict(list)
+    rows = N_BINS // BANDS
+    for i, page in enumerate(pages):
+        for identifier in identifiers(page):
+            if identifier in first_with:
+                union(first_with[identifier], i)
+            else:
+                first_with[identifier] = i
+
+        page_shingles = shingles(page_text(page))
+        signature = None
+        if len(page_shingles) >= MIN_SHINGLES:
+            signature = minhash(page_shingles)
+        signatures.append(signature)
+        if signature is None:
+            continue
+        for band in range(BANDS):
+            key = (band, tuple(signature[band * rows : (band + 1) * rows]))
+            for j in buckets[key]:
+                if find(i) == find(j):
+                    continue
+                if similarity(signature, signatures[j]) >= threshold:
+                    union(i, j)
+            buckets[key].append(i)
+
+    groups = defaultdict(list)
+    for i in range(len(pages)):
+        groups[find(i)].append(i)
+    return list(groups.values())
+
+
+def merge(links):
+    """One link for a group of scored links, most popular first: the url of
+    the first, the backlinks of all, and the sum of their popularity (a toot
+    linking to two of them counts for both)."""
+    toots = {}
+    for link in links:
+        for backlink, acct in zip(link["backlinks"], link["linked_by"]):
+            toots.setdefault(backlink, acct)
+    return {
+        **links[0],
+        "backlinks": list(toots),
+        "linked_by": list(toots.values()),
+        "popularity": sum(link["popularity"] for link in links),
+        "cluster": [link["url"] for link in links],
+    }
+
+
+def identifiers(page):
+    """The DOIs and arXiv ids of a page, as "doi:..." and "arxiv:..."."""
+    found = set()
+    match = ARXIV_URL_RE.match(page["url"])
+    if match:
+        found.add("arxiv:" + VERSION_RE.sub("", match.group(1)))
+    match = DOI_URL_RE.match(page["url"])
+    if match:
+        found.add(normalize_doi(match.group(1)))
+    for key, value in page.get("identifiers", {}).items():
+        if key == "citation_arxiv_id":
+            found.add("arxiv:" + VERSION_RE.sub("", value.strip().lower()))
+        else:
+            found.add(normalize_doi(value))
+    found.discard(None)
+    return found
+
+
+def normalize_doi(value):
+    doi = DOI_PREFIX_RE.sub("", value.strip().lower())
+    if not doi.startswith("10."):
+        return None
+    # arXiv DOIs name the preprint, whatever page they are on.
+    match = ARXIV_DOI_RE.match(doi)
+    if match:
+        return "arxiv:" + VERSION_RE.sub("", match.group(1))
+    return "doi:" + doi
+
+
+def page_text(page):
+    body = TAG_RE.sub(" ", page["body"])
+    return " ".join([page.get("title", ""), page.get("description", ""), body])
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    words = WORD_RE.findall(text.lower())
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(shingles, n_bins=N_BINS):
+    """One-permutation MinHash: every shingle is hashed once, into the bin
+    given by its hash, and each bin keeps its smallest hash. Empty bins take
+    the value of the next non-empty one (and how far it is), so that the
+    signatures of short texts still compare."""
+    bins = [None] * n_bins
+    for shingle in shingles:
+        h = int.from_bytes(
+            hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big"
+        )
+        i, value = h % n_bins, h // n_bins
+        if bins[i] is None or value < bins[i]:
+            bins[i] = value
+    if all(value is None for value in bins):
+        return None
+
+    signature = [None] * n_bins
+    nearest, distance = None, 0
+    for step in range(2 * n_bins - 1, -1, -1):
+        i = step % n_bins
+        if bins[i] is not None:
+            nearest, distance = bins[i], 0
+        else:
+            distance += 1
+        if step < n_bins:
+            signature[i] = (nearest, distance)
+    return signature
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of the shingles behind two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
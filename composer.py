@@ -0,0 +1,230 @@
+"""Rendering the digest thread from templates parsed once, with HTML escaping
+and the instance's character limit.
+
+    composer = Composer(get_max_characters(publisher))
+    composed = composer.digest(lotd, global_summary, date_str)
+
+A link's toot that would go past the limit gets its summary cut at a word, and
+the rest of the summary is posted as continuation replies.
+"""
+import html
+import json
+import logging
+import os
+import re
+import string
+import time
+
+logger = logging.getLogger(__name__)
+
+# Mastodon counts every URL as this many characters, whatever its length.
+URL_LENGTH = 23
+URL_RE = re.compile(r"https?://[^\s<>'\"]+")
+DEFAULT_MAX_CHARACTERS = 500
+ELLIPSIS = "…"
+
+
+class Markup(str):
+    """HTML that is inserted in a template as is, not escaped."""
+
+
+class Template:
+    """A str.format-style template, parsed once. Values are HTML-escaped
+    unless they are Markup.
+
+    The length of the literal parts is also measured once, so the length of a
+    toot is known from the lengths of its values without rendering it. (A URL
+    in a value always ends where the value does: the literals around values
+    start with a quote, a tag or a space.)
+    """
+
+    def __init__(self, source):
+        self.parts = [
+            (literal, field)
+            for literal, field, _, _ in string.Formatter().parse(source)
+        ]
+        self.fields = [field for _, field in self.parts if field is not None]
+        self.literal_length = sum(toot_length(literal) for literal, _ in self.parts)
+
+    def render(self, **values):
+        return self.render_escaped({k: escape(v) for k, v in values.items()})
+
+    def render_escaped(self, values):
+        out = []
+        for literal, field in self.parts:
+            out.append(literal)
+            if field is not None:
+                out.append(values[field])
+        return "".join(out)
+
+
+def escape(value):
+    if isinstance(value, Markup):
+        return value
+    return html.escape(str(value))
+
+
+def toot_length(text):
+    """The length of a toot as the instance counts it."""
+    length = len(text)
+    if "http" not in text:
+        return length
+    for url in URL_RE.findall(text):
+        length += URL_LENGTH - len(url)
+    return length
+
+
+INTRO = Template(
+    "<h1>🎉 Today's most popular links</h1><h2>{summary}</h2><p>{date} edition</p>"
+)
+# When the summary of summaries failed.
+INTRO_WITHOUT_SUMMARY = Template(
+    "<h1>🎉 Today's most popular links</h1><p>{date} edition</p>"
+)
+LINK = Template(
+    """
+<h1><a href='{url}'>{title} - {website}</a></h1>
+<h2>TL;DR {tldr}</h2>
+<p>Linked by {accounts} ({popularity}⭐)</p>
+<p>{summary}</p>
+<p>{tags}</p>
+<p>Original link: <a href='{backlink}'>{backlink}</a></p>
+"""
+)
+CONTINUATION = Template("<p>{summary}</p>")
+
+
+class Composer:
+    def __init__(self, max_characters=DEFAULT_MAX_CHARACTERS):
+        self.max_characters = max_characters
+
+    def digest(self, lotd, summary, date_str):
+        """The digest toot and, for each link, its toot and continuations."""
+        return {
+            "intro": self.intro(summary, date_str),
+            "replies": [self.link(link) for link in lotd],
+        }
+
+    def intro(self, summary, date_str):
+        if not summary:
+            return INTRO_WITHOUT_SUMMARY.render(date=date_str)
+        toot, _ = self._fit(INTRO, {"summary": summary, "date": date_str}, "summary")
+        return toot
+
+    def link(self, link):
+        """The toots of a link: the first one, then the rest of its summary."""
+        values = {
+            "url": link["url"],
+            "title": link["title"],
+            "website": link["website"],
+            "tldr": link["tldr"],
+            "accounts": format_accounts(link["linked_by"]),
+            "popularity": link["popularity"],
+            "summary": link["summary"],
+            "tags": " ".join(link_tags(link)),
+            "backlink": link["backlinks"][0],
+        }
+        toot, rest = self._fit(LINK, values, "summary")
+        toots = [toot]
+        while rest:
+            toot, rest = self._fit(CONTINUATION, {"summary": rest}, "summary")
+            if toot is None:
+                break
+            toots.append(toot)
+        return toots
+
+    def _fit(self, template, values, field):
+        """(the toot, with as much of values[field] as fits, and the rest of
+        values[field]). The toot is None when none of it fits."""
+        escaped = {k: escape(v) for k, v in values.items()}
+        budget = self.max_characters - template.literal_length
+        for name in template.fields:
+            if name != field:
+                budget -= toot_length(escaped[name])
+        head, rest = self._split(str(values[field]), escaped[field], budget)
+        if head is None:
+            return None, rest
+        escaped[field] = head
+        return template.render_escaped(escaped), rest
+
+    def _split(self, text, escaped, budget):
+        """(escaped head of text within budget, unescaped rest)."""
+        if toot_length(escaped) <= budget:
+            return escaped, ""
+
+        budget -= len(ELLIPSIS)
+        if "http" not in escaped:
+            # Every character counts as one, and escaping leaves the spaces
+            # where they are: cut the escaped text at the last space that fits.
+            cut = escaped.rfind(" ", 0, budget + 1)
+            if cut > 0:
+                n = escaped.count(" ", 0, cut) + 1
+                return escaped[:cut] + ELLIPSIS, text.split(" ", n)[n]
+        else:
+            words = text.split(" ")
+            used = 0
+            for i, word in enumerate(words):
+                used += toot_length(escape(word)) + (i > 0)
+                if used > budget:
+                    break
+            if i > 0:
+                return escape(" ".join(words[:i])) + ELLIPSIS, " ".join(words[i:])
+
+        if budget <= 0:
+            logger.warning("Toot too long for any of its text")
+            return None, text
+        # A single word longer than the budget is cut anywhere.
+        n = budget
+        while n > 0 and toot_length(escape(text[:n])) > budget:
+            n -= 1
+        return escape(text[:n]) + ELLIPSIS, text[n:]
+
+
+def format_accounts(accts):
+    accounts = ["@" + acct for acct in accts]
+    if not accounts:
+        return "no one"
+    if len(accounts) == 1:
+        return accounts[0]
+    elif len(accounts) > 3:
+        return ", ".join(accounts[:3]) + f" and {len(accounts) - 3} others"
+    return ", ".join(accounts[:-1]) + f" and {accounts[-1]}"
+
+
+def link_tags(link):
+    tags = ["#lotd"]
+    if link["is_scientific_article"]:
+        tags.append("#science")
+    if link["is_news"]:
+        tags.append("#news")
+    return tags
+
+
+def get_max_characters(publisher, cache_path="cache/instance.json", max_age=86400):
+    """The character limit of the publisher's instance, read from
+    /api/v1/instance at most once every max_age seconds."""
+    try:
+        with open(cache_path, "r") as f:
+            cached = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        cached = {}
+    entry = cached.get(publisher.api_base_url)
+    if entry is not None and time.time() - entry["fetched_at"] < max_age:
+        return entry["max_characters"]
+
+    instance = publisher.instance()
+    max_characters = (
+        instance.get("configuration", {}).get("statuses", {}).get("max_characters")
+        # Glitch and Pleroma
+        or instance.get("max_toot_chars")
+        or DEFAULT_MAX_CHARACTERS
+    )
+    cached[publisher.api_base_url] = {
+        "max_characters": max_characters,
+        "fetched_at": time.time(),
+    }
+    with open(cache_path + ".tmp", "w") as f:
+        json.dump(cached, f)
+    os.replace(cache_path + ".tmp", cache_path)
+    logger.info(f"{publisher.api_base_url} allows {max_characters} characters")
+    return max_characters
@@ -0,0 +1,160 @@
+"""DOI resolution with an on-disk cache.
+
+Two people can link to the same paper through doi.org and through the
+publisher, so DOI links are resolved to their landing page before counting.
+Resolutions are stored in SQLite with a TTL; failures are cached too (for a
+shorter time) so a dead DOI is not retried on every toot of every run.
+Lookups can go through a hosts.HostScheduler; those it skips are not cached.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import sqlite3
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from hosts import HOST_FAILURE_STATUSES, HostUnavailable
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+# A lookup that was not made.
+SKIPPED = object()
+
+
+def is_doi_link(url):
+    return "doi.org" in urlparse(url).netloc
+
+
+class DoiResolver:
+    def __init__(
+        self,
+        path="cache/doi.sqlite",
+        ttl=30 * DAY,
+        negative_ttl=DAY,
+        max_workers=8,
+        timeout=(5, 20),
+        doi_base_url="https://doi.org",
+        scheduler=None,
+    ):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS doi "
+            "(doi TEXT PRIMARY KEY, url TEXT, resolved_at REAL)"
+        )
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.doi_base_url = doi_base_url.rstrip("/")
+        self.scheduler = scheduler
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def resolve(self, url):
+        return self.resolve_many([url])[url]
+
+    def resolve_many(self, urls):
+        """Map every url to its resolved url; non-DOI urls map to themselves.
+
+        Each distinct DOI is looked up once, first in the cache, then over the
+        network in parallel.
+        """
+        resolved = {url: url for url in urls}
+        dois = {}
+        for url in resolved:
+            if is_doi_link(url):
+                dois.setdefault(self._doi(url), []).append(url)
+
+        to_fetch = []
+        now = time.time()
+        for doi in dois:
+            row = self.db.execute(
+                "SELECT url, resolved_at FROM doi WHERE doi = ?", (doi,)
+            ).fetchone()
+            ttl = self.ttl if row and row[0] else self.negative_ttl
+            if row and now - row[1] < ttl:
+                self.hits += 1
+                for url in dois[doi]:
+                    resolved[url] = row[0] or url
+            else:
+                self.misses += 1
+                to_fetch.append(doi)
+
+        if to_fetch:
+            with ThreadPoolExecutor(self.max_workers) as pool:
+                results = list(pool.map(self._scheduled_fetch, to_fetch))
+            self.failures += sum(result is None for result in results)
+            with self.db:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO doi VALUES (?, ?, ?)",
+                    [
+                        (doi, url, now)
+                        for doi, url in zip(to_fetch, results)
+                        if url is not SKIPPED
+                    ],
+                )
+            for doi, landing_url in zip(to_fetch, results):
+                for url in dois[doi]:
+                    if landing_url is not SKIPPED:
+                        resolved[url] = landing_url or url
+
+        return resolved
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "failures": self.failures}
+
+    def close(self):
+        self.session.close()
+        self.db.close()
+
+    def _doi(self, url):
+        return urlparse(url).path.lstrip("/").lower()
+
+    def _scheduled_fetch(self, doi):
+        if self.scheduler is None:
+            return self._fetch(doi)
+        try:
+            with self.scheduler.slot(f"{self.doi_base_url}/{doi}"):
+                return self._fetch(doi)
+        except HostUnavailable as e:
+            logger.info(f"Not resolving DOI {doi}: {e}")
+            return SKIPPED
+
+    def _fetch(self, doi):
+        """Landing page of a DOI, or None when it can't be resolved."""
+        url = f"{self.doi_base_url}/{doi}"
+        start = time.time()
+        host_ok = True
+        landing_url = None
+        try:
+            response = self.session.get(
+                url, headers={"Accept": "application/json"}, timeout=self.timeout
+            )
+            host_ok = response.status_code not in HOST_FAILURE_STATUSES
+            if response.status_code == 200:
+                r = response.json()
+                for link in r.get("link", []):
+                    if link.get("content-type") == "text/html":
+                        landing_url = link["URL"]
+                        break
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Failed to resolve DOI {doi}: {e}")
+            host_ok = False
+        except ValueError as e:
+            logger.warning(f"Failed to resolve DOI {doi}: {e}")
+        if self.scheduler is not None:
+            self.scheduler.record(url, host_ok, time.time() - start)
+        return landing_url
@@ -0,0 +1,264 @@
+"""HTML cleanup for webpages and link extraction for toots.
+
+extract_content() cleans a page while it is being tokenized, without building
+a parse tree: non-content tags, comments and noisy attributes are dropped,
+text is normalized and divs are unwrapped as the tags close, in a single pass.
+It reuses Beautiful Soup's html.parser tokenizer and mirrors its tree-building
+rules (implicit closes, void elements, whitespace handling), so the output is
+identical to the old multi-pass cleanup on the parsed tree. The saved pages in
+fixtures/pages hold the expected outputs. The page's meta description (or
+citation abstract) and its DOI or arXiv id meta tags are picked up on the way.
+"""
+from collections import Counter
+from html import unescape
+import re
+
+from bs4.builder import HTMLParserTreeBuilder
+from bs4.builder._htmlparser import BeautifulSoupHTMLParser
+from bs4.dammit import EntitySubstitution
+from bs4.element import CData, Comment
+
+REMOVED_TAGS = {
+    "link",
+    "style",
+    "script",
+    "noscript",
+    "iframe",
+    "img",
+    "picture",
+    "svg",
+    "math",  # MathJax
+    "form",
+    "input",
+    "header",
+    "footer",
+    "nav",
+    "ul",  # Often used for navigation
+    "ol",
+}
+
+REMOVED_ATTRS = {"class", "style", "onclick", "id"}
+
+HREF_RE = re.compile(
+    r"""<a\s(?:[^>]*?\s)?href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE
+)
+
+# <meta> tags holding a summary of the page, by decreasing preference.
+DESCRIPTION_META = ("citation_abstract", "og:description", "description")
+# <meta> tags identifying a paper, whatever the site it is on.
+IDENTIFIER_META = ("citation_doi", "citation_arxiv_id", "dc.identifier", "prism.doi")
+
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+NONWHITESPACE_RE = re.compile(r"\S+")
+
+
+def extract_links(html_string):
+    """hrefs of the <a> tags of a toot, in order.
+
+    Toot HTML is sanitized by the server, so a regex scan is enough and avoids
+    building a parse tree for every toot.
+    """
+    return [unescape(a or b or c) for a, b, c in HREF_RE.findall(html_string)]
+
+
+def extract_content(html):
+    cleaner = ContentCleaner()
+    parser = BeautifulSoupHTMLParser(convert_charrefs=False)
+    parser.soup = cleaner
+    parser.feed(html)
+    parser.close()
+    cleaner.close()
+
+    content_tag = cleaner.main or cleaner.body
+    webpage_data = {
+        "title": "".join(cleaner.title_parts).strip(),
+        "description": cleaner.description(),
+        "identifiers": cleaner.identifiers,
+        "body": content_tag[1] if content_tag else "",
+    }
+
+    return webpage_data
+
+
+class Element:
+    __slots__ = (
+        "name",
+        "attrs",
+        "index",
+        "parts",
+        "has_contents",
+        "dropped",
+        "is_empty_element",
+    )
+
+    def __init__(self, name, attrs, index, dropped):
+        self.name = name
+        self.index = index
+        self.attrs = attrs
+        self.parts = []
+        self.has_contents = False
+        self.dropped = dropped
+        self.is_empty_element = False
+
+
+class ContentCleaner:
+    """Receives the tree-building calls BeautifulSoup would, and renders the
+    cleaned <main> and <body> contents as elements close.
+
+    Each element keeps a list of parts: rendered child tags and Text nodes.
+
+    A tag is empty (and dropped) when it has no children once non-content tags
+    and comments are removed; children that are themselves empty still count.
+    """
+
+    builder = HTMLParserTreeBuilder
+    original_encoding = None
+
+    def __init__(self):
+        self.root = Element("[document]", {}, 0, False)
+        self.stack = [self.root]
+        self.open_tag_counter = Counter()
+        self.current_data = []
+        self.preserve_whitespace_depth = 0
+        self.string_containers = []
+        self.n_tags = 0
+        self.title = None
+        self.in_title = False
+        self.title_parts = []
+        self.meta_descriptions = {}
+        self.identifiers = {}
+        # First <main> and <body> in document order: (index, rendered contents)
+        self.main = None
+        self.body = None
+
+    def handle_starttag(self, name, namespace, nsprefix, attrs, **kwargs):
+        self.endData()
+        parent = self.stack[-1]
+        dropped = parent.dropped or name in REMOVED_TAGS
+        if not dropped:
+            parent.has_contents = True
+        self.n_tags += 1
+        tag = Element(name, attrs, self.n_tags, dropped)
+        tag.is_empty_element = name in self.builder.empty_element_tags
+
+        if name == "meta":
+            key = (attrs.get("name") or attrs.get("property") or "").lower()
+            if key in DESCRIPTION_META and attrs.get("content"):
+                self.meta_descriptions.setdefault(key, attrs["content"].strip())
+            elif key in IDENTIFIER_META and attrs.get("content"):
+                self.identifiers.setdefault(key, attrs["content"].strip())
+        if name == "title" and self.title is None:
+            self.title = tag
+            self.in_title = True
+        if name in self.builder.DEFAULT_PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace_depth += 1
+        if name in self.builder.DEFAULT_STRING_CONTAINERS:
+            self.string_containers.append(name)
+        self.stack.append(tag)
+        self.open_tag_counter[name] += 1
+        return tag
+
+    def handle_endtag(self, name, nsprefix=None):
+        self.endData()
+        if not self.open_tag_counter[name]:
+            return
+        while len(self.stack) > 1:
+            if self.pop_tag().name == name:
+                break
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    def endData(self, containerClass=None):
+        if not self.current_data:
+            return
+        data = "".join(self.current_data)
+        self.current_data = []
+        if not self.preserve_whitespace_depth and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+
+        if containerClass is Comment:
+            return
+
+        parent = self.stack[-1]
+        if self.in_title:
+            # Title text only counts plain strings and CDATA.
+            if containerClass in (None, CData) and not (
+                containerClass is None and self.string_containers
+            ):
+                self.title_parts.append(data)
+
+        if parent.dropped:
+            return
+        parent.has_contents = True
+        parent.parts.append(Text(" ".join(data.split())))
+
+    def pop_tag(self):
+        tag = self.stack.pop()
+        self.open_tag_counter[tag.name] -= 1
+        if tag.name in self.builder.DEFAULT_PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace_depth -= 1
+        if tag.name in self.builder.DEFAULT_STRING_CONTAINERS:
+            self.string_containers.pop()
+        if tag is self.title:
+            self.in_title = False
+        if tag.dropped or not tag.has_contents:
+            return tag
+
+        if tag.name == "main" and (self.main is None or tag.index < self.main[0]):
+            self.main = (tag.index, render_contents(tag.parts, escape=False))
+        elif tag.name == "body" and (self.body is None or tag.index < self.body[0]):
+            self.body = (tag.index, render_contents(tag.parts, escape=False))
+
+        if tag.name == "div":
+            # Unwrap deeply nested tags
+            self.stack[-1].parts.extend(tag.parts)
+        else:
+            self.stack[-1].parts.append(
+                f"<{tag.name}{render_attrs(tag.name, tag.attrs)}>"
+                f"{render_contents(tag.parts)}</{tag.name}>"
+            )
+        return tag
+
+    def description(self):
+        for key in DESCRIPTION_META:
+            if self.meta_descriptions.get(key):
+                return self.meta_descriptions[key]
+        return ""
+
+    def close(self):
+        self.endData()
+        while len(self.stack) > 1:
+            self.pop_tag()
+
+
+class Text(str):
+    """A text node; rendered markup parts are plain str."""
+
+
+def render_contents(parts, escape=True):
+    """Like BeautifulSoup, text is escaped inside a rendered tag, but the
+    direct string children of <main>/<body> are output as is."""
+    if not escape:
+        return "".join(parts)
+    return "".join(
+        EntitySubstitution.substitute_xml(part) if type(part) is Text else part
+        for part in parts
+    )
+
+
+def render_attrs(name, attrs):
+    list_attrs = HTMLParserTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+    rendered = []
+    for attr, value in sorted(attrs.items()):
+        if (
+            attr in REMOVED_ATTRS
+            or attr.startswith("data-")
+            or attr.startswith("aria-")
+        ):
+            continue
+        if attr in list_attrs["*"] or attr in list_attrs.get(name, ()):
+            value = " ".join(NONWHITESPACE_RE.findall(value))
+        value = EntitySubstitution.substitute_xml(value)
+        rendered.append(f" {attr}={EntitySubstitution.quoted_attribute_value(value)}")
+    return "".join(rendered)
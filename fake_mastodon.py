@@ -0,0 +1,286 @@
+"""A tiny stand-in for the Mastodon API, used by tests and benchmarks.
+
+Serves a synthetic timeline with Mastodon-style id pagination
+(max_id / since_id / min_id) and X-RateLimit-* headers, as the local, public,
+hashtag and list timelines, and accepts posted statuses. Start several to
+stand in for a federation.
+"""
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+LINK_POOL = [
+    "https://arxiv.org/abs/2304.{:05d}",
+    "https://www.biorxiv.org/content/10.1101/2023.04.{:02d}.535000v1",
+    "https://www.nature.com/articles/s41586-023-{:05d}-2",
+    "https://www.nytimes.com/2023/04/{:02d}/science/story.html",
+    "https://example.com/blog/post-{}",
+]
+
+
+def make_toot(toot_id, created_at, rng, host="fake.social"):
+    links = [
+        rng.choice(LINK_POOL).format(rng.randint(1, 28))
+        for _ in range(rng.randint(0, 2))
+    ]
+    content = "<p>Look at this"
+    for link in links:
+        content += f' <a href="{link}" rel="nofollow">{link}</a>'
+    content += "</p>"
+    username = f"user{rng.randint(0, 500)}"
+    tags = ["preprint"] if any("rxiv" in link for link in links) else []
+    return {
+        "id": str(toot_id),
+        "uri": f"https://{host}/users/{username}/statuses/{toot_id}",
+        "url": f"https://{host}/@{username}/{toot_id}",
+        "created_at": created_at.isoformat().replace("+00:00", "Z"),
+        "content": content,
+        "visibility": rng.choice(["public"] * 9 + ["unlisted"]),
+        "favourites_count": rng.randint(0, 20),
+        "reblogs_count": rng.randint(0, 5),
+        "account": {
+            "id": str(rng.randint(1, 500)),
+            "username": username,
+            "acct": username,
+            "note": "#nobot" if rng.random() < 0.05 else "<p>Scientist</p>",
+        },
+        "tags": [{"name": tag, "url": f"https://{host}/tags/{tag}"} for tag in tags],
+    }
+
+
+def make_timeline(n_toots, hours=36, seed=0, host="fake.social", now=None):
+    """n_toots spread evenly over the `hours` before now, newest first."""
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    toots = []
+    for i in range(n_toots):
+        created_at = now - timedelta(hours=hours) * (i / max(n_toots, 1))
+        toot_id = (int(created_at.timestamp() * 1000) << 16) + (i & 0xFFFF)
+        toots.append(make_toot(toot_id, created_at, rng, host=host))
+    return toots
+
+
+class FakeMastodon:
+    """Owns the timeline state and the rate-limit budget of one fake instance."""
+
+    def __init__(
+        self,
+        toots=None,
+        ratelimit_limit=300,
+        ratelimit_period=300,
+        latency=0.0,
+        lists=None,
+        max_characters=500,
+    ):
+        self.toots = toots if toots is not None else []
+        # list id -> usernames of the accounts in the list
+        self.lists = lists or {}
+        self.max_characters = max_characters
+        self.ratelimit_limit = ratelimit_limit
+        self.ratelimit_period = ratelimit_period
+        self.latency = latency
+        self.requests = 0
+        self.posted = []
+        self.reblogged = []
+        self.idempotency_keys = {}
+        # The next this many posts fail with a 503.
+        self.failures = 0
+        self.lock = threading.Lock()
+        self._window_start = time.time()
+        self._window_used = 0
+
+    def add_toots(self, toots):
+        with self.lock:
+            self.toots = sorted(
+                toots + self.toots, key=lambda x: int(x["id"]), reverse=True
+            )
+
+    def take_budget(self):
+        with self.lock:
+            self.requests += 1
+            now = time.time()
+            if now - self._window_start >= self.ratelimit_period:
+                self._window_start = now
+                self._window_used = 0
+            self._window_used += 1
+            remaining = self.ratelimit_limit - self._window_used
+            reset = self._window_start + self.ratelimit_period
+            return remaining, reset
+
+    def post(self, params, idempotency_key=None):
+        with self.lock:
+            if idempotency_key in self.idempotency_keys:
+                return self.idempotency_keys[idempotency_key]
+            toot_id = (int(time.time() * 1000) << 16) + len(self.posted)
+            status = {
+                "id": str(toot_id),
+                "uri": f"https://fake.social/users/bot/statuses/{toot_id}",
+                "url": f"https://fake.social/@bot/{toot_id}",
+                "created_at": datetime.now(timezone.utc)
+                .isoformat()
+                .replace("+00:00", "Z"),
+                "content": params.get("status", ""),
+                "visibility": params.get("visibility") or "public",
+                "in_reply_to_id": params.get("in_reply_to_id"),
+                "favourites_count": 0,
+                "reblogs_count": 0,
+                "account": {"id": "1", "username": "bot", "acct": "bot", "note": ""},
+            }
+            self.posted.append(status)
+            if idempotency_key is not None:
+                self.idempotency_keys[idempotency_key] = status
+            return status
+
+    def take_failure(self):
+        with self.lock:
+            if self.failures > 0:
+                self.failures -= 1
+                return True
+            return False
+
+    def reblog(self, status_id):
+        with self.lock:
+            for status in self.posted:
+                if status["id"] == status_id:
+                    self.reblogged.append(status_id)
+                    return dict(status, reblogged=True)
+            return None
+
+    def page(self, params, tag=None, list_id=None):
+        limit = min(int(params.get("limit", 20)), 40)
+        toots = self.toots
+        if tag is not None:
+            toots = [x for x in toots if tag in [t["name"] for t in x.get("tags", [])]]
+        if list_id is not None:
+            members = self.lists.get(list_id, ())
+            toots = [x for x in toots if x["account"]["username"] in members]
+        if "max_id" in params:
+            toots = [x for x in toots if int(x["id"]) < int(params["max_id"])]
+        if "since_id" in params:
+            toots = [x for x in toots if int(x["id"]) > int(params["since_id"])]
+        if "min_id" in params:
+            # Oldest toots right after min_id, still returned newest first.
+            toots = [x for x in toots if int(x["id"]) > int(params["min_id"])]
+            return toots[-limit:]
+        return toots[:limit]
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def take_budget(self):
+        """The X-RateLimit-* headers for this request, or None once an error
+        (429) has been sent."""
+        fake = self.server.fake
+        remaining, reset = fake.take_budget()
+        ratelimit_headers = {
+            "X-RateLimit-Limit": str(fake.ratelimit_limit),
+            "X-RateLimit-Remaining": str(max(remaining, 0)),
+            "X-RateLimit-Reset": datetime.fromtimestamp(reset, timezone.utc)
+            .isoformat()
+            .replace("+00:00", "Z"),
+        }
+        if remaining < 0:
+            self.send_json({"error": "Too many requests"}, 429, ratelimit_headers)
+            return None
+        return ratelimit_headers
+
+    def do_GET(self):
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        ratelimit_headers = self.take_budget()
+        if ratelimit_headers is None:
+            return
+
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if url.path == "/api/v1/instance":
+            self.send_json(
+                {
+                    "uri": "fake.social",
+                    "version": "4.1.0",
+                    "configuration": {
+                        "statuses": {"max_characters": fake.max_characters}
+                    },
+                },
+                headers=ratelimit_headers,
+            )
+        elif url.path == "/api/v1/timelines/public":
+            self.send_json(fake.page(params), headers=ratelimit_headers)
+        elif url.path.startswith("/api/v1/timelines/tag/"):
+            tag = url.path.rsplit("/", 1)[-1]
+            self.send_json(fake.page(params, tag=tag), headers=ratelimit_headers)
+        elif url.path.startswith("/api/v1/timelines/list/") and (
+            url.path.rsplit("/", 1)[-1] in fake.lists
+        ):
+            list_id = url.path.rsplit("/", 1)[-1]
+            self.send_json(
+                fake.page(params, list_id=list_id), headers=ratelimit_headers
+            )
+        else:
+            self.send_json({"error": "Record not found"}, 404, ratelimit_headers)
+
+    def do_POST(self):
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        length = int(self.headers.get("Content-Length", 0))
+        data = self.rfile.read(length).decode()
+        ratelimit_headers = self.take_budget()
+        if ratelimit_headers is None:
+            return
+        if fake.take_failure():
+            self.send_json({"error": "Unavailable"}, 503, ratelimit_headers)
+            return
+
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(data)
+        else:
+            params = {k: v[-1] for k, v in parse_qs(data).items()}
+        path = urlparse(self.path).path
+        reblogged = None
+        if path.startswith("/api/v1/statuses/") and path.endswith("/reblog"):
+            reblogged = fake.reblog(path.split("/")[-2])
+        if path == "/api/v1/statuses":
+            self.send_json(
+                fake.post(params, self.headers.get("Idempotency-Key")),
+                headers=ratelimit_headers,
+            )
+        elif reblogged is not None:
+            self.send_json(reblogged, headers=ratelimit_headers)
+        else:
+            self.send_json({"error": "Record not found"}, 404, ratelimit_headers)
+
+
+def serve(fake, port=0):
+    """Start a fake instance in a background thread, returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.fake = fake
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 8001), Handler)
+    server.fake = FakeMastodon(make_timeline(5000))
+    print("Fake Mastodon listening on http://127.0.0.1:8001")
+    server.serve_forever()
@@ -0,0 +1,253 @@
+"""Fetching webpages: pooled sessions, timeouts, size caps and a revalidating cache.
+
+Each host gets its own requests.Session, so connections are reused. Bodies are
+streamed and abandoned past a byte cap or a total deadline, and non-HTML
+responses (PDFs...) are dropped as soon as their headers arrive. Responses
+are cached on disk and revalidated with If-None-Match / If-Modified-Since;
+entries unused for cache_days are pruned when a Fetcher is made, then the
+least recently used ones while the cache is over cache_max_bytes.
+With a hosts.HostScheduler, requests wait for a slot on their host, and the
+cached copy of a page (if any) is returned while its host is skipped.
+"""
+import codecs
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.compat import chardet
+
+from hosts import HOST_FAILURE_STATUSES, HostUnavailable
+
+logger = logging.getLogger(__name__)
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="...; charset=...">
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.I)
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/111.0 Safari/537.36"
+)
+
+
+def encoding_of(response, content_type, content):
+    """The charset of the Content-Type header, else of the page's <meta> tag,
+    else the one detected from the content, else UTF-8. (requests assumes
+    ISO-8859-1 for text/html without a charset, and its apparent_encoding
+    needs the body that was streamed.)"""
+    candidates = []
+    if "charset=" in content_type.lower():
+        candidates.append(response.encoding)
+    match = META_CHARSET_RE.search(content[:4096])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    if chardet is not None:
+        candidates.append(chardet.detect(content[:65536])["encoding"])
+    for encoding in candidates:
+        if not encoding:
+            continue
+        try:
+            return codecs.lookup(encoding).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+
+class Fetcher:
+    def __init__(
+        self,
+        cache_dir="cache/http",
+        max_bytes=5_000_000,
+        timeout=(5, 20),
+        deadline=60,
+        scheduler=None,
+        cache_days=30,
+        cache_max_bytes=500_000_000,
+    ):
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.prune_cache(cache_days * 24 * 60 * 60, cache_max_bytes)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.deadline = deadline
+        self.scheduler = scheduler
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "fetched": 0,
+            "revalidated": 0,
+            "skipped": 0,
+            "failed": 0,
+            "host_skipped": 0,
+            "bytes": 0,
+        }
+
+    def get(self, url):
+        """Text of the page at url, or None if it isn't an HTML page or failed."""
+        cached = self._read_cache(url)
+        headers = {"User-Agent": USER_AGENT}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        if self.scheduler is None:
+            return self._get(url, headers, cached, self.deadline)[0]
+        try:
+            with self.scheduler.slot(url):
+                # A page being read when the stage's deadline passes is cut.
+                deadline = self.deadline
+                if self.scheduler.remaining() is not None:
+                    deadline = min(deadline, self.scheduler.remaining())
+                start = time.time()
+                body, ok = self._get(url, headers, cached, deadline)
+                self.scheduler.record(url, ok, time.time() - start)
+        except HostUnavailable as e:
+            logger.info(f"Not fetching {url}: {e}")
+            self._count("host_skipped")
+            return cached["body"] if cached else None
+        return body
+
+    def _get(self, url, headers, cached, deadline):
+        """(text of the page or None, whether its host answered properly)."""
+        start = time.time()
+        try:
+            with self._session(url).get(
+                url, headers=headers, timeout=self.timeout, stream=True
+            ) as response:
+                if response.status_code == 304 and cached:
+                    self._count("revalidated")
+                    # Last used now, as far as pruning goes.
+                    self._touch_cache(url)
+                    return cached["body"], True
+
+                if response.status_code >= 400:
+                    logger.warning(f"Got HTTP {response.status_code} for {url}")
+                    self._count("failed")
+                    return None, response.status_code not in HOST_FAILURE_STATUSES
+
+                content_type = response.headers.get("Content-Type", "")
+                mime_type = content_type.split(";")[0].strip().lower()
+                if mime_type and mime_type not in HTML_CONTENT_TYPES:
+                    logger.info(f"Skipping {url} with content type {mime_type}")
+                    self._count("skipped")
+                    return None, True
+
+                # The deadline is checked between chunks, and the read timeout
+                # bounds the wait for each one.
+                chunks = []
+                size = 0
+                truncated = False
+                for chunk in response.iter_content(16 * 1024):
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= self.max_bytes:
+                        logger.info(f"Truncating {url} at {size} bytes")
+                        truncated = True
+                        break
+                    if time.time() - start > deadline:
+                        logger.warning(f"Deadline exceeded while reading {url}")
+                        truncated = True
+                        break
+                content = b"".join(chunks)
+                body = content.decode(
+                    encoding_of(response, content_type, content), errors="replace"
+                )
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Failed to fetch {url}: {e}")
+            self._count("failed")
+            return None, False
+
+        self._count("fetched")
+        self._count("bytes", size)
+        # A page cut short would be served as is on every revalidation.
+        if not truncated:
+            self._write_cache(url, response.headers, body)
+        return body, True
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _session(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+            return self._sessions[host]
+
+    def prune_cache(self, max_age, max_bytes):
+        """Remove cache entries unused for max_age seconds, then the least
+        recently used ones until the cache holds at most max_bytes."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort(reverse=True)
+        cutoff = time.time() - max_age
+        total = 0
+        removed = 0
+        for mtime, size, path in entries:
+            total += size
+            if mtime >= cutoff and total <= max_bytes:
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info(f"Pruned {removed} of {len(entries)} cached pages")
+
+    def _cache_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode()).hexdigest())
+
+    def _read_cache(self, url):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_path(url) + ".json", "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+
+    def _touch_cache(self, url):
+        try:
+            os.utime(self._cache_path(url) + ".json")
+        except FileNotFoundError:
+            pass
+
+    def _write_cache(self, url, headers, body):
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not self.cache_dir or not (etag or last_modified):
+            return
+        path = self._cache_path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "url": url,
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "body": body,
+                },
+                f,
+            )
+        os.replace(tmp_path, path + ".json")
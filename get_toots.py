@@ -1,22 +1,36 @@
+import argparse
+import atexit
 import collections
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
 import logging
-import pytz
-import re
-import requests
+import os
 import settings
+import threading
 import time
-import tqdm
 import urllib3
 
-from mastodon import Mastodon
-from bs4 import BeautifulSoup, Comment, NavigableString
-import openai
-
-from selenium.webdriver.chrome.options import Options
-from selenium import webdriver
-from selenium.webdriver.support.ui import WebDriverWait
+import artifacts
+from artifacts import DateTimeEncoder
+import cluster
+import ingest
+from canonical_url import canonicalize, representative
+from doi_resolver import DoiResolver
+from extract import IDENTIFIER_META, extract_content
+from fetch import Fetcher
+import hosts
+from hosts import HostScheduler, HostUnavailable
+from link_history import get_link_history
+import llm
+from llm import get_llm, parse_json_array, parse_json_object
+from metadata import fallback_tldr, read_head, summary_from_head
+import metrics
+from pipeline import Stage, run_pipeline
+import sources
+from popularity import HOUR, PopularityIndex
+from summary_cache import cache_key, get_summary_cache
+from toot_store import TootRecord, load_window
+from truncation import body_budget, count_tokens, truncate_body
 
 # Configure the logger
 logging.basicConfig(level=logging.INFO)
@@ -24,405 +38,939 @@ logging.basicConfig(level=logging.INFO)
 # Create the logger
 logger = logging.getLogger(__name__)
 
-openai.api_key_path = settings.open_ai_api_key_path
+# Tried in order; GPT-4 is slower but it almost always returns good results.
+SUMMARY_MODELS = ["gpt-3.5-turbo", "gpt-4"]
+# Keys of a summary that the rest of the pipeline reads as strings, and as
+# booleans.
+SUMMARY_TEXT_KEYS = ["website", "title", "summary", "tldr"]
+SUMMARY_BOOL_KEYS = ["is_scientific_article", "is_news"]
+# Links in the digest.
+LINKS_OF_THE_DAY = 10
+
+
+class IncompleteStage(Exception):
+    """A stage that did not finish its items, e.g. summaries the LLM failed to
+    write: it is not marked done, and running again retries what is missing."""
 
 
+@metrics.timed("resolve_doi")
 def resolve_doi(url):
     """Resolve DOI to URL, otherwise two people can link to the same resource
     and it would count them as separate."""
-    if "doi.org" in url:
-        response = requests.get(url, headers={"Accept": "application/json"})
-        if response.status_code == 200:
-            r = response.json()
-            if "link" in r:
-                links = r["link"]
-                for link in links:
-                    if link["content-type"] == "text/html":
-                        return link["URL"]
-
-    return url
-
-
-def truncate_paragraph(paragraph, max_words=1000):
-    # Split the paragraph into words using a regular expression, including <> tags
-    words = re.findall(r"\b\w+\b|[<>]", paragraph)
-
-    words = [x.strip() for x in words if x.strip()]
-
-    # Count the number of words
-    word_count = len(words)
+    return get_doi_resolver().resolve(url)
+
+
+# The shared clients below are first asked for by pipeline threads: each one
+# is built once, under this lock (reentrant, as some are built from others).
+_singletons_lock = threading.RLock()
+_doi_resolver = None
+
+
+def get_doi_resolver():
+    global _doi_resolver
+    with _singletons_lock:
+        if _doi_resolver is None:
+            _doi_resolver = DoiResolver(
+                settings.doi_cache_path, scheduler=get_host_scheduler()
+            )
+    return _doi_resolver
+
+
+_host_scheduler = None
+
+
+def get_host_scheduler():
+    """Shared by page fetches and DOI lookups, so that both count towards
+    each host's limits and health."""
+    global _host_scheduler
+    with _singletons_lock:
+        if _host_scheduler is None:
+            _host_scheduler = HostScheduler(
+                settings.host_health_path,
+                max_per_host=settings.max_requests_per_host,
+                min_interval=settings.min_host_interval,
+                limits=settings.host_limits,
+                failure_threshold=settings.host_failure_threshold,
+                cooldown=settings.host_cooldown_hours * HOUR,
+            )
+    return _host_scheduler
+
+
+def get_popularity_index():
+    """The index saved by the last run when ingesting incrementally, otherwise
+    a new one for the day's toots."""
+    window = settings.popularity_window_hours * HOUR
+    kwargs = {
+        "windows": sorted({HOUR, window, 7 * 24 * HOUR}),
+        "half_life": (settings.popularity_half_life_hours or 6) * HOUR,
+    }
+    if settings.incremental_ingest:
+        return PopularityIndex.load(settings.popularity_index_path, **kwargs)
+    return PopularityIndex(**kwargs)
 
-    # Truncate the paragraph if it contains more than 1000 words
-    if word_count > max_words:
-        words = words[:max_words]
-        total_len = sum([len(x) for x in words])
-        total_len += len(words) - 1
 
-        if total_len < len(paragraph):
-            idx = paragraph[total_len:].find(" ")
+def fetch_toots_from_last_day(mastodon):
+    return [toot for page in iter_toots_from_last_day(mastodon) for toot in page]
 
-            return paragraph[: (total_len + idx)] + "..."
-    return paragraph
 
-
-def fetch_toots_from_last_day(mastodon):
-    # Initialize variables for pagination
-    toots = []
-    max_id = None
-    one_day_ago = datetime.now(pytz.utc) - timedelta(days=1)
+def iter_toots_from_last_day(mastodon, timeline="local", max_id=None):
+    """Yield the toots of the last 24 hours of timeline, by pages, newest
+    first, or older than max_id when given."""
+    one_day_ago = datetime.now(timezone.utc) - timedelta(days=1)
 
     while True:
-        fetched_toots = mastodon.timeline_local(limit=None, max_id=max_id)
+        with metrics.span("mastodon.timeline_page"):
+            fetched_toots = sources.timeline_page(
+                mastodon, timeline, limit=None, max_id=max_id
+            )
+        metrics.incr("mastodon.toots", len(fetched_toots))
 
         # Break the loop if no more toots are fetched
         if not fetched_toots:
             break
 
         # Filter toots from the last day
-        recent_dates = [toot["created_at"] for toot in fetched_toots]
         recent_toots = [
             toot for toot in fetched_toots if toot["created_at"] > one_day_ago
         ]
 
-        # Add the recent toots to the list
-        toots.extend(recent_toots)
+        yield recent_toots
 
         # Break the loop if the last fetched toot is older than one day
         if len(recent_toots) < len(fetched_toots):
             break
 
-        # Update the max_id for the next request
+        # Update the max_id for the next request. Mastodon.py paces the
+        # requests from the rate-limit headers.
         max_id = fetched_toots[-1]["id"]
 
-        # Sleep for a short duration to avoid rate-limiting
-        time.sleep(1)
 
-    return toots
+def fetch_day(clients, log_path=None):
+    """Records of the last 24 hours of every source of clients ({Source:
+    Mastodon}), read in parallel and deduplicated by uri.
+
+    With log_path, records are appended to it page by page, and those logged
+    by an attempt that crashed are kept: each source is read on from the
+    oldest of its toots logged.
+    """
+    logged = collections.defaultdict(list)
+    if log_path is not None and os.path.exists(log_path):
+        with open(log_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn by the crash; the toot is read again.
+                    continue
+                logged[entry["source"]].append(TootRecord.from_dict(entry["record"]))
+    log = open(log_path, "a") if log_path is not None else None
+    lock = threading.Lock()
+
+    def read(source, mastodon):
+        records = logged[source.name]
+        max_id = records[-1].id if records else None
+        if records:
+            logger.info(f"{len(records)} toots of {source.name} already read")
+        for page in iter_toots_from_last_day(mastodon, source.timeline, max_id):
+            host = sources.account_host(source)
+            page = [TootRecord.from_status(toot, host) for toot in page]
+            if log is not None:
+                lines = "".join(
+                    json.dumps({"source": source.name, "record": record.to_dict()})
+                    + "\n"
+                    for record in page
+                )
+                with lock:
+                    log.write(lines)
+                    log.flush()
+            records.extend(page)
+        return records
 
+    try:
+        fetched = sources.fetch_parallel(clients, read)
+    finally:
+        if log is not None:
+            log.close()
+    return sources.dedupe(
+        record for records in fetched.values() for record in records
+    )
 
-def extract_links(html_string):
-    # Parse the HTML string with BeautifulSoup
-    soup = BeautifulSoup(html_string, "html.parser")
 
-    # Find all the <a> tags
-    a_tags = soup.find_all("a")
+def get_url_via_selenium(url):
+    from browser_pool import js_wait_selector
 
-    # Extract the 'href' attribute from each <a> tag and return the list of links
-    links = [a.get("href") for a in a_tags]
-    return links
+    return get_browser_pool().render(url, js_wait_selector(url))
 
 
-def remove_attrs(soup, attrs):
-    for attr in attrs:
-        for tag in soup.find_all(attrs={attr: True}):
-            del tag[attr]
-    return soup
+_browser_pool = None
 
 
-def remove_tags(soup, tags):
-    for tag in tags:
-        for match in soup.find_all(tag):
-            match.decompose()
-    return soup
+def get_browser_pool():
+    global _browser_pool
+    with _singletons_lock:
+        if _browser_pool is None:
+            from browser_pool import BrowserPool
 
+            _browser_pool = BrowserPool(settings.browser_pool_size)
+            # Never leave headless Chrome processes behind.
+            atexit.register(_browser_pool.close)
+    return _browser_pool
 
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super(DateTimeEncoder, self).default(obj)
 
+def fetch_html(url):
+    # Selenium is only imported once there is a page to fetch.
+    from browser_pool import js_wait_selector
 
-def get_url_via_selenium(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    driver = webdriver.Chrome(options=chrome_options)
+    if js_wait_selector(url) is not None:
+        # Dreaded javacript nonsense from psyarxiv and elsevier
+        with metrics.span("fetch_html.selenium"):
+            html = render_scheduled(url)
+    else:
+        # A mercifully non-javascript webpage.
+        with metrics.span("fetch_html"):
+            html = get_fetcher().get(url)
+    if html is None:
+        metrics.incr("fetch_html.failed")
+    else:
+        metrics.incr("fetch_html.pages")
+        metrics.incr("fetch_html.bytes", len(html.encode("utf-8")))
+    return html
 
-    driver.get(url)
 
-    # Wait for the articles to load
-    class DocumentReadyStateCondition:
-        def __call__(self, driver):
-            ready_state = driver.execute_script("return document.readyState")
-            return ready_state == "complete"
+def render_scheduled(url):
+    """get_url_via_selenium within url's host limits, None when it is
+    skipped."""
+    scheduler = get_host_scheduler()
+    try:
+        with scheduler.slot(url):
+            start = time.time()
+            html = get_url_via_selenium(url)
+            scheduler.record(url, html is not None, time.time() - start)
+    except HostUnavailable as e:
+        logger.info(f"Not rendering {url}: {e}")
+        return None
+    return html
+
+
+_fetcher = None
+
+
+def get_fetcher():
+    global _fetcher
+    with _singletons_lock:
+        if _fetcher is None:
+            _fetcher = Fetcher(
+                settings.http_cache_dir,
+                max_bytes=settings.max_page_bytes,
+                timeout=(settings.connect_timeout, settings.read_timeout),
+                scheduler=get_host_scheduler(),
+                cache_days=settings.http_cache_days,
+                cache_max_bytes=settings.http_cache_max_bytes,
+            )
+    return _fetcher
+
+
+@metrics.timed("fetch_webpage_data")
+def fetch_webpage_data(url):
+    html_content = fetch_html(url)
+    if html_content is None:
+        return None
 
-    # Set the maximum waiting time (in seconds) until document.readyState == "complete"
-    timeout = 10
+    with metrics.span("extract_content"):
+        parsed_content = extract_content(html_content)
+    return {"url": url, **parsed_content}
 
-    try:
-        # Wait until the document.readyState is "complete"
-        WebDriverWait(driver, timeout).until(DocumentReadyStateCondition())
-        logger.info("Webpage loaded through Selenium successfully")
-    except TimeoutError:
-        logger.info("Timed out waiting for page to load")
 
-    time.sleep(10)
+@metrics.timed("summarize_links")
+def summarize_links(
+    links, fetch=None, summarize_many=None, batch_size=None, run=None
+):
+    """Fetch, extract and summarize links concurrently.
+
+    Pages are summarized batch_size at a time by summarize_many.
+    Returns (webpage_data, summary) pairs in the order of links, skipping
+    pages that couldn't be fetched or summarized, duplicates and PDFs.
+
+    With a run (see artifacts.py), pages and summaries are logged as they
+    complete, and those logged by an earlier attempt are reused.
+    """
+    summarize_many = summarize_many or summarize_webpages
+    batch_size = batch_size or settings.summary_batch_size
+    fetched = run.items("fetch") if run else None
+    summarized = run.items("summarize") if run else None
+
+    def summarize_stage(pages):
+        summaries = summarize_many(pages)
+        if summarized is not None:
+            for webpage_data, summary in zip(pages, summaries):
+                if summary is not None:
+                    summarized.add(webpage_data["url"], summary)
+        return [
+            None if summary is None else (webpage_data, summary)
+            for webpage_data, summary in zip(pages, summaries)
+        ]
 
-    # page_title = driver.execute_script("return document.head.innerHTML;")
-    # body_text = driver.execute_script("return document.body.innerHTML;")
-    return driver.execute_script("return document.documentElement.outerHTML")
+    done = {}
+    if summarized is not None:
+        done = {
+            link: (fetched.get(link), summarized.get(link))
+            for link in links
+            if link in summarized and link in fetched
+        }
+    todo = [link for link in links if link not in done]
+    results, report = run_pipeline(
+        todo,
+        _page_stages(fetch, fetched)
+        + [
+            Stage(
+                "summarize", summarize_stage, settings.summarize_workers, batch_size
+            )
+        ],
+    )
+    logger.info(f"Pipeline timings: {json.dumps(report)}")
+    metrics.set_info("pipeline", report)
+    results = dict(zip(todo, results))
 
+    kept = []
+    titles = set()
+    for result in (done.get(link) or results.get(link) for link in links):
+        if result is None:
+            continue
+        webpage_data, summary = result
 
-def fetch_webpage_data(url):
-    fetched_via_selenium = False
-    if "psyarxiv" in url or "linkinghub" in url:
-        # Dreaded javacript nonsense from psyarxiv and elsevier
-        fetched_via_selenium = True
-        html_content = get_url_via_selenium(url)
-    else:
-        # A mercifully non-javascript webpage.
-        try:
-            response = requests.get(url)
-        except requests.exceptions.SSLError:
-            return None
-        html_content = response.text
+        if summary["title"] in titles:
+            logger.warning("Skipping page with duplicate title")
+            continue
 
-    parsed_content = extract_content(html_content)
-    return {"url": url, **parsed_content}
+        if (
+            ("pdf" in summary["summary"].lower())
+            or ("pdf" in summary["title"].lower())
+            or ("not available" in summary["summary"].lower())
+            or ("extracted" in summary["summary"].lower())
+            or ("access denied" in summary["title"].lower())
+        ):
+            # Link to a PDF, abort.
+            continue
 
+        titles.add(summary["title"])
+        kept.append((webpage_data, summary))
 
-def extract_content(html):
-    soup = BeautifulSoup(html, "html.parser")
+    return kept
 
-    title_tag = soup.find("title")
-    title = title_tag.text.strip() if title_tag else ""
 
-    # Remove all non-content tags
-    remove_tags(
-        soup,
-        [
-            "link",
-            "style",
-            "script",
-            "noscript",
-            "iframe",
-            "img",
-            "picture",
-            "svg",
-            "math",  # MathJax
-            "form",
-            "input",
-            "header",
-            "footer",
-            "nav",
-            "ul",  # Often used for navigation
-            "ol",
-        ],
-    )
+@metrics.timed("fetch_pages")
+def fetch_pages(links, fetch=None, run=None):
+    """Fetch and extract links concurrently. Returns the webpage data of the
+    pages that could be fetched, in the order of links.
 
-    # Remove all comments
-    comments = soup.find_all(string=lambda text: isinstance(text, Comment))
-
-    for comment in comments:
-        comment.extract()
-
-    # Remove attributes which start with 'data-' or 'aria-'
-    for element in soup():
-        # Loop through the element's attributes
-        for attr in list(element.attrs.keys()):
-            if attr.startswith("data-") or attr.startswith("aria-"):
-                # Remove the attribute
-                del element.attrs[attr]
-
-    # Find all elements with a useless attribute
-    remove_attrs(soup, ["class", "style", "onclick", "id"])
-
-    for text_node in soup.find_all(string=True):
-        if isinstance(text_node, NavigableString):
-            # Replace extra whitespaces
-            new_text = " ".join(text_node.split())
-            text_node.replace_with(new_text)
-
-    # Remove empty tags
-    for tag in soup.find_all():
-        if not tag.contents:
-            tag.extract()
-
-    # Unwrap deeply nested tags
-    for div in soup.find_all("div"):
-        div.unwrap()
-
-    main_tag = soup.find("main")
-    if main_tag:
-        body = "".join([str(x) for x in main_tag.contents])
-    else:
-        body_tag = soup.find("body")
-        body = "".join([str(x) for x in body_tag.contents]) if body_tag else ""
+    With a run, pages are logged as they complete, and those logged by an
+    earlier attempt are reused.
+    """
+    fetched = run.items("fetch") if run else None
+    results, report = run_pipeline(links, _page_stages(fetch, fetched))
+    logger.info(f"Fetch timings: {json.dumps(report)}")
+    return [webpage_data for webpage_data in results if webpage_data is not None]
+
+
+def _page_stages(fetch=None, fetched=None):
+    """Pipeline stages from a link to its webpage data, reusing and adding to
+    the `fetched` log when given."""
+    fetch = fetch or fetch_html
+
+    def fetch_stage(url):
+        if fetched is not None and url in fetched:
+            return {"url": url, "webpage_data": fetched.get(url)}
+        html_content = fetch(url)
+        if html_content is None:
+            return None
+        return {"url": url, "html": html_content}
+
+    def extract_stage(page):
+        if "webpage_data" in page:
+            return page["webpage_data"]
+        webpage_data = None
+        if settings.metadata_fast_path:
+            with metrics.span("read_head"):
+                webpage_data = webpage_data_from_head(page["url"], page["html"])
+        if webpage_data is None:
+            with metrics.span("extract_content"):
+                webpage_data = {"url": page["url"], **extract_content(page["html"])}
+            if webpage_data["body"].strip() == "":
+                logger.warning("Skipping page which could not be fetched")
+                return None
+        if fetched is not None:
+            fetched.add(page["url"], webpage_data)
+        return webpage_data
+
+    return [
+        Stage("fetch", fetch_stage, settings.fetch_workers),
+        Stage("extract", extract_stage, 1),
+    ]
 
-    webpage_data = {
-        "title": title,
-        "body": body,
+
+def webpage_data_from_head(url, html):
+    """Webpage data of a page whose metadata summarize it, None otherwise.
+    Its body is left empty: the page is not cleaned up, and its summary is in
+    "metadata" (see metadata.py)."""
+    head = read_head(html)
+    summary = summary_from_head(url, head, settings.metadata_min_description)
+    if summary is None:
+        return None
+    skipped = html[head["parsed"] :]
+    metrics.incr("metadata.pages")
+    metrics.incr("metadata.bytes_skipped", len(skipped.encode("utf-8")))
+    return {
+        "url": url,
+        "title": head["title"] or summary["title"],
+        "description": summary["summary"],
+        "identifiers": {
+            key: head["meta"][key] for key in IDENTIFIER_META if key in head["meta"]
+        },
+        "body": "",
+        "metadata": summary,
     }
 
-    return webpage_data
+
+SUMMARY_KEYS = """`website`: the name of the host website (e.g. "NYTimes", "arXiv", etc.)
+`title`: a good title for the website (not necessarily the content of <title>)
+`is_scientific_article`: bool, whether the article is a scientific article (e.g. if it's on a preprint server, on nature.com, etc.)
+`is_news`: bool, whether the article is a news article, or from a blog, etc.
+`summary`: an abstract/summary for the webpage. Can be copied verbatim from the webpage if it's a news article or a scientific article). 
+`tldr`: a two-sentence summary of the summary"""
+
+# Pages summarized together must fit this model's context.
+SUMMARY_BATCH_MODEL = "gpt-3.5-turbo-16k"
+# Room for each page's JSON answer in a batched request.
+BATCH_ANSWER_TOKENS = 500
 
 
+def webpage_summary_key(contents):
+    """(truncated body, summary cache key) of a page."""
+    # The prompt has to fit the smallest model it may be sent to.
+    body = truncate_body(
+        contents,
+        min([settings.max_body_tokens] + [body_budget(m) for m in SUMMARY_MODELS]),
+    )
+    key = cache_key(
+        "webpage", canonicalize(contents["url"]), contents["title"] + "\n" + body
+    )
+    return body, key
+
+
+@metrics.timed("summarize_webpage")
 def summarize_webpage(contents):
+    body, key = webpage_summary_key(contents)
+    cached = get_summary_cache().get(key)
+    if cached is not None:
+        logger.info(f"Using cached summary for {contents['url']}")
+        return cached
+    return request_webpage_summary(contents, body, key)
+
+
+def is_summary(answer):
+    """Whether an answer has every key of a summary, with the right types."""
+    return (
+        isinstance(answer, dict)
+        and all(isinstance(answer.get(k), str) for k in SUMMARY_TEXT_KEYS)
+        and all(isinstance(answer.get(k), bool) for k in SUMMARY_BOOL_KEYS)
+    )
+
+
+def parse_summary(content):
+    answer = parse_json_object(content)
+    if not is_summary(answer):
+        raise ValueError("Summary without all of its keys")
+    return answer
+
+
+def request_webpage_summary(contents, body, key):
     prompt = f"""
 "Below is a webpage summary, including the URL, <title>, and <body>. Return a 
 json string with the following keys: 
 
-`website`: the name of the host website (e.g. "NYTimes", "arXiv", etc.)
-`title`: a good title for the website (not necessarily the content of <title>)
-`is_scientific_article`: bool, whether the article is a scientific article (e.g. if it's on a preprint server, on nature.com, etc.)
-`is_news`: bool, whether the article is a news article, or from a blog, etc.
-`summary`: an abstract/summary for the webpage. Can be copied verbatim from the webpage if it's a news article or a scientific article). 
-`tldr`: a two-sentence summary of the summary
+{SUMMARY_KEYS}
 
 The website:
 ----------------
 url: {contents['url']}
 title: {contents['title']}
-body: {truncate_paragraph(contents['body'])}
+body: {body}
 """
-    for model in ["gpt-3.5-turbo", "gpt-4"]:
-        # GPT-4 is slower but it almost always returns good results.
-        for delay in [1, 2, 4, 8, 16, 32, 64, 128]:
-            logger.info(f"Trying model {model}")
-            try:
-                response = openai.ChatCompletion.create(
-                    model=model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are a helpful assistant. You always follow instructions.",
-                        },
-                        {"role": "user", "content": prompt},
-                    ],
-                )
-                content = response["choices"][0]["message"]["content"]
-                break
-            except (openai.error.APIError, openai.error.RateLimitError):
-                logger.warn(f"Failed to get response from model {model}")
-
-            logger.warn(f"Timed out waiting for {model}, retrying in {delay} seconds.")
-            time.sleep(delay)
+    completion = get_llm().complete(
+        prompt, SUMMARY_MODELS, parse=parse_summary, json_object=True
+    )
+    if completion is None:
+        return None
+    r, tokens, model = completion
+    get_summary_cache().put(key, r, model, tokens)
+    return r
+
+
+@metrics.timed("summarize_webpages")
+def summarize_webpages(pages):
+    """Summaries of pages, in order, None for the ones that failed.
+
+    Pages that aren't in the cache are packed into as few requests as fit the
+    batch model's context. Pages missing or malformed in a batched answer are
+    summarized one by one. Pages summarized by their metadata only need a
+    tldr.
+    """
+    if any("metadata" in contents for contents in pages):
+        summaries = [None] * len(pages)
+        with_metadata = [i for i, page in enumerate(pages) if "metadata" in page]
+        others = [i for i, page in enumerate(pages) if "metadata" not in page]
+        for indices, summarize in [
+            (with_metadata, summarize_from_metadata),
+            (others, summarize_webpages),
+        ]:
+            if indices:
+                for i, summary in zip(indices, summarize([pages[i] for i in indices])):
+                    summaries[i] = summary
+        return summaries
+
+    summary_cache = get_summary_cache()
+    keys = [webpage_summary_key(contents) for contents in pages]
+    summaries = [summary_cache.get(key) for _, key in keys]
+    # Summaries cached before they were checked.
+    summaries = [summary if is_summary(summary) else None for summary in summaries]
+
+    batches = []
+    budget = body_budget(SUMMARY_BATCH_MODEL)
+    used = 0
+    for i, summary in enumerate(summaries):
+        if summary is not None:
+            continue
+        tokens = count_tokens(keys[i][0]) + BATCH_ANSWER_TOKENS
+        if not batches or used + tokens > budget:
+            batches.append([])
+            used = 0
+        batches[-1].append(i)
+        used += tokens
+
+    for batch in batches:
+        if len(batch) == 1:
+            continue
+        batch_summaries, tokens = request_batch_summaries(
+            [pages[i] for i in batch], [keys[i][0] for i in batch]
+        )
+        for i, summary in zip(batch, batch_summaries):
+            if summary is not None:
+                summaries[i] = summary
+                summary_cache.put(keys[i][1], summary, SUMMARY_BATCH_MODEL, tokens)
+
+    for i, contents in enumerate(pages):
+        if summaries[i] is None:
+            logger.info(f"Summarizing {contents['url']} on its own")
+            summaries[i] = request_webpage_summary(contents, *keys[i])
+    return summaries
+
+
+@metrics.timed("summarize_from_metadata")
+def summarize_from_metadata(pages):
+    """Summaries of pages from their metadata, with the tldrs that aren't
+    cached written in one request. Pages the LLM wrote no tldr for get the
+    start of their abstract instead, which isn't cached."""
+    summary_cache = get_summary_cache()
+    keys = [
+        cache_key("tldr", canonicalize(page["url"]), page["metadata"]["summary"])
+        for page in pages
+    ]
+    tldrs = [summary_cache.get(key) for key in keys]
+    todo = [i for i, tldr in enumerate(tldrs) if tldr is None]
+    if todo:
+        answers, tokens = request_tldrs([pages[i] for i in todo])
+        for i, tldr in zip(todo, answers):
+            if tldr is not None:
+                tldrs[i] = {"tldr": tldr}
+                summary_cache.put(keys[i], tldrs[i], SUMMARY_BATCH_MODEL, tokens)
+    for i, tldr in enumerate(tldrs):
+        if tldr is None:
+            logger.warning(f"No tldr for {pages[i]['url']}, using its abstract")
+            metrics.incr("metadata.tldr_fallbacks")
+            tldrs[i] = {"tldr": fallback_tldr(pages[i]["metadata"]["summary"])}
+    return [{**page["metadata"], **tldr} for page, tldr in zip(pages, tldrs)]
+
+
+def request_tldrs(pages):
+    """(tldrs, tokens used per page) of pages from their metadata summary, None
+    for those missing or malformed in the answer."""
+    metrics.incr("metadata.tldr_requests")
+    websites = "\n".join(
+        f"""
+Website {i}:
+----------------
+url: {page['url']}
+title: {page['metadata']['title']}
+summary: {page['metadata']['summary']}
+"""
+        for i, page in enumerate(pages)
+    )
+    prompt = f"""
+Below are the summaries of {len(pages)} webpages, each with an index, the URL
+and the title. Return a json array with one object per website, in the same
+order, each with the following keys:
 
-        try:
-            r = json.loads(content)
-            return r
-        except json.decoder.JSONDecodeError:
-            logger.warning(f"Failed to parse JSON with model {model}")
+`index`: the index of the website
+`tldr`: a two-sentence summary of the summary
+{websites}"""
+    tldrs = [None] * len(pages)
+    completion = get_llm().complete(
+        prompt, [SUMMARY_BATCH_MODEL], parse=parse_json_array
+    )
+    if completion is None:
+        return tldrs, 0
+    entries, tokens, _ = completion
+    tokens //= len(pages)
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
             continue
+        i = entry.get("index", position)
+        if isinstance(i, int) and 0 <= i < len(pages):
+            if isinstance(entry.get("tldr"), str):
+                tldrs[i] = entry["tldr"]
+    return tldrs, tokens
 
 
-def main():
-    with open(".access.secret", "r") as f:
-        access_token = f.read()
+def request_batch_summaries(pages, bodies):
+    """(summaries, tokens used per page) of several pages in one request.
 
-    # Initialize Mastodon instance
-    mastodon = Mastodon(access_token=access_token, api_base_url=settings.mastodon_url)
+    Entries that are missing or malformed in the answer are None.
+    """
+    websites = "\n".join(
+        f"""
+Website {i}:
+----------------
+url: {contents['url']}
+title: {contents['title']}
+body: {body}
+"""
+        for i, (contents, body) in enumerate(zip(pages, bodies))
+    )
+    prompt = f"""
+Below are {len(pages)} webpage summaries, each with an index, the URL, <title>,
+and <body>. Return a json array with one object per website, in the same
+order, each with the following keys:
+
+`index`: the index of the website
+{SUMMARY_KEYS}
+{websites}"""
+    summaries = [None] * len(pages)
+    # Fail fast, the pages can still be summarized one by one.
+    completion = get_llm().complete(
+        prompt, [SUMMARY_BATCH_MODEL], parse=parse_json_array, delays=(1, 2)
+    )
+    if completion is None:
+        return summaries, 0
+    entries, tokens, _ = completion
+    tokens //= len(pages)
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            continue
+        i = entry.pop("index", position)
+        if isinstance(i, int) and 0 <= i < len(pages) and is_summary(entry):
+            summaries[i] = entry
+    return summaries, tokens
 
-    logger.info("Fetching toots from last 24 hours")
 
+@metrics.timed("stage.ingest")
+def stage_ingest(run, mastodon=None):
+    """The public toots of the day, without #nobot ones."""
+    if run.done("ingest"):
+        return [TootRecord.from_dict(d) for d in run.load("ingest")]
+
+    logger.info("Fetching toots from last 24 hours")
+    clients = sources.get_clients(sources.from_settings(), mastodon)
     # Time window: last 24 hours
-    toots = fetch_toots_from_last_day(mastodon)
+    if settings.incremental_ingest:
+        ingest.ingest_sources(clients)
+        toots = load_window(ingest.STORE_PATH)
+    else:
+        # Logged as they are read, so that a crash loses none of them.
+        toots = fetch_day(clients, run.path("ingest.items.jsonl"))
     toots = [
-        toot
-        for toot in toots
-        if (toot["visibility"] == "public")
-        and ("#nobot" not in toot["account"]["note"])
+        toot for toot in toots if (toot.visibility == "public") and not toot.nobot
     ]
-    logger.info(f"Analyzing {len(toots)} toots...")
+    run.save("ingest", [toot.to_dict() for toot in toots])
+    return toots
+
+
+@metrics.timed("stage.resolve")
+def stage_resolve(run, toots):
+    """Where every link of the day leads, DOIs resolved."""
+    if run.done("resolve"):
+        return run.load("resolve")
+
+    # Resolve every DOI of the day in one deduplicated batch
+    doi_resolver = get_doi_resolver()
+    with metrics.span("resolve_doi.batch"):
+        resolved = doi_resolver.resolve_many(
+            set(
+                link
+                for toot in toots
+                for link in toot.links
+                if not link.endswith(".pdf")
+            )
+        )
+    get_host_scheduler().save()
+    logger.info(f"DOI cache: {doi_resolver.stats()}")
+    metrics.set_info("doi_cache", doi_resolver.stats())
+    run.save("resolve", resolved)
+    return resolved
+
 
-    with open("cache/toots.json", "w") as f:
-        json.dump(toots, f, cls=DateTimeEncoder)
+@metrics.timed("stage.score")
+def stage_score(run, toots, resolved):
+    """The most popular links, with the toots linking to them: the candidates
+    for the links of the day."""
+    if run.done("score"):
+        return run.load("score")
 
     # Figure out which links are the most popular
     logger.info("Finding popular links...")
-    popularity = collections.defaultdict(int)
+    index = get_popularity_index()
+    instances = tuple(source.instance for source in sources.from_settings())
     backlinks = collections.defaultdict(list)
+    # How each link was spelled, to fetch and post one of them rather than the
+    # canonical URL, which may not be served.
+    spellings = collections.defaultdict(list)
     for toot in toots:
-        # Find links in toot content
-        links = set(
-            [
-                resolve_doi(x)
-                for x in extract_links(toot.content)
-                if not x.endswith(".pdf")
-            ]
-        )
+        # Find links in toot content. Different spellings of the same page
+        # (www., tracking params, arXiv abs vs pdf...) count as one link.
+        spelled = {}
+        for x in toot.links:
+            if not x.endswith(".pdf"):
+                spelled.setdefault(canonicalize(resolved[x]), resolved[x])
 
         # Start with arxiv links
-        links = sorted(links, key=lambda x: "rxiv" not in x)
+        links = sorted(spelled, key=lambda x: "rxiv" not in x)
 
+        counted = []
         for link in links:
             # Remove tags or links to Mastodon profiles
-            if link.startswith(settings.mastodon_url) or "/@" in link:
+            if link.startswith((settings.mastodon_url,) + instances) or "/@" in link:
                 continue
-            popularity[link] += toot.favourites_count + toot.reblogs_count
+            counted.append(link)
             backlinks[link].append(toot)
+            spellings[link].append(spelled[link])
 
             if "rxiv" in link:
                 # Prevents double-counting when a preprint and its published
                 # version are both linked.
                 break
-
-    popular_links = sorted(popularity.items(), key=lambda x: x[1], reverse=True)
-
-    # Stem the links
-    banned_links = set()
-    for i, (popular_link, _) in enumerate(popular_links):
-        leaf = popular_link.split("://")[-1]
-        for j, (popular_link2, _) in enumerate(popular_links):
-            if i != j and leaf in popular_link2:
-                # Keep the most precise link
-                banned_links.add(popular_link)
-
-    popular_links = [(x, y) for x, y in popular_links if x not in banned_links]
+        # Only new toots and changed counts touch the index.
+        index.update(toot.uri, toot.created_at, counted, toot.popularity)
+
+    index.advance(datetime.now(timezone.utc))
+    if settings.incremental_ingest:
+        index.save(settings.popularity_index_path)
+    metrics.set_info("popularity_index", {"toots": len(index.toots)})
+    window = settings.popularity_window_hours * HOUR
+    history = get_link_history()
+    history.record_scores(
+        run.date_str,
+        {link: (index.score(link, window), len(backlinks[link])) for link in backlinks},
+    )
+    # Recent links of the day are dropped before anything is fetched, without
+    # taking the place of other candidates.
+    repeats = history.featured_within(run.date_str, settings.repeat_days)
+    k = settings.candidate_links + len(repeats)
+    if settings.popularity_half_life_hours:
+        # Only links of the day's toots, which have backlinks to post.
+        popular_links = index.top_decayed(k, links=backlinks)
+    else:
+        popular_links = index.top(k, window)
+    dropped = [link for link, _ in popular_links if link in repeats]
+    popular_links = [
+        x for x in popular_links if x[0] not in repeats and backlinks.get(x[0])
+    ]
+    popular_links = popular_links[: settings.candidate_links]
+    trends = {
+        "repeats": len(dropped),
+        "new": len(history.new_links(run.date_str)),
+        "rising": len(history.rising(run.date_str)),
+    }
+    logger.info(f"Link history: {trends}, dropped {dropped}")
+    metrics.set_info("history", trends)
 
     logger.info("Most popular links:")
     logger.info(popular_links[:10])
 
-    # Now fetch the content for each of these popular links and summarize
-    lotd = []
-    titles = set()
-    logger.info("Summarizing webpages...")
-    for link, _ in tqdm.tqdm(popular_links[:10]):
-        if popularity[link] < 1:
-            continue
-
-        webpage_data = fetch_webpage_data(link)
-        if webpage_data is None:
-            continue
-
-        if webpage_data["body"].strip() == "":
-            logger.warning("Skipping page which could not be fetched")
-            continue
-
-        summary = summarize_webpage(webpage_data)
-
-        if summary["title"] in titles:
-            logger.warning("Skipping page with duplicate title")
-            continue
-
-        if (
-            ("pdf" in summary["summary"].lower())
-            or ("pdf" in summary["title"].lower())
-            or ("not available" in summary["summary"].lower())
-            or ("extracted" in summary["summary"].lower()) 
-            or ("access denied" in summary["title"].lower())
-        ):
-            # Link to a PDF, abort.
-            continue
-
-        titles.add(summary["title"])
+    scored = [
+        {
+            "url": representative(link, spellings[link]),
+            # Toots are referred to, not copied.
+            "backlinks": [toot.uri for toot in backlinks[link]],
+            "linked_by": [toot.acct for toot in backlinks[link]],
+            "popularity": popularity,
+        }
+        for link, popularity in popular_links
+        if popularity >= 1
+    ]
+    run.save("score", scored)
+    return scored
+
+
+@metrics.timed("stage.fetch")
+def stage_fetch(run, scored):
+    """The pages of the candidate links. Pages fetched before a crash are not
+    fetched again."""
+    if run.done("fetch"):
+        return run.load("fetch")
+
+    logger.info("Fetching webpages...")
+    urls = [link["url"] for link in scored]
+    order = {url: i for i, url in enumerate(urls)}
+    scheduler = get_host_scheduler()
+    # Spread over hosts so that workers don't all queue for the same one.
+    with scheduler.deadline(settings.fetch_stage_deadline):
+        pages = fetch_pages(hosts.interleave(urls), run=run)
+    pages.sort(key=lambda page: order[page["url"]])
+    scheduler.save()
+    logger.info(f"Host scheduler: {dict(scheduler.stats)}")
+    metrics.set_info("hosts", dict(scheduler.stats))
+    run.save("fetch", pages)
+    return pages
+
+
+@metrics.timed("stage.cluster")
+def stage_cluster(run, scored, pages):
+    """The candidate links that could be fetched, with links to the same story
+    merged into one, most popular first."""
+    if run.done("cluster"):
+        return run.load("cluster")
+
+    by_url = {link["url"]: link for link in scored}
+    groups = cluster.cluster(pages, settings.cluster_similarity)
+    clustered = []
+    for group in groups:
+        links = [by_url[pages[i]["url"]] for i in group]
+        if len(links) > 1:
+            logger.info(f"Same story: {[link['url'] for link in links]}")
+        clustered.append(cluster.merge(links))
+    clustered.sort(key=lambda link: link["popularity"], reverse=True)
+    metrics.incr("cluster.merged", len(pages) - len(groups))
+    run.save("cluster", clustered)
+    return clustered
+
+
+@metrics.timed("stage.summarize")
+def stage_summarize(run, clustered):
+    """Summarize the most popular stories: the links of the day. Summaries
+    done before a crash are not redone."""
+    if run.done("summarize"):
+        return run.load("summarize")
 
+    logger.info("Summarizing webpages...")
+    by_url = {link["url"]: link for link in clustered[:LINKS_OF_THE_DAY]}
+    lotd = []
+    for webpage_data, summary in summarize_links(list(by_url), run=run):
+        link = by_url[webpage_data["url"]]
+        # What the digest shows, not the page's body or metadata.
         lotd.append(
             {
-                **webpage_data,
-                **summary,
-                "backlinks": backlinks[link],
-                "popularity": popularity[link],
+                "url": webpage_data["url"],
+                **{key: summary[key] for key in SUMMARY_TEXT_KEYS + SUMMARY_BOOL_KEYS},
+                "backlinks": link["backlinks"],
+                "linked_by": link["linked_by"],
+                "popularity": link["popularity"],
             }
         )
+    # Pages fetched but not summarized are LLM failures (an outage...), not
+    # pages to drop: the digest waits for them, for summary_max_attempts runs.
+    fetched, summarized = run.items("fetch"), run.items("summarize")
+    failures = run.failures("summarize")
+    missing = []
+    for url in by_url:
+        if url in fetched and url not in summarized:
+            failures.add(url, failures.get(url, 0) + 1)
+            if failures.get(url) < settings.summary_max_attempts:
+                missing.append(url)
+            else:
+                logger.warning(f"Giving up on summarizing {url}")
+    if missing:
+        raise IncompleteStage(
+            f"{len(missing)} of {len(by_url)} links of the day were not summarized, "
+            f"run again to retry them: {missing}"
+        )
+    if not lotd:
+        logger.warning("No links of the day")
+    get_link_history().record_featured(
+        run.date_str,
+        [
+            {
+                **entry,
+                "cluster": [
+                    canonicalize(url)
+                    for url in by_url[entry["url"]].get("cluster") or [entry["url"]]
+                ],
+            }
+            for entry in lotd
+        ],
+    )
+    counters = metrics.get_metrics().counters
+    saved = {
+        "pages": counters["metadata.pages"],
+        "tldr_requests": counters["metadata.tldr_requests"],
+        "bytes_skipped": counters["metadata.bytes_skipped"],
+    }
+    logger.info(
+        f"Metadata fast path: {saved['pages']} pages summarized without "
+        f"their body ({saved['tldr_requests']} tldr requests), "
+        f"{saved['bytes_skipped']} bytes not parsed"
+    )
+    metrics.set_info("metadata", saved)
+    run.save("summarize", lotd)
+    return lotd
+
 
+def main(mastodon=None, run=None):
+    """`mastodon`, when given, is the client of the bot's own instance. Stages
+    done by an earlier attempt of the day's run are skipped."""
     date_str = time.strftime("%Y-%m-%d", time.localtime())
+    run = run or artifacts.Run(date_str)
+
+    toots = stage_ingest(run, mastodon)
+    logger.info(f"Analyzing {len(toots)} toots...")
+    resolved = stage_resolve(run, toots)
+    scored = stage_score(run, toots, resolved)
+    pages = stage_fetch(run, scored)
+    clustered = stage_cluster(run, scored, pages)
+    lotd = stage_summarize(run, clustered)
+
+    logger.info(f"Summary cache: {get_summary_cache().stats()}")
+    metrics.set_info("summary_cache", get_summary_cache().stats())
+    if _fetcher is not None:
+        logger.info(f"Page fetches: {_fetcher.stats}")
+        metrics.set_info("fetcher", _fetcher.stats)
+    if _browser_pool is not None:
+        logger.info(f"Browser pool: {_browser_pool.stats()}")
+        metrics.set_info("browser_pool", _browser_pool.stats())
+    if llm._llm is not None:
+        logger.info(f"LLM: {llm._llm.stats()}")
+        metrics.set_info("llm", llm._llm.stats())
 
     # Dump to disk
     with open(f"cache/lotd-{date_str}.json", "w") as f:
         json.dump(lotd, f, cls=DateTimeEncoder)
+    metrics.get_metrics().write_report(
+        f"cache/run-get_toots-{date_str}.json",
+        "get_toots",
+        settings.prometheus_textfile_dir,
+    )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--from-stage",
+        choices=artifacts.STAGES[: artifacts.STAGES.index("compose")],
+        help="run this stage and the ones after it again",
+    )
+    args = parser.parse_args()
+    settings.load()
+    if args.from_stage:
+        artifacts.Run(time.strftime("%Y-%m-%d", time.localtime())).reset(
+            args.from_stage
+        )
     # Find the most popular links in the toots
     main()
@@ -0,0 +1,207 @@
+"""Per-host politeness and failure memory for page fetches and DOI lookups.
+
+    scheduler = HostScheduler("cache/hosts.json")
+    with scheduler.deadline(600):
+        with scheduler.slot(url):
+            ...  # the request
+            scheduler.record(url, ok, latency)
+    scheduler.save()
+
+At most max_per_host requests to a host run at once, started at least
+min_interval apart (`limits` overrides both for some hosts). Each host has a
+health record that is kept between runs: an exponentially weighted moving
+average of its latency and its streak of failures. After failure_threshold
+failures in a row the host's circuit opens and it is skipped for `cooldown`;
+then one request is let through to probe it, which closes the circuit if it
+succeeds and opens it again if it fails. Past the deadline, no new request
+starts.
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+# Responses that say more about the host than about the page: blocked, rate
+# limited or down.
+HOST_FAILURE_STATUSES = {403, 429, 500, 502, 503, 504}
+
+
+class HostUnavailable(Exception):
+    """The request was not made: its host's circuit is open, or the deadline
+    passed."""
+
+
+class HostScheduler:
+    def __init__(
+        self,
+        path=None,
+        max_per_host=2,
+        min_interval=0.5,
+        limits=None,
+        failure_threshold=3,
+        cooldown=DAY,
+        alpha=0.3,
+    ):
+        self.path = path
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        # host -> (max requests at once, min interval)
+        self.limits = {host: tuple(limit) for host, limit in (limits or {}).items()}
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        # Weight of the latest latency in the moving average.
+        self.alpha = alpha
+        self.health = self._load()
+        self.deadline_at = None
+        self._active = Counter()
+        self._last_start = {}
+        self._probing = set()
+        self._cond = threading.Condition()
+        self.stats = defaultdict(int, {"requests": 0, "waited": 0.0})
+
+    @contextmanager
+    def slot(self, url):
+        """Wait for a slot on url's host; raises HostUnavailable instead when
+        the host is skipped or the deadline passes first."""
+        host = host_of(url)
+        max_active, min_interval = self.limits.get(
+            host, (self.max_per_host, self.min_interval)
+        )
+        start = time.time()
+        with self._cond:
+            while True:
+                now = time.time()
+                if self.deadline_at is not None and now >= self.deadline_at:
+                    self.stats["past_deadline"] += 1
+                    raise HostUnavailable("fetch deadline passed")
+                circuit = self.circuit(host, now)
+                # While a request probes a failing host, the others skip it.
+                if circuit == "open" or (
+                    circuit == "half-open" and host in self._probing
+                ):
+                    self.stats["circuit_open"] += 1
+                    raise HostUnavailable(f"{host} is failing, skipped for now")
+
+                wait = self._last_start.get(host, 0) + min_interval - now
+                if self._active[host] < max_active and wait <= 0:
+                    break
+                timeouts = [wait] if wait > 0 else []
+                if self.deadline_at is not None:
+                    timeouts.append(self.deadline_at - now)
+                self._cond.wait(min(timeouts) if timeouts else None)
+
+            self._active[host] += 1
+            self._last_start[host] = now
+            if circuit == "half-open":
+                self._probing.add(host)
+            self.stats["requests"] += 1
+            self.stats["waited"] += now - start
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[host] -= 1
+                self._probing.discard(host)
+                self._cond.notify_all()
+
+    def record(self, url, ok, latency=None):
+        """The outcome of a request to url's host: ok is False for errors and
+        HOST_FAILURE_STATUSES, which count towards opening its circuit."""
+        host = host_of(url)
+        with self._cond:
+            health = self.health.setdefault(
+                host, {"latency": None, "failures": 0, "opened_at": None}
+            )
+            if latency is not None:
+                health["latency"] = (
+                    latency
+                    if health["latency"] is None
+                    else self.alpha * latency + (1 - self.alpha) * health["latency"]
+                )
+            if ok:
+                if health["opened_at"] is not None:
+                    logger.info(f"{host} recovered")
+                health["failures"] = 0
+                health["opened_at"] = None
+                return
+            health["failures"] += 1
+            if health["failures"] >= self.failure_threshold:
+                if health["opened_at"] is None:
+                    logger.warning(
+                        f"{host} failed {health['failures']} times in a row, "
+                        f"skipping it for {self.cooldown / 3600:.0f} h"
+                    )
+                health["opened_at"] = time.time()
+
+    def circuit(self, host, now=None):
+        """The state of host's circuit: closed, open (skip the host) or
+        half-open (probe it)."""
+        health = self.health.get(host)
+        if health is None or health["opened_at"] is None:
+            return "closed"
+        if (now or time.time()) - health["opened_at"] < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def available(self, url):
+        return self.circuit(host_of(url)) != "open"
+
+    def remaining(self):
+        """Seconds left before the deadline, None without one."""
+        if self.deadline_at is None:
+            return None
+        return max(self.deadline_at - time.time(), 0)
+
+    @contextmanager
+    def deadline(self, seconds):
+        """No request starts more than `seconds` after entering."""
+        self.deadline_at = None if seconds is None else time.time() + seconds
+        try:
+            yield
+        finally:
+            self.deadline_at = None
+            with self._cond:
+                self._cond.notify_all()
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._cond:
+            data = json.dumps(self.health)
+        with open(self.path + ".tmp", "w") as f:
+            f.write(data)
+        os.replace(self.path + ".tmp", self.path)
+
+    def _load(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+
+def host_of(url):
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def interleave(urls):
+    """urls reordered so that consecutive ones are on different hosts where
+    possible, so that workers waiting on a busy host don't hold up the rest."""
+    by_host = defaultdict(list)
+    for url in urls:
+        by_host[host_of(url)].append(url)
+    queues = list(by_host.values())
+    ordered = []
+    for i in range(max(map(len, queues), default=0)):
+        ordered.extend(queue[i] for queue in queues if i < len(queue))
+    return ordered
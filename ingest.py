@@ -0,0 +1,172 @@
+"""Incremental timeline ingestion.
+
+Run this hourly: it fetches only the toots posted since the last run (using a
+min_id checkpoint under cache/) and appends their compact records to a rolling
+store, so the 24-hour window is built up gradually instead of being
+re-downloaded every day. toot_store.load_window reads the window back.
+
+ingest_sources() does the same for every timeline in settings.sources, in
+parallel, with a checkpoint per source.
+"""
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+
+import settings
+import sources
+from toot_store import TootRecord, write_records
+
+logging.basicConfig(level=logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = "cache/timeline_min_id.txt"
+# Checkpoints of the sources read by ingest_sources, one file per source.
+CHECKPOINT_DIR = "cache/checkpoints"
+STORE_PATH = "cache/toots.jsonl"
+
+
+def read_checkpoint(path=CHECKPOINT_PATH):
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_checkpoint(min_id, path=CHECKPOINT_PATH):
+    # Write-then-rename so an interrupted run never leaves a torn checkpoint.
+    with open(path + ".tmp", "w") as f:
+        f.write(str(min_id))
+    os.replace(path + ".tmp", path)
+
+
+def iter_new_toots(mastodon, min_id, timeline="local"):
+    """Yield every toot of timeline newer than min_id, by pages, oldest page
+    first.
+
+    Pacing is left to Mastodon.py,
+    which reads the X-RateLimit-* headers of every response.
+    """
+    n_toots = 0
+    pages = 0
+    while True:
+        fetched_toots = sources.timeline_page(
+            mastodon, timeline, limit=40, min_id=min_id
+        )
+        pages += 1
+        if not fetched_toots:
+            break
+
+        n_toots += len(fetched_toots)
+        yield fetched_toots
+
+        # Pages come back newest first; walk forward from the newest id.
+        min_id = max(int(toot["id"]) for toot in fetched_toots)
+
+    logger.info(f"Fetched {n_toots} new toots in {pages} pages")
+
+
+def iter_new_records(
+    mastodon, window, overlap, checkpoint_path, timeline="local", host=None
+):
+    """Yield records of the toots of timeline newer than the checkpoint, read
+    from host (see TootRecord.from_status).
+
+    `overlap` rewinds the checkpoint so that recent toots are fetched again and
+    their favourite/reblog counts stay fresh.
+    """
+    if overlap is None:
+        overlap = timedelta(hours=settings.ingest_overlap_hours)
+
+    min_id = _datetime_to_id(datetime.now(timezone.utc) - window)
+    checkpoint = read_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        # Snowflake ids carry their millisecond timestamp in the upper 48 bits.
+        overlap_ms = int(overlap.total_seconds() * 1000)
+        min_id = max(min_id, checkpoint - (overlap_ms << 16))
+
+    for page in iter_new_toots(mastodon, min_id, timeline):
+        for toot in page:
+            yield TootRecord.from_status(toot, host)
+
+
+def ingest(
+    mastodon,
+    window=timedelta(days=1),
+    overlap=None,
+    checkpoint_path=CHECKPOINT_PATH,
+    store_path=STORE_PATH,
+    timeline="local",
+):
+    """Append records of the toots newer than the checkpoint to the store,
+    advance the checkpoint, returns the new records."""
+    records = write_records(
+        iter_new_records(mastodon, window, overlap, checkpoint_path, timeline),
+        store_path,
+    )
+    if records:
+        write_checkpoint(max(record.id for record in records), checkpoint_path)
+    return records
+
+
+def ingest_sources(
+    clients,
+    window=timedelta(days=1),
+    overlap=None,
+    checkpoint_dir=CHECKPOINT_DIR,
+    store_path=STORE_PATH,
+):
+    """ingest() for every source of clients ({Source: Mastodon}) in parallel.
+    Toots seen by several sources are stored once, returns the new records."""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def checkpoint_path(source):
+        return os.path.join(checkpoint_dir, f"{source.slug}.txt")
+
+    fetched = sources.fetch_parallel(
+        clients,
+        lambda source, mastodon: list(
+            iter_new_records(
+                mastodon,
+                window,
+                overlap,
+                checkpoint_path(source),
+                source.timeline,
+                sources.account_host(source),
+            )
+        ),
+    )
+    records = write_records(
+        sources.dedupe(record for records in fetched.values() for record in records),
+        store_path,
+    )
+    # Only once the records are stored, so that a crash re-fetches them.
+    for source, source_records in fetched.items():
+        if source_records:
+            write_checkpoint(
+                max(record.id for record in source_records), checkpoint_path(source)
+            )
+    return records
+
+
+def _datetime_to_id(dt):
+    return int(dt.timestamp() * 1000) << 16
+
+
+def get_mastodon():
+    from mastodon import Mastodon
+
+    with open(".access.secret", "r") as f:
+        access_token = f.read()
+
+    return Mastodon(
+        access_token=access_token,
+        api_base_url=settings.mastodon_url,
+        ratelimit_method="wait",
+    )
+
+
+if __name__ == "__main__":
+    settings.load()
+    ingest_sources(sources.get_clients(sources.from_settings()))
@@ -0,0 +1,137 @@
+"""History of links across runs: their daily scores and the days they were
+links of the day.
+
+    history = get_link_history()
+    history.record_scores(day, scores)      # {url: (popularity, backlinks)}
+    history.record_featured(day, lotd)
+    history.featured_within(day, 7)         # urls featured the 7 days before
+    history.new_links(day)                  # first scored on day
+    history.rising(day)                     # above their average of the week
+
+Days are ISO dates ("2023-06-01"), which sort as they compare. Scores are
+keyed by (url, day), so a link's history is a range of the primary key, and
+indexed by day, so a day's links are a range of the index: the queries only
+read the rows of the day and of its links, however long the history.
+"""
+from datetime import date, timedelta
+import os
+import sqlite3
+import threading
+
+import settings
+
+
+class LinkHistory:
+    def __init__(self, path="cache/history.sqlite", keep_days=365):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS scores (url TEXT, day TEXT, popularity REAL, "
+            "backlinks INTEGER, PRIMARY KEY (url, day)) WITHOUT ROWID"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS scores_day ON scores (day, popularity)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS featured (url TEXT, day TEXT, title TEXT, "
+            "summary TEXT, tldr TEXT, PRIMARY KEY (url, day)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS featured_day ON featured (day)")
+        self.lock = threading.Lock()
+        self.keep_days = keep_days
+
+    def record_scores(self, day, scores):
+        """Replace the scores of day by {url: (popularity, backlinks)}, and
+        forget scores older than keep_days."""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM scores WHERE day = ?", (day,))
+            self.db.executemany(
+                "INSERT INTO scores VALUES (?, ?, ?, ?)",
+                (
+                    (url, day, popularity, backlinks)
+                    for url, (popularity, backlinks) in scores.items()
+                ),
+            )
+            oldest = _days_before(day, self.keep_days)
+            self.db.execute("DELETE FROM scores WHERE day < ?", (oldest,))
+
+    def record_featured(self, day, lotd):
+        """Record the links of the day. Every url of a link's cluster counts as
+        featured, so that none of them comes back the next days."""
+        rows = []
+        for link in lotd:
+            for url in link.get("cluster") or [link["url"]]:
+                rows.append(
+                    (url, day, link.get("title"), link.get("summary"), link.get("tldr"))
+                )
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO featured VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def featured_within(self, day, days):
+        """The urls featured in the `days` days before day (not on day, which
+        may be a run done again)."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT DISTINCT url FROM featured WHERE day >= ? AND day < ?",
+                (_days_before(day, days), day),
+            ).fetchall()
+        return set(url for url, in rows)
+
+    def new_links(self, day, limit=None):
+        """(url, popularity) of the links scored on day and never before, most
+        popular first."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT url, popularity FROM scores AS s INDEXED BY scores_day "
+                "WHERE day = ? AND NOT EXISTS (SELECT 1 FROM scores "
+                "WHERE url = s.url AND day < s.day) "
+                "ORDER BY popularity DESC LIMIT ?",
+                (day, -1 if limit is None else limit),
+            ).fetchall()
+
+    def rising(self, day, days=7, limit=20, min_popularity=2):
+        """(url, popularity, average) of the links scored on day above their
+        average score of the `days` days before (days without a score count as
+        zero), by how much they rose. Links first seen on day are new_links,
+        not rising ones."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT s.url, s.popularity, SUM(p.popularity) / ? AS average "
+                "FROM scores AS s INDEXED BY scores_day "
+                "JOIN scores AS p ON p.url = s.url AND p.day >= ? AND p.day < s.day "
+                "WHERE s.day = ? AND s.popularity >= ? GROUP BY s.url "
+                "HAVING s.popularity > average "
+                "ORDER BY s.popularity - average DESC LIMIT ?",
+                (days, _days_before(day, days), day, min_popularity, limit),
+            ).fetchall()
+
+    def trend(self, url, since=None):
+        """(day, popularity, backlinks) of a link, oldest first."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT day, popularity, backlinks FROM scores "
+                "WHERE url = ? AND day >= ? ORDER BY day",
+                (url, since or ""),
+            ).fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+def _days_before(day, days):
+    return (date.fromisoformat(day) - timedelta(days=days)).isoformat()
+
+
+_link_history = None
+
+
+def get_link_history():
+    global _link_history
+    if _link_history is None:
+        _link_history = LinkHistory(
+            settings.link_history_path, keep_days=settings.link_history_days
+        )
+    return _link_history
@@ -0,0 +1,329 @@
+"""Chat completions, whatever serves them.
+
+    completion = get_llm().complete(prompt, MODELS, parse=json.loads)
+    if completion is not None:
+        answer, tokens, model = completion
+
+A backend answers one request: OpenAIBackend for the OpenAI API or any
+OpenAI-compatible server (llama.cpp's, vLLM...), so that the pipeline can run
+offline (llm_backend = "local"), and mock_llm.MockBackend for tests and
+benchmarks. LLM sends requests through a backend:
+
+- at most max_concurrency at once, within a budget of tokens per minute
+  shared by every thread;
+- a request still unanswered after the hedge_percentile latency of the
+  model's recent requests is sent again, and the first answer wins (at most
+  max_concurrency / 2 of these hedges at once, on top of the requests);
+- answers that `parse` rejects are asked again from the same model before
+  trying the next one, and failed requests are retried after a delay.
+
+The openai library takes a third of a second to import, so it is imported on
+the first request rather than by every command that might summarize something.
+"""
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import json
+import logging
+import threading
+import time
+
+import metrics
+import settings
+from truncation import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are a helpful assistant. You always follow instructions."
+# Seconds between the tries of a model.
+DELAYS = (1, 2, 4, 8, 16, 32, 64, 128)
+# Room for the answer when estimating the tokens of a request.
+ANSWER_TOKENS = 500
+# Latencies of recent requests kept per model, and needed before hedging.
+LATENCY_SAMPLES = 100
+MIN_HEDGE_SAMPLES = 10
+
+
+class LLMError(Exception):
+    """A request that failed but may succeed if tried again: rate limits,
+    server errors, timeouts."""
+
+
+def get_openai():
+    """The openai module, with the API key path from settings unless a key
+    was already set (e.g. from $OPENAI_API_KEY, or by a test)."""
+    import openai
+
+    if openai.api_key is None and openai.api_key_path is None:
+        openai.api_key_path = settings.open_ai_api_key_path
+    return openai
+
+
+class OpenAIBackend:
+    """The chat completions API of OpenAI, or of the server at api_base, which
+    is asked for `model` (when given) whatever model the caller wants."""
+
+    def __init__(self, api_base=None, model=None, timeout=120):
+        self.api_base = api_base
+        self.model = model
+        self.timeout = timeout
+
+    def complete(self, model, messages, json_mode=False):
+        """(content, tokens used) of a chat completion."""
+        openai = get_openai()
+        kwargs = {}
+        if self.api_base is not None:
+            # Local servers don't check the key, but the library wants one.
+            kwargs.update(api_base=self.api_base, api_key="local")
+        if json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        try:
+            response = openai.ChatCompletion.create(
+                model=self.model or model,
+                messages=messages,
+                request_timeout=self.timeout,
+                **kwargs,
+            )
+        except (
+            openai.error.APIError,
+            openai.error.APIConnectionError,
+            openai.error.RateLimitError,
+            openai.error.ServiceUnavailableError,
+            openai.error.Timeout,
+        ) as e:
+            raise LLMError(str(e)) from e
+        content = response["choices"][0]["message"]["content"]
+        return content, response.get("usage", {}).get("total_tokens", 0)
+
+
+class TokenBudget:
+    """Tokens per minute shared by threads: a request waits until the tokens
+    of the requests of the last minute leave room for its estimate, which is
+    corrected once its usage is known."""
+
+    def __init__(self, tokens_per_minute):
+        self.tokens_per_minute = tokens_per_minute
+        # [start, tokens] of the requests of the last minute
+        self.window = deque()
+        self.used = 0
+        self.waited = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens):
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self.window and self.window[0][0] <= now - 60:
+                    self.used -= self.window.popleft()[1]
+                # A request larger than the budget goes alone.
+                if not self.window or self.used + tokens <= self.tokens_per_minute:
+                    break
+                self._cond.wait(self.window[0][0] + 60 - now)
+            entry = [now, tokens]
+            self.window.append(entry)
+            self.used += tokens
+            self.waited += now - start
+        return entry
+
+    def settle(self, entry, tokens):
+        with self._cond:
+            if self.window and entry[0] >= self.window[0][0]:
+                self.used += tokens - entry[1]
+                entry[1] = tokens
+            self._cond.notify_all()
+
+
+class Slot:
+    """A slot of a concurrency limit, released once: when its request ends,
+    or earlier when a hedge answered for it."""
+
+    def __init__(self, semaphore):
+        self.semaphore = semaphore
+        self.held = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        self.semaphore.acquire()
+        with self._lock:
+            self.held = True
+
+    def release(self):
+        with self._lock:
+            if self.held:
+                self.held = False
+                self.semaphore.release()
+
+
+class LLM:
+    def __init__(
+        self,
+        backend,
+        tokens_per_minute=90_000,
+        max_concurrency=4,
+        hedge_percentile=0.95,
+        json_mode=False,
+    ):
+        self.backend = backend
+        self.budget = TokenBudget(tokens_per_minute)
+        self.hedge_percentile = hedge_percentile
+        # Whether the backend supports response_format json_object.
+        self.json_mode = json_mode
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._hedges = threading.BoundedSemaphore(max(1, max_concurrency // 2))
+        # Hedges run alongside the requests they hedge.
+        self._pool = ThreadPoolExecutor(2 * max_concurrency)
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+        self._lock = threading.Lock()
+
+    def complete(self, prompt, models, parse=None, delays=DELAYS, json_object=False):
+        """(answer, tokens used, model) from the first of `models` that
+        answers, None if none did. The answer is the content of the
+        completion, or what parse makes of it; parse raises ValueError on
+        answers it rejects, which are asked again once. json_object is for
+        prompts whose answer is a JSON object, which JSON mode enforces."""
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+        json_mode = json_object and self.json_mode
+        estimate = count_tokens(prompt) + ANSWER_TOKENS
+        for model in models:
+            invalid = 0
+            for delay in delays:
+                logger.info(f"Trying model {model}")
+                try:
+                    content, tokens = self._hedged(model, messages, json_mode, estimate)
+                except LLMError as e:
+                    logger.warning(f"Failed to get response from model {model}: {e}")
+                    metrics.incr(f"llm.retries.{model}")
+                    logger.warning(f"Retrying in {delay} seconds.")
+                    time.sleep(delay)
+                    continue
+                if parse is None:
+                    return content, tokens, model
+                try:
+                    return parse(content), tokens, model
+                except ValueError:
+                    logger.warning(f"Invalid answer from model {model}")
+                    metrics.incr(f"llm.invalid.{model}")
+                    invalid += 1
+                    if invalid > 1:
+                        break
+        return None
+
+    def _hedged(self, model, messages, json_mode, estimate):
+        """A request, sent again if it is slower than usual once sent."""
+        request = (model, messages, json_mode, estimate)
+        sent = threading.Event()
+        slot = Slot(self._slots)
+        first = self._pool.submit(self._request, *request, slot, sent)
+        futures = [first]
+        hedge_after = self.hedge_after(model)
+        if hedge_after is not None:
+            sent.wait()
+            wait(futures, timeout=hedge_after)
+            # Hedges don't wait for a slot, there are few of them instead.
+            while not first.done():
+                if self._hedges.acquire(timeout=hedge_after):
+                    logger.info(f"Hedging a slow request to {model}")
+                    metrics.incr(f"llm.hedged.{model}")
+                    hedge = self._pool.submit(self._request, *request)
+                    hedge.add_done_callback(lambda future: self._hedges.release())
+                    futures.append(hedge)
+                    break
+        while True:
+            done, pending = wait(futures, return_when=FIRST_COMPLETED)
+            answered = [future for future in done if future.exception() is None]
+            if answered or not pending:
+                future = (answered or list(done))[0]
+                if future is not first:
+                    metrics.incr(f"llm.hedge_won.{model}")
+                    # The request left behind no longer holds up others.
+                    slot.release()
+                return future.result()
+            futures = pending
+
+    def _request(self, model, messages, json_mode, estimate, slot=None, sent=None):
+        entry = self.budget.acquire(estimate)
+        tokens = 0
+        if slot is not None:
+            slot.acquire()
+        try:
+            if sent is not None:
+                sent.set()
+            metrics.incr(f"llm.requests.{model}")
+            start = time.monotonic()
+            with metrics.span(f"llm.{model}"):
+                content, tokens = self.backend.complete(model, messages, json_mode)
+            with self._lock:
+                self._latencies[model].append(time.monotonic() - start)
+        finally:
+            if slot is not None:
+                slot.release()
+            self.budget.settle(entry, tokens)
+        metrics.incr(f"llm.tokens.{model}", tokens)
+        return content, tokens
+
+    def hedge_after(self, model):
+        """Seconds after which a request to model is sent again, None until
+        enough requests were timed."""
+        if self.hedge_percentile is None:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies[model])
+        if len(latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        return latencies[int(self.hedge_percentile * (len(latencies) - 1))]
+
+    def stats(self):
+        with self._lock:
+            models = list(self._latencies)
+        return {
+            "budget_waited": self.budget.waited,
+            "hedge_after": {model: self.hedge_after(model) for model in models},
+        }
+
+
+def parse_json_object(content):
+    answer = json.loads(content)
+    if not isinstance(answer, dict):
+        raise ValueError(f"Expected a JSON object, got {type(answer).__name__}")
+    return answer
+
+
+def parse_json_array(content):
+    answer = json.loads(content)
+    if not isinstance(answer, list):
+        raise ValueError(f"Expected a JSON array, got {type(answer).__name__}")
+    return answer
+
+
+def get_backend(name):
+    if name == "openai":
+        return OpenAIBackend()
+    if name == "local":
+        return OpenAIBackend(settings.llm_api_base, settings.llm_local_model)
+    if name == "mock":
+        import mock_llm
+
+        return mock_llm.MockBackend()
+    raise ValueError(f"Unknown LLM backend {name!r}")
+
+
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    """The LLM shared by every thread, so that they share its limits."""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            _llm = LLM(
+                get_backend(settings.llm_backend),
+                tokens_per_minute=settings.llm_tokens_per_minute,
+                max_concurrency=settings.llm_max_concurrency,
+                hedge_percentile=settings.llm_hedge_percentile,
+                json_mode=settings.llm_json_mode,
+            )
+    return _llm
@@ -0,0 +1,191 @@
+"""The command line of the bot.
+
+    python lotd.py ingest            # hourly, with incremental_ingest
+    python lotd.py summarize         # the links of the day
+    python lotd.py post [--dry-run]  # the digest thread
+    python lotd.py boost             # boost the digest again
+    python lotd.py backfill DUMP...  # candidate links of past days
+    python lotd.py trends [--date D]  # new and rising links of a day
+    python lotd.py bench [name] [args...]
+
+Settings are loaded from settings.toml or --settings, and LOTD_<NAME>
+environment variables (see settings.py). Each command imports what it runs
+only once it is chosen, so that none of them pays for the dependencies of the
+others (OpenAI, Selenium, Mastodon.py, Beautiful Soup); test_startup.py checks
+the import times.
+"""
+import argparse
+import glob
+import importlib
+import logging
+import os
+import sys
+import time
+
+import artifacts
+import settings
+
+
+def ingest(args):
+    import ingest
+    import sources
+
+    ingest.ingest_sources(sources.get_clients(sources.from_settings()))
+
+
+def summarize(args):
+    import get_toots
+
+    if args.from_stage:
+        artifacts.Run(time.strftime("%Y-%m-%d", time.localtime())).reset(
+            args.from_stage
+        )
+    get_toots.main()
+
+
+def post(args):
+    import post_toots
+
+    post_toots.main(dry_run=args.dry_run)
+
+
+def boost(args):
+    import boost_digest
+
+    boost_digest.main()
+
+
+def backfill(args):
+    import backfill
+    import sources
+
+    backfill.backfill(
+        args.dumps,
+        args.out or settings.backfill_dir,
+        workers=args.workers,
+        resolve=None if args.no_doi else resolve_dois,
+        candidates=settings.candidate_links,
+        excluded=(settings.mastodon_url,)
+        + tuple(source.instance for source in sources.from_settings()),
+    )
+
+
+def resolve_dois(dois):
+    import get_toots
+
+    resolved = get_toots.get_doi_resolver().resolve_many(dois)
+    get_toots.get_host_scheduler().save()
+    return resolved
+
+
+def trends(args):
+    from link_history import get_link_history
+
+    day = args.date or time.strftime("%Y-%m-%d", time.localtime())
+    history = get_link_history()
+    print(f"New on {day}:")
+    for url, popularity in history.new_links(day, limit=args.limit):
+        print(f"  {popularity:8.1f}  {url}")
+    print(f"Rising on {day} (popularity, average of the week before):")
+    for url, popularity, average in history.rising(day, limit=args.limit):
+        print(f"  {popularity:8.1f}  {average:8.1f}  {url}")
+    days = settings.repeat_days
+    featured = history.featured_within(day, days)
+    print(f"Links of the day of the {days} days before: {len(featured)}")
+
+
+def bench(args):
+    """Run bench_<name>.py: its main() with the remaining arguments, or
+    pytest-benchmark for those written as tests."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    names = sorted(
+        os.path.basename(path)[len("bench_") : -len(".py")]
+        for path in glob.glob(os.path.join(here, "bench_*.py"))
+    )
+    if args.name is None:
+        print("\n".join(names))
+        return
+    if args.name not in names:
+        sys.exit(f"No benchmark {args.name!r}, try one of: {', '.join(names)}")
+
+    path = os.path.join(here, f"bench_{args.name}.py")
+    module = importlib.import_module(f"bench_{args.name}")
+    if hasattr(module, "main"):
+        sys.argv = [path] + args.args
+        module.main()
+    else:
+        import pytest
+
+        sys.exit(pytest.main([path] + args.args))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="lotd", description=__doc__.split("\n")[0])
+    parser.add_argument("--settings", help="TOML file of settings")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("ingest", help="read new toots into the rolling store")
+
+    parser_summarize = commands.add_parser(
+        "summarize", help="find and summarize the links of the day"
+    )
+    parser_summarize.add_argument(
+        "--from-stage",
+        choices=artifacts.STAGES[: artifacts.STAGES.index("compose")],
+        help="run this stage and the ones after it again",
+    )
+
+    parser_post = commands.add_parser("post", help="post the digest thread")
+    parser_post.add_argument(
+        "--dry-run",
+        action="store_true",
+        default=None,
+        help="render the thread to cache/run-<date>/thread.html, post nothing",
+    )
+
+    commands.add_parser("boost", help="boost today's digest again")
+
+    parser_backfill = commands.add_parser(
+        "backfill", help="candidate links of each day of archived toots"
+    )
+    parser_backfill.add_argument(
+        "dumps", nargs="+", help="JSON arrays of statuses, or JSONL of toots"
+    )
+    parser_backfill.add_argument(
+        "--out", help="directory of the candidate files (backfill_dir by default)"
+    )
+    parser_backfill.add_argument(
+        "--workers", type=int, help="processes (one per core by default)"
+    )
+    parser_backfill.add_argument(
+        "--no-doi", action="store_true", help="count DOI links without resolving them"
+    )
+
+    parser_trends = commands.add_parser(
+        "trends", help="new and rising links of a day, from the link history"
+    )
+    parser_trends.add_argument("--date", help="YYYY-MM-DD, today by default")
+    parser_trends.add_argument(
+        "--limit", type=int, default=20, help="links per list (default: 20)"
+    )
+
+    parser_bench = commands.add_parser("bench", help="run a benchmark")
+    parser_bench.add_argument("name", nargs="?", help="list them when omitted")
+    parser_bench.add_argument("args", nargs=argparse.REMAINDER)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    settings.load(args.settings)
+    {
+        "ingest": ingest,
+        "summarize": summarize,
+        "post": post,
+        "boost": boost,
+        "backfill": backfill,
+        "trends": trends,
+        "bench": bench,
+    }[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
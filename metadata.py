@@ -0,0 +1,110 @@
+"""Summaries of well-annotated pages from their <head>, without the LLM.
+
+Papers on arXiv, bioRxiv, publisher sites... carry their title and abstract in
+citation_* (Highwire), Dublin Core or Open Graph <meta> tags. Only the <head> is
+parsed, so the cleanup of the rest of the page is skipped too:
+
+    head = read_head(html)
+    summary = summary_from_head(url, head)  # None without enough metadata
+
+The summary has every key of an LLM summary but the tldr, which still takes a
+(much shorter) LLM request, or is the start of the abstract when that fails.
+"""
+from html.parser import HTMLParser
+import re
+
+from hosts import host_of
+
+HEAD_END_RE = re.compile(r"</head\s*>|<body[\s>]", re.IGNORECASE)
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# <meta> tags of each field, by decreasing preference.
+TITLE_META = ("citation_title", "dc.title", "og:title")
+WEBSITE_META = ("og:site_name", "citation_journal_title", "citation_publisher")
+ABSTRACT_META = ("citation_abstract", "dc.description")
+DESCRIPTION_META = ("og:description", "description")
+# Any of these marks the page as a paper.
+SCHOLARLY_META = ("citation_title", "citation_doi", "citation_arxiv_id")
+
+
+class HeadParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.meta = {}
+        self.title_parts = []
+        self.in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            key = (attrs.get("name") or attrs.get("property") or "").lower()
+            content = " ".join((attrs.get("content") or "").split())
+            if key and content:
+                self.meta.setdefault(key, content)
+        elif tag == "title":
+            self.in_title = True
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self.in_title = False
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title_parts.append(data)
+
+
+def read_head(html):
+    """The <meta> tags and <title> of a page, and how many characters were
+    parsed to read them: up to </head>, or <body> when it isn't closed."""
+    end = HEAD_END_RE.search(html)
+    head = html[: end.end()] if end else html
+    parser = HeadParser()
+    parser.feed(head)
+    parser.close()
+    return {
+        "meta": parser.meta,
+        "title": " ".join("".join(parser.title_parts).split()),
+        "parsed": len(head),
+    }
+
+
+def summary_from_head(url, head, min_description=200):
+    """website, title, summary, is_scientific_article and is_news of a page
+    from its head, or None when it lacks a title or an abstract. A generic
+    description only counts as an abstract past min_description characters,
+    shorter ones are teasers."""
+    meta = head["meta"]
+    title = _first(meta, TITLE_META)
+    summary = _first(meta, ABSTRACT_META)
+    if summary is None:
+        description = _first(meta, DESCRIPTION_META)
+        if description and len(description) >= min_description:
+            summary = description
+    if title is None or summary is None:
+        return None
+
+    is_scientific_article = any(key in meta for key in SCHOLARLY_META)
+    return {
+        "website": _first(meta, WEBSITE_META) or host_of(url),
+        "title": title,
+        "is_scientific_article": is_scientific_article,
+        # Like the LLM's, true for blog posts too.
+        "is_news": not is_scientific_article and meta.get("og:type") == "article",
+        "summary": summary,
+    }
+
+
+def fallback_tldr(summary, max_chars=300):
+    """The first two sentences of an abstract, cut at a word past max_chars:
+    the tldr of a page when the LLM didn't write one."""
+    tldr = " ".join(SENTENCE_END_RE.split(summary)[:2])
+    if len(tldr) > max_chars:
+        tldr = tldr[:max_chars].rsplit(" ", 1)[0] + "…"
+    return tldr
+
+
+def _first(meta, keys):
+    for key in keys:
+        if meta.get(key):
+            return meta[key]
+    return None
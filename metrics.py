@@ -0,0 +1,165 @@
+"""Timings and counters for a run, written out as a report at the end.
+
+    with metrics.span("summarize_webpage"):
+        ...
+    metrics.incr("openai.tokens", tokens)
+
+Spans record how long each call took, counters add up retries, bytes,
+tokens... and `info` holds the stats of the caches and pools. write_report()
+dumps it all as JSON, and optionally as a Prometheus textfile for
+node_exporter's textfile collector.
+"""
+import collections
+from contextlib import contextmanager
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.spans = collections.defaultdict(list)
+        self.counters = collections.Counter()
+        self.info = {}
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.spans[name].append(elapsed)
+
+    def timed(self, name):
+        """Decorator recording a span for every call of a function."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def incr(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def set_info(self, name, value):
+        with self.lock:
+            self.info[name] = value
+
+    def report(self):
+        with self.lock:
+            spans = {name: sorted(times) for name, times in self.spans.items()}
+            counters = dict(self.counters)
+            info = dict(self.info)
+        return {
+            "started_at": self.started_at,
+            "wall_time": time.time() - self.started_at,
+            "spans": {
+                name: {
+                    "count": len(times),
+                    "total": sum(times),
+                    "mean": sum(times) / len(times),
+                    "p95": times[int(0.95 * (len(times) - 1))],
+                    "max": times[-1],
+                }
+                for name, times in spans.items()
+            },
+            "counters": counters,
+            "info": info,
+        }
+
+    def prometheus(self, job):
+        """The report in the Prometheus text exposition format."""
+        report = self.report()
+        lines = [
+            "# TYPE lotd_run_wall_seconds gauge",
+            f'lotd_run_wall_seconds{{job="{job}"}} {report["wall_time"]}',
+            "# TYPE lotd_run_started_seconds gauge",
+            f'lotd_run_started_seconds{{job="{job}"}} {report["started_at"]}',
+            "# TYPE lotd_span_seconds summary",
+        ]
+        for name, span in sorted(report["spans"].items()):
+            labels = f'job="{job}",span="{name}"'
+            lines.append(f"lotd_span_seconds_sum{{{labels}}} {span['total']}")
+            lines.append(f"lotd_span_seconds_count{{{labels}}} {span['count']}")
+        lines.append("# TYPE lotd_events_total counter")
+        for name, value in sorted(report["counters"].items()):
+            lines.append(
+                f'lotd_events_total{{job="{job}",name="{_label(name)}"}} {value}'
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path, job, prometheus_dir=None):
+        """Write the JSON report to path, and job.prom to prometheus_dir."""
+        _write_atomic(path, json.dumps(self.report(), indent=2))
+        logger.info(f"Run report written to {path}")
+        if prometheus_dir:
+            _write_atomic(
+                os.path.join(prometheus_dir, f"lotd_{job}.prom"), self.prometheus(job)
+            )
+
+
+def _label(value):
+    return re.sub(r'["\\\n]', "_", str(value))
+
+
+def _write_atomic(path, text):
+    # The textfile collector may read the file at any time.
+    with open(path + ".tmp", "w") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+
+# The metrics of the current process.
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def reset():
+    """Start over with empty metrics, e.g. between two runs in one process."""
+    global _metrics
+    _metrics = Metrics()
+
+
+def span(name):
+    return _metrics.span(name)
+
+
+def timed(name):
+    """Like Metrics.timed, on whatever the current metrics are at call time."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def incr(name, n=1):
+    _metrics.incr(name, n)
+
+
+def set_info(name, value):
+    _metrics.set_info(name, value)
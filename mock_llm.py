@@ -0,0 +1,157 @@
+"""A local stand-in for the OpenAI chat completions API, used by tests and
+benchmarks.
+
+Answers the summarization prompts of get_toots, single or batched, with
+made-up summaries after a configurable latency, and counts requests. Answers
+recorded from the real API (see replay.py) are returned for their prompts.
+
+    openai.api_base = base_url  # as returned by serve()
+
+or in-process, as an llm.py backend: llm.LLM(MockBackend(MockLLM())).
+"""
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+WEBSITE_RE = re.compile(r"^url: (.*)\ntitle: (.*)$", re.MULTILINE)
+
+
+def prompt_key(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class MockLLM:
+    def __init__(self, latency=0.0, latency_per_page=0.0, malformed=(), responses=None):
+        self.latency = latency
+        self.latency_per_page = latency_per_page
+        # Recorded answers, by prompt_key.
+        self.responses = responses or {}
+        # URLs whose entries come back broken in batched answers.
+        self.malformed = set(malformed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.pages = 0
+
+    def summary(self, url, title):
+        host = urlparse(url).netloc
+        return {
+            "website": host,
+            "title": title or host,
+            "is_scientific_article": "rxiv" in host,
+            "is_news": "news" in host,
+            "summary": f"What {title} is about, in a few sentences.",
+            "tldr": f"{title}, in short.",
+        }
+
+    def complete(self, prompt):
+        """(content, prompt tokens, completion tokens) for a prompt."""
+        websites = WEBSITE_RE.findall(prompt)
+        with self.lock:
+            self.requests += 1
+            self.pages += len(websites)
+        time.sleep(self.latency + self.latency_per_page * len(websites))
+
+        if prompt_key(prompt) in self.responses:
+            content = self.responses[prompt_key(prompt)]
+        elif "json array" in prompt:
+            entries = []
+            for i, (url, title) in enumerate(websites):
+                if url in self.malformed:
+                    entries.append({"index": i, "title": title})
+                else:
+                    entries.append({"index": i, **self.summary(url, title)})
+            content = json.dumps(entries)
+        elif websites:
+            content = json.dumps(self.summary(*websites[0]))
+        else:
+            content = "Science, more science, and bats."
+        return content, len(prompt) // 4, len(content) // 4
+
+
+class MockBackend:
+    """An llm.py backend answering with a MockLLM in-process, without HTTP.
+    Requests take up to `jitter` seconds longer, and every slow_every-th one
+    slow_latency longer."""
+
+    def __init__(self, llm=None, jitter=0.0, slow_every=None, slow_latency=0.0):
+        self.llm = llm or MockLLM()
+        self.jitter = jitter
+        self.slow_every = slow_every
+        self.slow_latency = slow_latency
+        self.rng = random.Random(0)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def complete(self, model, messages, json_mode=False):
+        with self.lock:
+            self.calls += 1
+            slow = self.slow_every and self.calls % self.slow_every == 0
+            delay = self.rng.uniform(0, self.jitter)
+        time.sleep(delay + (self.slow_latency if slow else 0))
+        content, prompt_tokens, completion_tokens = self.llm.complete(
+            messages[-1]["content"]
+        )
+        return content, prompt_tokens + completion_tokens
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length))
+        if not self.path.endswith("/chat/completions"):
+            self.send_json({"error": {"message": "Not found"}}, 404)
+            return
+        prompt = request["messages"][-1]["content"]
+        content, prompt_tokens, completion_tokens = self.server.llm.complete(prompt)
+        self.send_json(
+            {
+                "id": f"chatcmpl-{self.server.llm.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+        )
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(llm, port=0):
+    """Start a mock API in a background thread, returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.llm = llm
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 8002), Handler)
+    server.llm = MockLLM(latency=1.0)
+    print("Mock LLM listening on http://127.0.0.1:8002/v1")
+    server.serve_forever()
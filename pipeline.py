@@ -0,0 +1,129 @@
+"""A small staged pipeline: bounded worker pools connected by queues.
+
+Each item flows through the stages in order, and each stage has its own
+number of workers, so a slow LLM call for one link overlaps with the fetches
+of the next ones. A stage can also take items in batches, e.g. to pack
+several pages into one LLM request. Results come back in input order.
+"""
+import collections
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+# `func` takes the output of the previous stage; returning None drops the item.
+# With a batch_size, `func` takes a list of up to batch_size outputs and
+# returns a list of the same length.
+Stage = collections.namedtuple(
+    "Stage", ["name", "func", "workers", "batch_size"], defaults=[1, None]
+)
+
+
+def run_pipeline(items, stages):
+    """Push items through stages, returns (results, report).
+
+    results[i] is the output of the last stage for items[i], or None if a
+    stage dropped it or raised. report has wall time and per-stage timings.
+    """
+    start = time.time()
+    queues = [queue.Queue() for _ in range(len(stages) + 1)]
+    timings = {stage.name: [] for stage in stages}
+    lock = threading.Lock()
+
+    def worker(stage, inbox, outbox):
+        while True:
+            job = inbox.get()
+            if job is _DONE:
+                break
+            i, payload = job
+            if payload is not None:
+                t0 = time.time()
+                try:
+                    payload = stage.func(payload)
+                except Exception:
+                    logger.exception(f"Stage {stage.name} failed on item {i}")
+                    payload = None
+                with lock:
+                    timings[stage.name].append(time.time() - t0)
+            outbox.put((i, payload))
+
+    def batch_worker(stage, inbox, outbox):
+        done = False
+        while not done:
+            # Wait until the batch is full or the previous stage is drained.
+            batch = []
+            while len(batch) < stage.batch_size:
+                job = inbox.get()
+                if job is _DONE:
+                    done = True
+                    break
+                i, payload = job
+                if payload is None:
+                    outbox.put(job)
+                else:
+                    batch.append(job)
+            if not batch:
+                continue
+            t0 = time.time()
+            try:
+                payloads = stage.func([payload for _, payload in batch])
+            except Exception:
+                logger.exception(
+                    f"Stage {stage.name} failed on items {[i for i, _ in batch]}"
+                )
+                payloads = [None] * len(batch)
+            with lock:
+                timings[stage.name].append(time.time() - t0)
+            for (i, _), payload in zip(batch, payloads):
+                outbox.put((i, payload))
+
+    stage_threads = []
+    for stage, inbox, outbox in zip(stages, queues, queues[1:]):
+        threads = [
+            threading.Thread(
+                target=worker if stage.batch_size is None else batch_worker,
+                args=(stage, inbox, outbox),
+                daemon=True,
+            )
+            for _ in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        stage_threads.append(threads)
+
+    for job in enumerate(items):
+        queues[0].put(job)
+
+    # Shut the stages down one after the other, once the previous one is drained.
+    for inbox, threads in zip(queues, stage_threads):
+        for _ in threads:
+            inbox.put(_DONE)
+        for thread in threads:
+            thread.join()
+
+    results = [None] * len(items)
+    while not queues[-1].empty():
+        i, payload = queues[-1].get()
+        results[i] = payload
+
+    report = {
+        "items": len(items),
+        "completed": sum(result is not None for result in results),
+        "wall_time": time.time() - start,
+        "stages": {
+            stage.name: {
+                "workers": stage.workers,
+                "batch_size": stage.batch_size,
+                "calls": len(timings[stage.name]),
+                "busy_time": sum(timings[stage.name]),
+                "max_time": max(timings[stage.name], default=0.0),
+            }
+            for stage in stages
+        },
+    }
+    return results, report
@@ -0,0 +1,236 @@
+"""Incremental link popularity over sliding windows.
+
+Each toot contributes its favourites + reblogs to the links it counts for.
+Contributions are kept in hourly buckets, so the score of a link over any
+window (1h, 24h, 7d...) can be read from the same index, and running totals
+are maintained for the windows queried every run. When a toot is seen again
+with new counts, only the difference is applied, so an hourly run costs the
+delta rather than a rebuild. A time-decayed score (exponential, with a
+half-life) is maintained alongside.
+
+Top-k queries use heapq.nlargest on the running totals rather than sorting
+every link.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime
+import heapq
+import logging
+import math
+import os
+import pickle
+
+logger = logging.getLogger(__name__)
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+
+class PopularityIndex:
+    def __init__(
+        self,
+        windows=(HOUR, DAY, WEEK),
+        half_life=6 * HOUR,
+        bucket_seconds=HOUR,
+        retention=None,
+    ):
+        self.windows = tuple(windows)
+        self.half_life = half_life
+        self.bucket_seconds = bucket_seconds
+        # Toots older than this are forgotten.
+        self.retention = retention or max(self.windows)
+        self._retention_buckets = self._n_buckets(self.retention)
+        self.now_bucket = None
+        # toot id -> (timestamp, links, score)
+        self.toots = {}
+        # bucket -> link -> score, and bucket -> toot ids
+        self.buckets = defaultdict(Counter)
+        self.bucket_toots = defaultdict(set)
+        # window -> link -> score over the window's buckets
+        self.totals = {window: Counter() for window in self.windows}
+        self._spans = [
+            (self._n_buckets(window), self.totals[window]) for window in self.windows
+        ]
+        # link -> sum of score * 2 ** ((timestamp - decay_origin) / half_life)
+        self.decayed = Counter()
+        self.decay_origin = None
+
+    def update(self, toot_id, created_at, links, score):
+        """Add a toot, or apply the change if it was seen with other counts."""
+        timestamp = _timestamp(created_at)
+        entry = (timestamp, tuple(links), score)
+        old = self.toots.get(toot_id)
+        if old == entry:
+            return
+        bucket = int(timestamp // self.bucket_seconds)
+        if self.now_bucket is None or bucket > self.now_bucket:
+            self._advance_to(bucket)
+        if bucket <= self.now_bucket - self._retention_buckets:
+            return
+
+        if old is not None:
+            self._apply(toot_id, old, -1)
+        self.toots[toot_id] = entry
+        self._apply(toot_id, entry, 1)
+
+    def advance(self, now):
+        """Move the windows forward to now, expiring what falls out."""
+        # Windows end with the bucket of the last instant before now.
+        self._advance_to(math.ceil(_timestamp(now) / self.bucket_seconds) - 1)
+
+    def _advance_to(self, new_bucket):
+        if self.now_bucket is None:
+            self.now_bucket = new_bucket
+            self.decay_origin = new_bucket * self.bucket_seconds
+            return
+        if new_bucket <= self.now_bucket:
+            return
+
+        for window in self.windows:
+            n = self._n_buckets(window)
+            # Buckets older than the window's new start leave it.
+            start = self.now_bucket - n + 1
+            for bucket in range(start, min(new_bucket - n + 1, self.now_bucket + 1)):
+                _subtract(self.totals[window], self.buckets.get(bucket, {}))
+
+        self.now_bucket = new_bucket
+        oldest = new_bucket - self._retention_buckets + 1
+        for bucket in [b for b in self.bucket_toots if b < oldest]:
+            for toot_id in self.bucket_toots.pop(bucket, ()):
+                timestamp, links, score = self.toots.pop(toot_id)
+                weight = self._decay_weight(timestamp)
+                for link in links:
+                    self.decayed[link] -= score * weight
+                    if self.decayed[link] <= 1e-9:
+                        del self.decayed[link]
+            self.buckets.pop(bucket, None)
+
+        # Keep the decay weights within float range.
+        if new_bucket * self.bucket_seconds - self.decay_origin > 100 * self.half_life:
+            self._rebase_decay(new_bucket * self.bucket_seconds)
+
+    def score(self, link, window=DAY):
+        if window in self.totals:
+            return self.totals[window].get(link, 0)
+        return sum(
+            self.buckets.get(b, {}).get(link, 0) for b in self._window_buckets(window)
+        )
+
+    def top(self, k, window=DAY):
+        """The k links with the highest score over window, as (link, score)."""
+        if window in self.totals:
+            totals = self.totals[window]
+        else:
+            totals = Counter()
+            for bucket in self._window_buckets(window):
+                totals.update(self.buckets.get(bucket, {}))
+        return heapq.nlargest(k, totals.items(), key=lambda x: x[1])
+
+    def top_decayed(self, k, now=None, links=None):
+        """The k links with the highest time-decayed score, as (link, score),
+        among links when given (the index keeps links of the whole retention
+        period)."""
+        if now is None:
+            now = (self.now_bucket + 1) * self.bucket_seconds
+        scale = 2 ** ((self.decay_origin - _timestamp(now)) / self.half_life)
+        if links is None:
+            scores = self.decayed.items()
+        else:
+            scores = (
+                (link, self.decayed[link]) for link in links if link in self.decayed
+            )
+        return [
+            (link, score * scale)
+            for link, score in heapq.nlargest(k, scores, key=lambda x: x[1])
+        ]
+
+    def save(self, path):
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """The index saved at path, or a new one built with kwargs when there
+        is none or kwargs ask for other windows, half-life or buckets than it
+        was built with."""
+        new = cls(**kwargs)
+        try:
+            with open(path, "rb") as f:
+                index = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return new
+        if kwargs and index.config() != new.config():
+            logger.warning(
+                f"Popularity index at {path} was built with {index.config()}, "
+                f"not {new.config()}: rebuilding it"
+            )
+            return new
+        logger.info(f"Loaded popularity index with {len(index.toots)} toots")
+        return index
+
+    def config(self):
+        return {
+            "windows": self.windows,
+            "half_life": self.half_life,
+            "bucket_seconds": self.bucket_seconds,
+            "retention": self.retention,
+        }
+
+    def _apply(self, toot_id, entry, sign):
+        timestamp, links, score = entry
+        bucket = int(timestamp // self.bucket_seconds)
+        delta = sign * score
+        if sign > 0:
+            self.bucket_toots[bucket].add(toot_id)
+        else:
+            self.bucket_toots[bucket].discard(toot_id)
+        counts = self.buckets[bucket]
+        weighted = delta * self._decay_weight(timestamp)
+        age = self.now_bucket - bucket
+        spans = [totals for n, totals in self._spans if age < n]
+        for link in links:
+            counts[link] += delta
+            self.decayed[link] += weighted
+            for totals in spans:
+                totals[link] += delta
+        if delta <= 0:
+            _drop_zeros(counts, links)
+            _drop_zeros(self.decayed, links)
+            for window in self.windows:
+                _drop_zeros(self.totals[window], links)
+
+    def _rebase_decay(self, origin):
+        scale = 2 ** ((self.decay_origin - origin) / self.half_life)
+        for link in self.decayed:
+            self.decayed[link] *= scale
+        self.decay_origin = origin
+
+    def _decay_weight(self, timestamp):
+        return 2 ** ((timestamp - self.decay_origin) / self.half_life)
+
+    def _n_buckets(self, window):
+        return math.ceil(window / self.bucket_seconds)
+
+    def _window_buckets(self, window):
+        start = self.now_bucket - self._n_buckets(window) + 1
+        return range(start, self.now_bucket + 1)
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+def _subtract(totals, counts):
+    for link, score in counts.items():
+        totals[link] -= score
+        if totals[link] <= 0:
+            del totals[link]
+
+
+def _drop_zeros(counter, links):
+    for link in links:
+        if link in counter and counter[link] <= 1e-9:
+            del counter[link]
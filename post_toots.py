@@ -1,44 +1,17 @@
-import json
+import argparse
 import logging
 import time
 
-import openai
+import artifacts
+from composer import Composer, get_max_characters
+from llm import get_llm
+import metrics
+from publisher import DryRunPublisher, Publisher
 import settings
-import tqdm
-from mastodon import Mastodon
-
-openai.api_key_path = settings.open_ai_api_key_path
-
-
-def get_formatted_toots(lotd):
-    toots = []
-    for link in lotd:
-        accounts = ["@" + x["account"]["username"] for x in link["backlinks"]]
-        if len(accounts) == 1:
-            accounts = accounts[0]
-        elif len(accounts) > 3:
-            accounts = ", ".join(accounts[:3]) + f" and {len(accounts) - 3} others"
-        else:
-            accounts = ", ".join(accounts[:-1]) + f" and {accounts[-1]}"
-        tags = ["#lotd"]
-        if link["is_scientific_article"]:
-            tags.append("#science")
-        if link["is_news"]:
-            tags.append("#news")
-        tags = " ".join(tags)
-
-        content = f"""
-<h1><a href='{link['url']}'>{link['title']} - {link['website']}</a></h1>
-<h2>TL;DR {link['tldr']}</h2>
-<p>Linked by {accounts} ({link['popularity']}⭐)</p>
-<p>{link['summary']}</p>
-<p>{tags}</p>
-<p>Original link: <a href='{link['backlinks'][0]["uri"]}'>{link['backlinks'][0]["uri"]}</a></p>
-"""
+from summary_cache import cache_key, get_summary_cache
 
-        toots.append(content)
-    return toots
 
+@metrics.timed("summarize_together")
 def summarize_together(links):
     summaries = [link["tldr"] for link in links]
     all_together = "\n".join(summaries)
@@ -52,24 +25,19 @@ If things are mentioned multiple times, you can mention them once. Make it short
 {all_together}
 """
 
-    for delay in [1, 2, 4, 8, 16, 32, 64, 128]:
-        logger.info(f"Trying model {model}")
-        try:
-            response = openai.ChatCompletion.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant. You always follow instructions."},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-            content = response["choices"][0]["message"]["content"]
-            return content
-        except (openai.error.APIError, openai.error.RateLimitError) as e:
-            logger.warning(e)
-            logger.warning(f"Failed to get response from model {model}")
-        
-        logger.warning(f"Retrying in {delay} s")
-        time.sleep(delay)
+    summary_cache = get_summary_cache()
+    key = cache_key("digest", None, all_together)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        return cached
+
+    completion = get_llm().complete(prompt, [model])
+    if completion is None:
+        return None
+    content, tokens, model = completion
+    summary_cache.put(key, content, model, tokens)
+    return content
+
 
 logging.basicConfig(level=logging.INFO)
 
@@ -77,36 +45,92 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-if __name__ == "__main__":
-    with open(".access.secret", "r") as f:
-        access_token = f.read()
-
-    mastodon = Mastodon(
-        access_token=access_token,
-        api_base_url=settings.mastodon_url
-    )
-
-    date_str = time.strftime("%Y-%m-%d", time.localtime())
-    with open(f"cache/lotd-{date_str}.json", "r") as f:
-        lotd = json.load(f)
+@metrics.timed("stage.compose")
+def stage_compose(run, lotd, publisher):
+    """The digest toot and the toots of each link, within the instance's
+    character limit."""
+    if run.done("compose"):
+        return run.load("compose")
 
     # Generate summaries of summaries.
     logger.info("Summarizing summaries...")
     global_summary = summarize_together(lotd)
+    logger.info(f"Summary cache: {get_summary_cache().stats()}")
+    metrics.set_info("summary_cache", get_summary_cache().stats())
 
-    toots_formatted = get_formatted_toots(lotd)
+    composer = Composer(get_max_characters(publisher))
+    composed = composer.digest(lotd, global_summary, run.date_str)
+    run.save("compose", composed)
+    return composed
 
-    first_str = f'<h1>🎉 Today\'s most popular links</h1><h2>{global_summary}</h2><p>{date_str} edition</p>'
-    first_toot = mastodon.status_post(first_str)
-    first_toot_id = first_toot["id"]
 
-    with open('cache/first_toot_id.txt', 'w') as f:
-        f.write(str(first_toot_id))
+def get_publisher(mastodon=None, post_delay=1, dry_run=False):
+    if dry_run:
+        return DryRunPublisher()
+    if mastodon is not None:
+        return Publisher.from_mastodon(mastodon, min_interval=post_delay)
+    with open(".access.secret", "r") as f:
+        access_token = f.read().strip()
+    return Publisher(settings.mastodon_url, access_token, min_interval=post_delay)
+
 
-    for toot in tqdm.tqdm(toots_formatted):
-        mastodon.status_post(
-            toot,
-            in_reply_to_id=first_toot_id,
-            visibility='unlisted'
+@metrics.timed("stage.post")
+def stage_post(run, publisher, composed):
+    """Post the digest and its replies, then boost it. Every status posted is
+    recorded with its id, so a resumed run only posts what is missing."""
+    if isinstance(publisher, DryRunPublisher):
+        publisher.publish_thread(
+            composed["intro"], composed["replies"], boost=settings.boost_digest
         )
-        time.sleep(1)
+        publisher.write(run.path("thread.html"))
+        return None
+    if run.done("post"):
+        return run.load("post")
+
+    posted = publisher.publish_thread(
+        composed["intro"],
+        composed["replies"],
+        posted=run.items("post"),
+        key_prefix=f"lotd-{run.date_str}",
+        boost=settings.boost_digest,
+    )
+    logger.info(f"Publisher: {publisher.stats}")
+    metrics.set_info("publisher", publisher.stats)
+    run.save("post", posted.items)
+    return posted.items
+
+
+def main(mastodon=None, post_delay=1, run=None, dry_run=None):
+    """`mastodon`, when given, is the client of the bot's account."""
+    if dry_run is None:
+        dry_run = settings.dry_run
+    publisher = get_publisher(mastodon, post_delay, dry_run)
+
+    date_str = time.strftime("%Y-%m-%d", time.localtime())
+    run = run or artifacts.Run(date_str)
+    lotd = run.load("summarize")
+    if not lotd:
+        logger.info("No links of the day, nothing to post")
+        return
+
+    composed = stage_compose(run, lotd, publisher)
+    stage_post(run, publisher, composed)
+
+    metrics.get_metrics().write_report(
+        f"cache/run-post_toots-{date_str}.json",
+        "post_toots",
+        settings.prometheus_textfile_dir,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        default=None,
+        help="render the thread to cache/run-<date>/thread.html, post nothing",
+    )
+    args = parser.parse_args()
+    settings.load()
+    main(dry_run=args.dry_run)
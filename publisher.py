@@ -0,0 +1,241 @@
+"""Posting the digest thread: a pooled session paced by the server's
+X-RateLimit-* headers, with retries.
+
+    publisher = Publisher(settings.mastodon_url, access_token)
+    posted = publisher.publish_thread(intro, replies, boost=True)
+
+When the rate-limit budget runs out, the next request waits for the reset time
+the server announced. 429s and 5xx are retried with exponential backoff, and
+every post carries an Idempotency-Key so that a retried post is not duplicated.
+DryRunPublisher renders the thread to an HTML file instead of posting.
+"""
+from datetime import datetime
+import html
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from artifacts import ItemLog
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class PublishError(Exception):
+    pass
+
+
+class Publisher:
+    def __init__(
+        self,
+        api_base_url,
+        access_token,
+        min_interval=0.0,
+        max_retries=5,
+        backoff=1.0,
+        max_backoff=300.0,
+        timeout=(5, 20),
+    ):
+        self.api_base_url = api_base_url.rstrip("/")
+        # Posts of a thread are spaced at least this much.
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount(self.api_base_url, HTTPAdapter(pool_maxsize=4))
+        self.session.headers["Authorization"] = f"Bearer {access_token}"
+        self.lock = threading.Lock()
+        # From the X-RateLimit-* headers of the last response.
+        self.remaining = None
+        self.reset_at = None
+        self.stats = {"requests": 0, "retries": 0, "waited": 0.0}
+
+    @classmethod
+    def from_mastodon(cls, mastodon, **kwargs):
+        """A publisher for the account of a Mastodon.py client."""
+        return cls(mastodon.api_base_url, mastodon.access_token, **kwargs)
+
+    def post_status(
+        self, status, in_reply_to_id=None, visibility=None, idempotency_key=None
+    ):
+        params = {"status": status}
+        if in_reply_to_id is not None:
+            params["in_reply_to_id"] = in_reply_to_id
+        if visibility is not None:
+            params["visibility"] = visibility
+        headers = {}
+        if idempotency_key is not None:
+            headers["Idempotency-Key"] = idempotency_key
+        return self._request("POST", "/api/v1/statuses", params, headers)
+
+    def reblog(self, status_id):
+        return self._request("POST", f"/api/v1/statuses/{status_id}/reblog")
+
+    def instance(self):
+        return self._request("GET", "/api/v1/instance")
+
+    def publish_thread(
+        self, intro, replies, posted=None, key_prefix="lotd", boost=False
+    ):
+        """Post intro, then replies in reply to it, then boost the intro. A
+        reply can be a list of toots, each one in reply to the previous.
+
+        `posted` (an artifacts.ItemLog) records the id of every status posted;
+        those already in it are skipped, so a thread can be resumed. Returns
+        it.
+        """
+        posted = posted if posted is not None else ItemLog()
+        if "intro" not in posted:
+            with metrics.span("status_post"):
+                status = self.post_status(intro, idempotency_key=f"{key_prefix}-intro")
+            posted.add("intro", status["id"])
+
+        for i, reply in enumerate(replies):
+            parent = "intro"
+            parts = [reply] if isinstance(reply, str) else reply
+            for j, part in enumerate(parts):
+                key = f"reply-{i}" if j == 0 else f"reply-{i}-{j}"
+                if key not in posted:
+                    with metrics.span("status_post.sleep"):
+                        time.sleep(self.min_interval)
+                    with metrics.span("status_post"):
+                        status = self.post_status(
+                            part,
+                            in_reply_to_id=posted.get(parent),
+                            visibility="unlisted",
+                            idempotency_key=f"{key_prefix}-{key}",
+                        )
+                    posted.add(key, status["id"])
+                    metrics.incr("toots_posted")
+                parent = key
+
+        if boost and "boost" not in posted:
+            with metrics.span("status_reblog"):
+                self.reblog(posted.get("intro"))
+            posted.add("boost", posted.get("intro"))
+        return posted
+
+    def _request(self, method, path, params=None, headers=None):
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_budget()
+            with self.lock:
+                self.stats["requests"] += 1
+            try:
+                response = self.session.request(
+                    method,
+                    self.api_base_url + path,
+                    json=params,
+                    headers=headers,
+                    timeout=self.timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.warning(f"{method} {path} failed: {e}")
+            else:
+                self._read_ratelimit(response)
+                if response.status_code < 400:
+                    return response.json()
+                if response.status_code not in RETRY_STATUSES:
+                    raise PublishError(
+                        f"{method} {path}: {response.status_code} {response.text}"
+                    )
+                logger.warning(f"{method} {path}: {response.status_code}")
+                if response.status_code == 429:
+                    with self.lock:
+                        self.remaining = 0
+
+            if attempt == self.max_retries:
+                break
+            metrics.incr("publisher.retries")
+            with self.lock:
+                self.stats["retries"] += 1
+                # The next request waits for the reset; no need to back off.
+                waits_for_reset = (
+                    self.remaining == 0
+                    and self.reset_at is not None
+                    and self.reset_at > time.time()
+                )
+            if not waits_for_reset:
+                self._sleep(min(delay, self.max_backoff))
+                delay *= 2
+        raise PublishError(f"{method} {path}: giving up after {attempt + 1} attempts")
+
+    def _read_ratelimit(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        with self.lock:
+            if remaining is not None:
+                self.remaining = int(remaining)
+            if reset is not None:
+                self.reset_at = datetime.fromisoformat(
+                    reset.replace("Z", "+00:00")
+                ).timestamp()
+
+    def _wait_for_budget(self):
+        with self.lock:
+            if self.remaining is None or self.remaining > 0 or self.reset_at is None:
+                return
+            wait = self.reset_at - time.time()
+            # Spent until the reset; assume it is renewed then.
+            self.remaining = None
+        if wait > 0:
+            logger.info(f"Rate limit reached, waiting {wait:.0f} s for the reset")
+            self._sleep(min(wait, self.max_backoff))
+
+    def _sleep(self, seconds):
+        with self.lock:
+            self.stats["waited"] += seconds
+        time.sleep(seconds)
+
+
+class DryRunPublisher(Publisher):
+    """Posts nothing; write() renders the thread that would have been posted
+    as an HTML page."""
+
+    def __init__(self, **kwargs):
+        super().__init__("http://dry-run", "", **kwargs)
+        self.statuses = []
+        self.reblogged = []
+
+    def post_status(
+        self, status, in_reply_to_id=None, visibility=None, idempotency_key=None
+    ):
+        status = {
+            "id": str(len(self.statuses) + 1),
+            "content": status,
+            "in_reply_to_id": in_reply_to_id,
+            "visibility": visibility or "public",
+        }
+        self.statuses.append(status)
+        return status
+
+    def reblog(self, status_id):
+        self.reblogged.append(status_id)
+        return {"id": status_id}
+
+    def instance(self):
+        return {}
+
+    def write(self, path):
+        parts = ["<html><head><meta charset='utf-8'><title>Thread</title></head><body>"]
+        for status in self.statuses:
+            about = [f"#{status['id']}", html.escape(status["visibility"])]
+            if status["in_reply_to_id"]:
+                about.append(f"in reply to #{status['in_reply_to_id']}")
+            if status["id"] in self.reblogged:
+                about.append("boosted")
+            parts.append(
+                f"<article id='{status['id']}'><p><small>{', '.join(about)}</small></p>"
+                f"{status['content']}</article><hr>"
+            )
+        parts.append("</body></html>")
+        with open(path, "w") as f:
+            f.write("\n".join(parts))
+        logger.info(f"Dry run: thread of {len(self.statuses)} toots written to {path}")
@@ -0,0 +1,395 @@
+"""Record one real day of the bot, and replay it offline.
+
+record() runs get_toots and the post_toots flow against the real services
+and saves what they answered into a bundle directory:
+
+    toots.json   statuses from the timeline pages
+    pages.json   url -> html of the pages summarized (null if the fetch failed)
+    doi.json     doi -> landing page (null if it didn't resolve)
+    llm.json     prompt hash -> model answer
+    meta.json    when it was recorded
+
+Nothing is posted while recording. replaying() serves a bundle from local
+stand-ins (fake_mastodon, a page and DOI server, mock_llm) with configurable
+latency, and points get_toots and post_toots at them. Toots are shifted in
+time so that the recorded day ends now.
+
+    python replay.py record fixtures/replay/2023-05-01
+    python bench_pipeline.py --bundle fixtures/replay/2023-05-01
+"""
+import argparse
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from unittest import mock
+from urllib.parse import parse_qs, quote, urlparse
+
+from mastodon import Mastodon
+import openai
+
+from artifacts import DateTimeEncoder
+import browser_pool
+from canonical_url import canonicalize, strip_tracking
+from doi_resolver import DoiResolver
+from extract import extract_links
+import fake_mastodon
+from fetch import Fetcher
+import get_toots
+import ingest
+import link_history
+import llm
+import metrics
+import mock_llm
+import post_toots
+from publisher import Publisher
+import settings
+import summary_cache
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FILES = ["toots", "pages", "doi", "llm", "meta"]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.toots = {}
+        self.pages = {}
+        self.doi = {}
+        self.llm = {}
+        self.posted = []
+
+    def save(self, bundle_dir):
+        os.makedirs(bundle_dir, exist_ok=True)
+        toots = sorted(self.toots.values(), key=lambda x: int(x["id"]), reverse=True)
+        bundle = {
+            "toots": [dict(toot, id=str(toot["id"])) for toot in toots],
+            "pages": self.pages,
+            "doi": self.doi,
+            "llm": self.llm,
+            "meta": {
+                "recorded_at": datetime.now(timezone.utc).isoformat(),
+                "mastodon_url": settings.mastodon_url,
+            },
+        }
+        for name in BUNDLE_FILES:
+            with open(os.path.join(bundle_dir, f"{name}.json"), "w") as f:
+                json.dump(bundle[name], f, cls=DateTimeEncoder)
+
+
+@contextmanager
+def recording(mastodon, recorder):
+    """Capture what Mastodon, the web, doi.org and the LLM answer into
+    recorder, and swallow posts."""
+    timeline_local = mastodon.timeline_local
+    fetch_html = get_toots.fetch_html
+    fetch_doi = DoiResolver._fetch
+    create = openai.ChatCompletion.create
+
+    def record_timeline(*args, **kwargs):
+        toots = timeline_local(*args, **kwargs)
+        with recorder.lock:
+            for toot in toots:
+                recorder.toots[toot["id"]] = toot
+        return toots
+
+    def record_page(url):
+        html = fetch_html(url)
+        with recorder.lock:
+            recorder.pages[url] = html
+        return html
+
+    def record_doi(resolver, doi):
+        landing_url = fetch_doi(resolver, doi)
+        with recorder.lock:
+            recorder.doi[doi] = landing_url
+        return landing_url
+
+    def record_llm(*args, **kwargs):
+        response = create(*args, **kwargs)
+        key = mock_llm.prompt_key(kwargs["messages"][-1]["content"])
+        with recorder.lock:
+            recorder.llm[key] = response["choices"][0]["message"]["content"]
+        return response
+
+    def post_status(publisher, status, **kwargs):
+        with recorder.lock:
+            recorder.posted.append(status)
+            return {"id": str(len(recorder.posted))}
+
+    def reblog(publisher, status_id):
+        return {"id": status_id}
+
+    with ExitStack() as stack:
+        stack.enter_context(
+            mock.patch.object(mastodon, "timeline_local", record_timeline)
+        )
+        stack.enter_context(mock.patch.object(Publisher, "post_status", post_status))
+        stack.enter_context(mock.patch.object(Publisher, "reblog", reblog))
+        stack.enter_context(mock.patch.object(get_toots, "fetch_html", record_page))
+        stack.enter_context(mock.patch.object(DoiResolver, "_fetch", record_doi))
+        stack.enter_context(
+            mock.patch.object(openai.ChatCompletion, "create", record_llm)
+        )
+        yield recorder
+
+
+@contextmanager
+def fresh_workdir():
+    """Run in an empty directory with empty caches, so that every lookup
+    actually happens."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+        os.chdir(tmp)
+        stack.callback(os.chdir, cwd)
+        os.makedirs("cache")
+        for module, name in [
+            (get_toots, "_doi_resolver"),
+            (get_toots, "_fetcher"),
+            (get_toots, "_browser_pool"),
+            (get_toots, "_host_scheduler"),
+            (summary_cache, "_summary_cache"),
+            (llm, "_llm"),
+            (link_history, "_link_history"),
+        ]:
+            stack.enter_context(mock.patch.object(module, name, None))
+        stack.enter_context(mock.patch.object(settings, "incremental_ingest", False))
+        stack.enter_context(mock.patch.object(settings, "dry_run", False))
+        # Only the bot's own local timeline is recorded.
+        stack.enter_context(
+            mock.patch.object(
+                settings,
+                "sources",
+                [{"instance": settings.mastodon_url, "timeline": "local"}],
+            )
+        )
+        metrics.reset()
+        yield tmp
+
+
+def run(mastodon, post_delay=0):
+    """Run get_toots then the post_toots flow; returns their run reports."""
+    reports = {}
+    date_str = time.strftime("%Y-%m-%d", time.localtime())
+    for name, main in [
+        ("get_toots", lambda: get_toots.main(mastodon)),
+        ("post_toots", lambda: post_toots.main(mastodon, post_delay=post_delay)),
+    ]:
+        metrics.reset()
+        main()
+        with open(f"cache/run-{name}-{date_str}.json") as f:
+            reports[name] = json.load(f)
+    return reports
+
+
+def record(bundle_dir, mastodon=None):
+    """Record a real run of the bot into bundle_dir, without posting."""
+    mastodon = mastodon or ingest.get_mastodon()
+    recorder = Recorder()
+    with fresh_workdir(), recording(mastodon, recorder):
+        run(mastodon)
+    recorder.save(os.path.abspath(bundle_dir))
+    logger.info(
+        f"Recorded {len(recorder.toots)} toots, {len(recorder.pages)} pages, "
+        f"{len(recorder.doi)} DOIs and {len(recorder.llm)} LLM answers"
+    )
+    return recorder
+
+
+def load_bundle(bundle_dir, now=None):
+    """The bundle in bundle_dir, with toots moved so the newest is from now."""
+    bundle = {}
+    for name in BUNDLE_FILES:
+        with open(os.path.join(bundle_dir, f"{name}.json")) as f:
+            bundle[name] = json.load(f)
+
+    now = now or datetime.now(timezone.utc)
+    created = [_parse_datetime(toot["created_at"]) for toot in bundle["toots"]]
+    if created:
+        shift = now - max(created) - timedelta(minutes=1)
+        shift_ms = int(shift.total_seconds() * 1000)
+        for toot, created_at in zip(bundle["toots"], created):
+            # Snowflake ids carry their millisecond timestamp in the upper bits.
+            toot["id"] = str(int(toot["id"]) + (shift_ms << 16))
+            toot["created_at"] = (created_at + shift).isoformat().replace("+00:00", "Z")
+    return bundle
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves recorded pages at /page?url=... and DOIs at /doi/<doi>."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        bundle, latency = self.server.bundle, self.server.latency
+        if latency:
+            time.sleep(latency)
+        url = urlparse(self.path)
+        if url.path == "/page":
+            html = bundle["pages"].get(parse_qs(url.query).get("url", [""])[0])
+            if html is None:
+                self.send(404, "text/plain", b"Not recorded")
+            else:
+                self.send(200, "text/html; charset=utf-8", html.encode("utf-8"))
+        elif url.path.startswith("/doi/"):
+            landing_url = bundle["doi"].get(url.path[len("/doi/") :].lower())
+            if landing_url is None:
+                self.send(404, "application/json", b"{}")
+            else:
+                body = {"link": [{"URL": landing_url, "content-type": "text/html"}]}
+                self.send(200, "application/json", json.dumps(body).encode())
+        else:
+            self.send(404, "text/plain", b"Not found")
+
+    def send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ReplayFetcher(Fetcher):
+    """Fetches every url from the stand-in page server instead of its host."""
+
+    def __init__(self, base_url):
+        super().__init__(cache_dir=None)
+        self.base_url = base_url
+
+    def get(self, url):
+        return super().get(f"{self.base_url}/page?url={quote(url, safe='')}")
+
+
+class Replay:
+    def __init__(self, bundle, mastodon, fake, llm):
+        self.bundle = bundle
+        self.mastodon = mastodon
+        self.fake = fake
+        self.llm = llm
+
+
+@contextmanager
+def replaying(bundle_dir, mastodon_latency=0.0, page_latency=0.0, llm_latency=0.0):
+    """Serve the bundle locally and point get_toots and post_toots at it.
+
+    Yields a Replay; the run happens in a fresh temporary directory.
+    """
+    bundle = load_bundle(bundle_dir)
+    fake = fake_mastodon.FakeMastodon(
+        bundle["toots"], ratelimit_limit=100000, latency=mastodon_latency
+    )
+    llm = mock_llm.MockLLM(latency=llm_latency, responses=bundle["llm"])
+
+    with ExitStack() as stack:
+        mastodon_server, mastodon_url = fake_mastodon.serve(fake)
+        stack.callback(mastodon_server.shutdown)
+        llm_server, llm_url = mock_llm.serve(llm)
+        stack.callback(llm_server.shutdown)
+        stand_in = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        stand_in.bundle, stand_in.latency = bundle, page_latency
+        threading.Thread(target=stand_in.serve_forever, daemon=True).start()
+        stack.callback(stand_in.shutdown)
+        stand_in_url = f"http://127.0.0.1:{stand_in.server_address[1]}"
+
+        stack.enter_context(fresh_workdir())
+        patches = [
+            (get_toots, "_fetcher", ReplayFetcher(stand_in_url)),
+            (
+                get_toots,
+                "_doi_resolver",
+                DoiResolver("cache/doi.sqlite", doi_base_url=stand_in_url + "/doi"),
+            ),
+            # JavaScript pages were recorded rendered, no Chrome needed.
+            (browser_pool, "js_wait_selector", lambda url: None),
+            (openai, "api_base", llm_url),
+            (openai, "api_key_path", None),
+            (openai, "api_key", "sk-replay"),
+        ]
+        for module, name, value in patches:
+            stack.enter_context(mock.patch.object(module, name, value))
+
+        mastodon = Mastodon(
+            access_token="replay",
+            api_base_url=mastodon_url,
+            ratelimit_method="wait",
+            version_check_mode="none",
+        )
+        yield Replay(bundle, mastodon, fake, llm)
+
+
+def make_bundle(bundle_dir, n_toots=2000, seed=0):
+    """A synthetic bundle: fake_mastodon's timeline, with some DOI links, and
+    a page for every link."""
+    rng = random.Random(seed)
+    toots = fake_mastodon.make_timeline(n_toots, hours=30, seed=seed)
+    doi = {}
+    for toot in toots:
+        if rng.random() < 0.05:
+            n = rng.randint(1, 20)
+            link = f"https://doi.org/10.1038/s41586-023-{n:05d}-2"
+            toot["content"] = toot["content"][: -len("</p>")] + (
+                f' <a href="{link}" rel="nofollow">{link}</a></p>'
+            )
+            doi[f"10.1038/s41586-023-{n:05d}-2"] = (
+                f"https://www.nature.com/articles/s41586-023-{n:05d}-2"
+            )
+
+    links = set(doi.values())
+    for toot in toots:
+        links.update(
+            link for link in extract_links(toot["content"]) if "doi.org" not in link
+        )
+    pages = {}
+    for link in sorted(links):
+        url = canonicalize(link)
+        if url not in pages:
+            paragraphs = "".join(
+                f"<p>{' '.join(rng.choice(WORDS) for _ in range(80))}.</p>"
+                for _ in range(rng.randint(3, 30))
+            )
+            pages[url] = (
+                f"<html><head><title>{url.split('//')[1]}</title>"
+                f'<meta name="description" content="All about {url}"></head>'
+                f"<body><header>Menu</header><main><h1>{url}</h1>{paragraphs}</main>"
+                f"</body></html>"
+            )
+        # Pages are fetched at a spelling of their link, or at the canonical
+        # URL of papers.
+        pages[strip_tracking(link)] = pages[url]
+
+    recorder = Recorder()
+    recorder.toots = {toot["id"]: toot for toot in toots}
+    recorder.pages = pages
+    recorder.doi = doi
+    recorder.save(bundle_dir)
+
+
+WORDS = "grid cells bats neurons cortex model data memory spikes brain".split()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["record", "synthesize"])
+    parser.add_argument("bundle_dir")
+    parser.add_argument("--toots", type=int, default=2000, help="for synthesize")
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.bundle_dir)
+    else:
+        make_bundle(args.bundle_dir, args.toots)
+
+
+if __name__ == "__main__":
+    main()
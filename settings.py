@@ -1,3 +1,15 @@
+"""Settings of the bot. The values below are the defaults; load() overrides
+them from a TOML file and from LOTD_<NAME> environment variables, e.g.
+
+    # settings.toml
+    mastodon_url = "https://fediscience.org"
+    candidate_links = 50
+
+    LOTD_DRY_RUN=true python lotd.py post
+"""
+import json
+import os
+
 # e.g. Change this to an ngrok public URL
 bot_url = "https://public-url.ngrok.io"  
  # Change this to your Maston instance.
@@ -9,4 +21,153 @@ open_ai_api_key_path = "/home/pmin/Documents/nma-match/.openai-key"
 client_name = "MastodonScraperBot"
 redirect_uri = f"{bot_url}/callback"
 clientcred_file = ".clientcred.secret"
-scopes = ["read", "write"]
\ No newline at end of file
+scopes = ["read", "write"]
+
+# Timelines to take links from: "timeline" is "local", "public", "tag/<hashtag>"
+# or "list/<list id>". Sources are read in parallel, each with its own client,
+# rate-limit budget and ingestion checkpoint. Sources on other instances can set
+# "access_token_path"; list timelines need one.
+sources = [{"instance": mastodon_url, "timeline": "local"}]
+# Set to True when ingest.py runs hourly from cron; get_toots.py then reads the
+# rolling store in cache/toots.jsonl instead of re-downloading the whole day.
+incremental_ingest = False
+# Each ingest run re-fetches this many hours before its checkpoint so that
+# favourite and reblog counts of recent toots stay up to date.
+ingest_overlap_hours = 6
+# Boost the digest from the bot's account right after posting it.
+boost_digest = True
+# Render the thread to cache/run-<date>/thread.html instead of posting it.
+dry_run = False
+# Links are ranked by the favourites and reblogs of the toots linking to them
+# over this many hours...
+popularity_window_hours = 24
+# ...or, when set, with each toot counting half as much every this many hours.
+popularity_half_life_hours = None
+# With incremental ingestion the popularity index is kept here between runs, so
+# that each run only applies the new toots and changed counts.
+popularity_index_path = "cache/popularity.pickle"
+# This many of the most popular links are fetched, and those that are the same
+# story (same DOI or arXiv id, or nearly the same text) are merged before the top
+# ten are summarized.
+candidate_links = 30
+# Estimated Jaccard similarity of their text above which two pages are merged.
+cluster_similarity = 0.5
+# `lotd.py backfill` writes the candidate links of each day of archived toots
+# here, candidate_links of them.
+backfill_dir = "cache/backfill"
+# Resolved DOIs are cached here between runs.
+doi_cache_path = "cache/doi.sqlite"
+# Headless Chrome instances kept alive for JavaScript-heavy sites.
+browser_pool_size = 2
+# Concurrent page fetches and LLM calls when summarizing the top links.
+fetch_workers = 4
+summarize_workers = 3
+# LLM summaries are reused across runs while the page content is unchanged.
+summary_cache_path = "cache/summaries.sqlite"
+summary_cache_days = 14
+summary_cache_max_entries = 5000
+# Daily link scores and past links of the day are kept here for
+# link_history_days. Links of the day of the last repeat_days days are not
+# candidates again (0 allows repeats).
+link_history_path = "cache/history.sqlite"
+link_history_days = 365
+repeat_days = 7
+# Page fetching: responses are cached and revalidated, bodies are capped.
+# Cached pages unused for http_cache_days are removed, and the least recently
+# used ones past http_cache_max_bytes.
+http_cache_dir = "cache/http"
+http_cache_days = 30
+http_cache_max_bytes = 500_000_000
+max_page_bytes = 5_000_000
+connect_timeout = 5
+read_timeout = 20
+# Politeness towards each host: requests at once and seconds between their
+# starts, with [at once, seconds] overrides for some hosts.
+max_requests_per_host = 2
+min_host_interval = 0.5
+host_limits = {"doi.org": [8, 0.05]}
+# A host that fails this many requests in a row (errors, 403, 429, 5xx) is
+# skipped for a while; its health is kept between runs.
+host_failure_threshold = 3
+host_cooldown_hours = 24
+host_health_path = "cache/hosts.json"
+# No page fetch starts this many seconds after the fetch stage started.
+fetch_stage_deadline = 600
+# Approximate model tokens of page text sent with each summarization prompt.
+max_body_tokens = 1500
+# Up to this many pages are summarized in a single LLM request.
+summary_batch_size = 5
+# A link of the day whose summary failed this many runs is left out of the
+# digest rather than holding it back.
+summary_max_attempts = 3
+# Where summaries come from: "openai", "local" for an OpenAI-compatible server at
+# llm_api_base (e.g. llama.cpp's), asked for llm_local_model whatever the model
+# wanted, to run offline, or "mock" for made-up summaries (see mock_llm.py).
+llm_backend = "openai"
+llm_api_base = "http://127.0.0.1:8080/v1"
+llm_local_model = None
+# LLM requests share this budget of tokens per minute, at most this many at once.
+llm_tokens_per_minute = 90_000
+llm_max_concurrency = 4
+# A request slower than this percentile of recent ones is sent again and the first
+# answer is used. None never sends a request twice.
+llm_hedge_percentile = 0.95
+# Ask for JSON objects with response_format, for models and servers that support it.
+llm_json_mode = False
+# Pages whose <meta> tags hold a title and an abstract (most papers) are
+# summarized from them, and the LLM only writes their tldr. Descriptions that
+# aren't explicitly abstracts must be this long to count as one.
+metadata_fast_path = True
+metadata_min_description = 200
+# Each run writes a timing report to cache/run-<script>-<date>.json. Set this to
+# node_exporter's textfile collector directory to also export it to Prometheus.
+prometheus_textfile_dir = None
+
+
+def load(path=None, environ=None):
+    """Override the settings with those of the TOML file at path (by default
+    $LOTD_SETTINGS, or settings.toml if there is one), then with LOTD_<NAME>
+    environment variables, read as JSON when they parse as JSON."""
+    environ = os.environ if environ is None else environ
+    path = path or environ.get("LOTD_SETTINGS")
+    if path is None and os.path.exists("settings.toml"):
+        path = "settings.toml"
+
+    overrides = {}
+    if path is not None:
+        try:
+            import tomllib
+        except ModuleNotFoundError:  # Python < 3.11
+            import tomli as tomllib
+        with open(path, "rb") as f:
+            overrides.update(tomllib.load(f))
+    for key, value in environ.items():
+        if key.startswith("LOTD_") and key != "LOTD_SETTINGS":
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+            overrides[key[len("LOTD_") :].lower()] = value
+
+    unknown = set(overrides) - set(_names())
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+    # Settings derived from others follow them unless they are set too.
+    if "bot_url" in overrides:
+        overrides.setdefault("redirect_uri", f"{overrides['bot_url']}/callback")
+    if "mastodon_url" in overrides:
+        overrides.setdefault(
+            "sources", [{"instance": overrides["mastodon_url"], "timeline": "local"}]
+        )
+    globals().update(overrides)
+    return overrides
+
+
+def _names():
+    return [
+        name
+        for name, value in globals().items()
+        if not name.startswith("_")
+        and not callable(value)
+        and not isinstance(value, type(os))
+    ]
@@ -0,0 +1,128 @@
+"""Timelines the links of the day are read from, possibly on several instances.
+
+Each source gets its own Mastodon client, so that its rate-limit budget is
+tracked separately, and sources are fetched in parallel. A toot federated to
+several instances shows up once per source with a different id; dedupe() keeps
+one record per uri.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import re
+from urllib.parse import urlparse
+
+import metrics
+import settings
+
+logger = logging.getLogger(__name__)
+
+# The token of the bot's own account, written by authorize_app.py.
+ACCESS_TOKEN_PATH = ".access.secret"
+
+
+class Source(namedtuple("Source", ["instance", "timeline", "access_token_path"])):
+    """A timeline of an instance: "local", "public", "tag/<hashtag>" or
+    "list/<list id>", as in Mastodon.timeline."""
+
+    __slots__ = ()
+
+    def __new__(cls, instance, timeline="local", access_token_path=None):
+        return super().__new__(cls, instance.rstrip("/"), timeline, access_token_path)
+
+    @property
+    def name(self):
+        return f"{urlparse(self.instance).netloc or self.instance}/{self.timeline}"
+
+    @property
+    def slug(self):
+        return re.sub(r"[^A-Za-z0-9]+", "_", self.name).strip("_")
+
+
+def from_settings():
+    return [Source(**config) for config in settings.sources]
+
+
+def get_client(source):
+    from mastodon import Mastodon
+
+    token_path = source.access_token_path
+    if token_path is None and _is_own_instance(source):
+        token_path = ACCESS_TOKEN_PATH
+    access_token = None
+    if token_path and os.path.exists(token_path):
+        with open(token_path, "r") as f:
+            access_token = f.read().strip()
+    return Mastodon(
+        access_token=access_token,
+        api_base_url=source.instance,
+        ratelimit_method="wait",
+    )
+
+
+def get_clients(sources, mastodon=None):
+    """A client per source. `mastodon`, when given, serves the sources on the
+    bot's own instance."""
+    return {
+        source: mastodon
+        if mastodon is not None and _is_own_instance(source)
+        else get_client(source)
+        for source in sources
+    }
+
+
+def account_host(source):
+    """The host that the local accounts of source's toots are on, for
+    TootRecord.from_status: None on the bot's own instance, where @username
+    mentions them."""
+    if _is_own_instance(source):
+        return None
+    return urlparse(source.instance).netloc or source.instance
+
+
+def _is_own_instance(source):
+    return source.instance == settings.mastodon_url.rstrip("/")
+
+
+def timeline_page(mastodon, timeline, **params):
+    """A page of a timeline, newest first."""
+    if timeline == "local":
+        return mastodon.timeline_local(**params)
+    return mastodon.timeline(timeline, **params)
+
+
+def fetch_parallel(clients, fetch):
+    """Call fetch(source, mastodon) for every source at once, returns the
+    results by source. A source that fails is logged and left out."""
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(len(clients), 1)) as executor:
+        futures = {
+            source: executor.submit(_fetch_source, fetch, source, mastodon)
+            for source, mastodon in clients.items()
+        }
+        for source, future in futures.items():
+            try:
+                results[source] = future.result()
+            except Exception as e:
+                logger.warning(f"Could not read {source.name}: {e}")
+                metrics.incr("source.failed")
+    return results
+
+
+def _fetch_source(fetch, source, mastodon):
+    with metrics.span(f"source.{source.name}"):
+        records = fetch(source, mastodon)
+    metrics.incr(f"source.toots.{source.name}", len(records))
+    logger.info(f"Read {len(records)} toots from {source.name}")
+    return records
+
+
+def dedupe(records):
+    """One record per uri. Counts lag on the instances a toot was federated
+    to, so the copy with the highest counts wins."""
+    by_uri = {}
+    for record in records:
+        seen = by_uri.get(record.uri)
+        if seen is None or record.popularity > seen.popularity:
+            by_uri[record.uri] = record
+    return list(by_uri.values())
@@ -0,0 +1,128 @@
+"""Persistent cache of LLM summaries.
+
+Popular links often trend for several days. Summaries are keyed by a hash of
+the prompt version, the canonical URL and the text sent to the model (title
+and truncated body), so the same page is only summarized again when its
+content or the prompt changes. Entries expire after a while and the least recently
+used ones are evicted past a maximum size.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+# Bump when a prompt changes in a way that should invalidate old summaries.
+PROMPT_VERSION = 1
+
+# Rough USD per 1k tokens, used to report what the cache saved.
+MODEL_PRICES = {
+    "gpt-3.5-turbo": 0.002,
+    "gpt-3.5-turbo-16k": 0.004,
+    "gpt-4": 0.045,
+}
+
+
+def cache_key(kind, url, text):
+    h = hashlib.sha256()
+    for part in (str(PROMPT_VERSION), kind, url or "", text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class SummaryCache:
+    def __init__(self, path="cache/summaries.sqlite", ttl=14 * DAY, max_entries=5000):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Summaries are produced from several pipeline threads.
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, "
+            "value TEXT, model TEXT, tokens INTEGER, created_at REAL, accessed_at REAL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS summaries_accessed_at ON summaries (accessed_at)"
+        )
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.cost_saved = 0.0
+
+    def get(self, key):
+        now = time.time()
+        with self.lock, self.db:
+            row = self.db.execute(
+                "SELECT value, model, tokens FROM summaries "
+                "WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.db.execute(
+                "UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            value, model, tokens = row
+            self.hits += 1
+            self.tokens_saved += tokens
+            self.cost_saved += tokens / 1000 * MODEL_PRICES.get(model, 0.0)
+        return json.loads(value)
+
+    def put(self, key, value, model=None, tokens=0):
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(value), model, tokens, now, now),
+            )
+            self.db.execute(
+                "DELETE FROM summaries WHERE created_at <= ?", (now - self.ttl,)
+            )
+            self.db.execute(
+                "DELETE FROM summaries WHERE key IN (SELECT key FROM summaries "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "tokens_saved": self.tokens_saved,
+            "cost_saved_usd": round(self.cost_saved, 4),
+        }
+
+    def close(self):
+        self.db.close()
+
+
+_summary_cache = None
+_summary_cache_lock = threading.Lock()
+
+
+def get_summary_cache():
+    """The cache shared by get_toots and post_toots, and by the summarizing
+    threads, which may ask for it first."""
+    global _summary_cache
+    with _summary_cache_lock:
+        if _summary_cache is None:
+            _summary_cache = SummaryCache(
+                settings.summary_cache_path,
+                ttl=settings.summary_cache_days * DAY,
+                max_entries=settings.summary_cache_max_entries,
+            )
+    return _summary_cache
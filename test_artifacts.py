@@ -0,0 +1,153 @@
+import os
+import time
+from unittest import mock
+
+import pytest
+
+import artifacts
+import get_toots
+import post_toots
+from publisher import Publisher, PublishError
+import replay
+import settings
+
+
+def test_item_log_survives_torn_line(tmp_path):
+    run = artifacts.Run("2023-04-01", root=str(tmp_path))
+    run.items("fetch").add("a", {"title": "A"})
+    with open(run.path("fetch.items.jsonl"), "a") as f:
+        f.write('{"key": "b", "val')
+
+    log = artifacts.Run("2023-04-01", root=str(tmp_path)).items("fetch")
+    assert "a" in log and "b" not in log
+    log.add("b", {"title": "B"})
+    assert artifacts.ItemLog(log.path).items == {
+        "a": {"title": "A"},
+        "b": {"title": "B"},
+    }
+
+
+def test_reset_keeps_what_was_posted(tmp_path):
+    run = artifacts.Run("2023-04-01", root=str(tmp_path))
+    for stage in artifacts.STAGES:
+        run.save(stage, [])
+    run.items("summarize").add("a", {})
+    run.failures("summarize").add("b", 1)
+    run.items("post").add("intro", 1)
+
+    run.reset("summarize")
+    assert [s for s in artifacts.STAGES if run.done(s)] == [
+        "ingest",
+        "resolve",
+        "score",
+        "fetch",
+        "cluster",
+    ]
+    assert len(run.items("summarize")) == 0
+    assert len(run.failures("summarize")) == 0
+    assert run.items("post").get("intro") == 1
+
+
+def test_summaries_failed_by_the_llm_are_retried(tmp_path):
+    replay.make_bundle(str(tmp_path / "bundle"), n_toots=300)
+    with replay.replaying(str(tmp_path / "bundle")) as stand_ins:
+        mastodon = stand_ins.mastodon
+        run = artifacts.Run(time.strftime("%Y-%m-%d", time.localtime()))
+
+        def outage(pages):
+            return [None] * len(pages)
+
+        with mock.patch.object(get_toots, "summarize_webpages", outage):
+            with pytest.raises(get_toots.IncompleteStage):
+                get_toots.main(mastodon)
+        assert not run.done("summarize")
+        with pytest.raises(FileNotFoundError):
+            post_toots.main(mastodon, post_delay=0)
+
+        get_toots.main(mastodon)
+        assert len(run.load("summarize")) > 2
+
+
+def test_a_page_never_summarized_is_left_out(tmp_path):
+    replay.make_bundle(str(tmp_path / "bundle"), n_toots=300)
+    with replay.replaying(str(tmp_path / "bundle")) as stand_ins:
+        mastodon = stand_ins.mastodon
+        run = artifacts.Run(time.strftime("%Y-%m-%d", time.localtime()))
+        summarize_webpages = get_toots.summarize_webpages
+        stuck = []
+
+        def fails_on_one_page(pages):
+            stuck[:] = stuck or [pages[0]["url"]]
+            return [
+                None if page["url"] in stuck else summary
+                for page, summary in zip(pages, summarize_webpages(pages))
+            ]
+
+        with mock.patch.object(get_toots, "summarize_webpages", fails_on_one_page):
+            with mock.patch.object(settings, "summary_max_attempts", 2):
+                with pytest.raises(get_toots.IncompleteStage):
+                    get_toots.main(mastodon)
+                get_toots.main(mastodon)
+        lotd = run.load("summarize")
+        assert len(lotd) > 2
+        assert stuck[0] not in [link["url"] for link in lotd]
+
+
+def test_a_day_without_links_posts_nothing(tmp_path):
+    replay.make_bundle(str(tmp_path / "bundle"), n_toots=300)
+    with replay.replaying(str(tmp_path / "bundle")) as stand_ins:
+        mastodon, fake = stand_ins.mastodon, stand_ins.fake
+        run = artifacts.Run(time.strftime("%Y-%m-%d", time.localtime()))
+        with mock.patch.object(settings, "candidate_links", 0):
+            get_toots.main(mastodon)
+        assert run.load("summarize") == []
+        post_toots.main(mastodon, post_delay=0)
+        assert fake.posted == []
+
+
+def test_resumes_after_a_crash(tmp_path):
+    replay.make_bundle(str(tmp_path / "bundle"), n_toots=300)
+    with replay.replaying(str(tmp_path / "bundle")) as stand_ins:
+        mastodon, fake = stand_ins.mastodon, stand_ins.fake
+        get_toots.main(mastodon)
+        run = artifacts.Run(time.strftime("%Y-%m-%d", time.localtime()))
+        lotd = run.load("summarize")
+        assert len(lotd) > 2
+        # Only what the digest shows, not the pages.
+        assert all("body" not in link and "metadata" not in link for link in lotd)
+
+        # A crash after the digest and two replies were posted.
+        post_status = Publisher.post_status
+        calls = []
+
+        def flaky_post_status(*args, **kwargs):
+            if len(calls) == 3:
+                raise PublishError("Connection reset")
+            calls.append(args)
+            return post_status(*args, **kwargs)
+
+        with mock.patch.object(Publisher, "post_status", flaky_post_status):
+            with pytest.raises(PublishError):
+                post_toots.main(mastodon, post_delay=0)
+        assert len(fake.posted) == 3
+
+        post_toots.main(mastodon, post_delay=0)
+        intro, *replies = fake.posted
+        assert len(replies) == len(lotd)
+        assert all(x["in_reply_to_id"] == intro["id"] for x in replies)
+
+        # Summaries done before a crash are not redone.
+        os.remove(run.path("summarize.json"))
+        fetched = get_toots._fetcher.stats["fetched"]
+        llm_requests = stand_ins.llm.requests
+        get_toots.main(mastodon)
+        assert run.load("summarize") == lotd
+        assert get_toots._fetcher.stats["fetched"] == fetched
+        assert stand_ins.llm.requests == llm_requests
+
+        # Done: running again neither reads Mastodon nor posts.
+        requests = fake.requests
+        get_toots.main(mastodon)
+        post_toots.main(mastodon, post_delay=0)
+        assert fake.requests == requests
+        assert len(fake.posted) == 1 + len(lotd)
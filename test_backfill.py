@@ -0,0 +1,95 @@
+import json
+
+import backfill
+
+
+def status(i, day, links, favourites=1, visibility="public"):
+    return {
+        "id": str(i),
+        "uri": f"https://a.social/users/u{i}/statuses/{i}",
+        "created_at": f"2023-04-{day:02d}T12:00:00+00:00",
+        "account": {"username": f"u{i}", "acct": f"u{i}", "note": ""},
+        "visibility": visibility,
+        "favourites_count": favourites,
+        "reblogs_count": 0,
+        "content": "".join(f'<a href="{link}">link</a>' for link in links),
+    }
+
+
+def test_days_are_counted_once_per_toot(tmp_path):
+    toots = [
+        status(1, 3, ["https://www.example.com/a?utm_source=x"]),
+        status(2, 3, ["https://example.com/a", "https://a.social/@u1"], favourites=4),
+        status(3, 3, ["https://arxiv.org/pdf/2304.01234v2", "https://example.com/b"]),
+        status(4, 4, ["https://example.com/a"], visibility="unlisted"),
+        status(5, 4, ["https://doi.org/10.1/x"]),
+    ]
+    with open(tmp_path / "toots.jsonl", "w") as f:
+        for toot in toots:
+            f.write(json.dumps(toot) + "\n")
+    # The old format, with a toot seen again with more favourites.
+    with open(tmp_path / "toots.json", "w") as f:
+        json.dump([status(1, 3, ["https://example.com/a"], favourites=2)], f)
+
+    written = backfill.backfill(
+        [str(tmp_path / "toots.jsonl"), str(tmp_path / "toots.json")],
+        str(tmp_path / "out"),
+        workers=2,
+        resolve=lambda dois: {doi: "https://journal.org/x" for doi in dois},
+        excluded=("https://a.social",),
+    )
+    with open(written["2023-04-03"]) as f:
+        assert json.load(f) == [
+            {
+                "url": "https://example.com/a",
+                "backlinks": [toots[0]["uri"], toots[1]["uri"]],
+                "linked_by": ["u1", "u2"],
+                "popularity": 6,
+            },
+            {
+                "url": "https://arxiv.org/abs/2304.01234",
+                "backlinks": [toots[2]["uri"]],
+                "linked_by": ["u3"],
+                "popularity": 1,
+            },
+        ]
+    with open(written["2023-04-04"]) as f:
+        assert [link["url"] for link in json.load(f)] == ["https://journal.org/x"]
+
+
+def test_ranges_split_lines_between_tasks(tmp_path):
+    path = tmp_path / "toots.jsonl"
+    toots = [status(i, 3, [f"https://example.com/{i}"]) for i in range(50)]
+    path.write_text("".join(json.dumps(toot) + "\n" for toot in toots))
+    tasks = list(backfill.iter_tasks([str(path)], chunk_bytes=1000))
+    assert len(tasks) > 5
+    lines = [line for _, *task in tasks for line in backfill.read_range(*task)]
+    assert [json.loads(line) for line in lines] == toots
+
+
+def test_json_array_is_cut_between_toots(tmp_path):
+    # Cuts are looked for after "}, {", found inside strings and nested
+    # objects too.
+    toots = [
+        {
+            **status(i, 3, [f"https://example.com/{i}"]),
+            "spoiler_text": "}, {" * i,
+            "emojis": [{"a": 1}, {"b": 2}],
+        }
+        for i in range(30)
+    ]
+    path = tmp_path / "toots.json"
+    path.write_text(json.dumps(toots, indent=1))
+    tasks = list(backfill.iter_tasks([str(path)], chunk_bytes=200))
+    assert len(tasks) > 10
+
+    bad_cuts = []
+    for task in tasks:
+        try:
+            backfill.read_array_range(*task[1:])
+        except backfill.BadCut:
+            bad_cuts.append(task)
+    assert bad_cuts
+    written = backfill.backfill([str(path)], str(tmp_path / "out"), chunk_bytes=200)
+    with open(written["2023-04-03"]) as f:
+        assert len(json.load(f)) == 30
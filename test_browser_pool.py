@@ -0,0 +1,93 @@
+import functools
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import shutil
+import threading
+
+import pytest
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from browser_pool import BrowserPool, js_wait_selector
+
+
+class FakeDriver:
+    started = 0
+
+    def __init__(self):
+        FakeDriver.started += 1
+        self.quit_called = False
+        self.page_load_timeout = None
+
+    def set_page_load_timeout(self, seconds):
+        self.page_load_timeout = seconds
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_js_wait_selector():
+    assert js_wait_selector("https://psyarxiv.com/u56p2/") is not None
+    assert js_wait_selector("https://linkinghub.elsevier.com/retrieve/pii/S0092") is not None
+    assert js_wait_selector("https://arxiv.org/abs/2304.01234") is None
+    assert js_wait_selector("https://notpsyarxiv.com/") is None
+
+
+def test_pool_reuses_and_replaces_drivers():
+    FakeDriver.started = 0
+    pool = BrowserPool(size=2, driver_factory=FakeDriver)
+    with pool.driver() as first:
+        with pool.driver() as second:
+            assert first is not second
+    with pool.driver() as again:
+        assert again in (first, second)
+    assert FakeDriver.started == 2
+
+    with pytest.raises(WebDriverException):
+        with pool.driver() as broken:
+            raise WebDriverException("crashed")
+    assert broken.quit_called
+    with pool.driver(), pool.driver():
+        pass
+    assert FakeDriver.started == 3
+
+    pool.close()
+    assert first.quit_called and second.quit_called
+
+
+def test_pool_never_loses_a_slot():
+    pool = BrowserPool(size=1, driver_factory=FakeDriver, checkout_timeout=0.1)
+    with pytest.raises(KeyboardInterrupt):
+        with pool.driver() as interrupted:
+            raise KeyboardInterrupt
+    assert interrupted.quit_called
+    with pool.driver() as driver:
+        assert driver.page_load_timeout == pool.page_load_timeout
+        # Every driver is busy: checking out another one times out.
+        with pytest.raises(TimeoutException):
+            with pool.driver():
+                pass
+    pool.close()
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(shutil.which("chromedriver") is None, reason="needs chromedriver")
+def test_render_static_page(tmp_path):
+    (tmp_path / "index.html").write_text(
+        "<html><head><title>Static</title></head><body><p>Hello</p>"
+        "<script>var m = document.createElement('meta'); m.name = 'citation_title';"
+        "setTimeout(() => document.head.appendChild(m), 200);</script></body></html>"
+    )
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/index.html"
+
+    with BrowserPool(size=1) as pool:
+        for _ in range(3):
+            html = pool.render(url, "meta[name='citation_title']")
+            assert "citation_title" in html
+        stats = pool.stats()
+    server.shutdown()
+
+    assert stats["drivers"] == 1
+    print(f"Mean render latency: {stats['mean_render_latency']:.3f} s")
+    assert stats["mean_render_latency"] < 5
@@ -0,0 +1,47 @@
+from canonical_url import canonicalize, group_links, representative
+
+
+def test_canonicalize():
+    assert canonicalize("http://www.nature.com/articles/s41586-023-05813-2/") == (
+        "https://nature.com/articles/s41586-023-05813-2"
+    )
+    assert canonicalize("https://example.com/a?utm_source=x&fbclid=y&b=2&a=1#top") == (
+        "https://example.com/a?a=1&b=2"
+    )
+    assert canonicalize("https://arxiv.org/pdf/2304.01234v2.pdf") == (
+        "https://arxiv.org/abs/2304.01234"
+    )
+    assert canonicalize("https://arxiv.org/html/2304.01234v1") == (
+        "https://arxiv.org/abs/2304.01234"
+    )
+    assert canonicalize(
+        "https://www.biorxiv.org/content/10.1101/2023.04.05.535000v2.full"
+    ) == "https://biorxiv.org/content/10.1101/2023.04.05.535000"
+    assert canonicalize("mailto:someone@example.com") == "mailto:someone@example.com"
+
+
+def test_group_links_keeps_unrelated_links_apart():
+    groups = group_links(
+        [
+            "https://example.com/post",
+            "https://www.example.com/post/",
+            "https://example.com/post/comments",
+        ]
+    )
+    assert len(groups) == 2
+    assert len(groups["https://example.com/post"]) == 2
+
+
+def test_representative_keeps_a_spelling_that_was_linked():
+    links = [
+        "http://www.example.com/post?utm_source=masto",
+        "http://www.example.com/post",
+        "https://example.com/post/",
+    ]
+    assert representative(canonicalize(links[0]), links) == (
+        "http://www.example.com/post"
+    )
+    links = ["https://arxiv.org/pdf/2304.01234v2", "https://arxiv.org/pdf/2304.01234"]
+    assert representative(canonicalize(links[0]), links) == (
+        "https://arxiv.org/abs/2304.01234"
+    )
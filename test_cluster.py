@@ -0,0 +1,63 @@
+import random
+
+import cluster
+
+WORDS = "the a bats grid cells neurons cortex navigate memory brain study data".split()
+
+
+def story(seed, n_words=300):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) + str(rng.randrange(50)) for _ in range(n_words))
+
+
+def page(url, body, **identifiers):
+    return {
+        "url": url,
+        "title": url,
+        "description": "",
+        "identifiers": identifiers,
+        "body": f"<p>{body}</p>",
+    }
+
+
+def test_syndicated_copies_cluster_together():
+    text = story(0)
+    edited = "Published by The Other Times. " + text.replace(text.split()[5], "bats")
+    pages = [
+        page("https://a.com/story", text),
+        page("https://b.com/other", story(1)),
+        page("https://c.com/copy", edited),
+        page("https://d.com/short", "too short to compare"),
+    ]
+    assert cluster.cluster(pages) == [[0, 2], [1], [3]]
+
+
+def test_preprint_and_journal_version_share_an_identifier():
+    pages = [
+        page("https://arxiv.org/abs/2304.01234", story(0)),
+        page("https://www.biorxiv.org/content/10.1101/2023.04.01.535", story(1)),
+        page(
+            "https://journal.org/article/42",
+            story(2),
+            citation_doi="10.48550/arXiv.2304.01234v2",
+        ),
+        page(
+            "https://journal.org/article/43",
+            story(3),
+            **{"dc.identifier": "doi:10.1101/2023.04.01.535"},
+        ),
+    ]
+    assert cluster.cluster(pages) == [[0, 2], [1, 3]]
+
+
+def test_merge_sums_popularity_and_keeps_toots_once():
+    a = {"url": "a", "backlinks": ["t1", "t2"], "linked_by": ["x", "y"]}
+    b = {"url": "b", "backlinks": ["t2", "t3"], "linked_by": ["y", "z"]}
+    a["popularity"], b["popularity"] = 5, 2
+    assert cluster.merge([a, b]) == {
+        "url": "a",
+        "backlinks": ["t1", "t2", "t3"],
+        "linked_by": ["x", "y", "z"],
+        "popularity": 7,
+        "cluster": ["a", "b"],
+    }
@@ -0,0 +1,60 @@
+import fake_mastodon
+from composer import Composer, format_accounts, get_max_characters, toot_length
+from publisher import Publisher
+
+LINK = {
+    "url": "https://example.com/a?b=1&c=2",
+    "title": "Bats <3 grid cells",
+    "website": "Example",
+    "tldr": "Bats navigate with grid cells.",
+    "summary": "Grid cells in the bat's entorhinal cortex " * 3,
+    "linked_by": ["alice", "bob"],
+    "popularity": 12,
+    "backlinks": ["https://fake.social/users/alice/statuses/1"],
+    "is_scientific_article": True,
+    "is_news": False,
+}
+
+
+def test_escapes():
+    (toot,) = Composer().link(LINK)
+    assert "<a href='https://example.com/a?b=1&amp;c=2'>" in toot
+    assert "Bats &lt;3 grid cells - Example" in toot
+    assert "bat&#x27;s" in toot
+    assert "Linked by @alice and @bob (12⭐)" in toot
+    assert "#lotd #science</p>" in toot
+    assert format_accounts([]) == "no one"
+
+
+def test_long_summary_continues_in_replies():
+    link = dict(LINK, summary=" ".join(f"word{i}" for i in range(300)))
+    toots = Composer(500).link(link)
+    assert len(toots) > 2
+    assert all(toot_length(toot) <= 500 for toot in toots)
+    assert toots[0].count("…") == 1
+
+    # Nothing lost: the words of the summary, in order, across the toots.
+    words = []
+    for toot in toots:
+        summary = toot.split("<p>")[2 if toot is toots[0] else 1].split("</p>")[0]
+        words += summary.rstrip("…").split()
+    assert words == link["summary"].split()
+
+    intro = Composer(100).intro("Bats, " * 50, "2023-04-01")
+    assert toot_length(intro) <= 100 and intro.endswith("<p>2023-04-01 edition</p>")
+    assert "None" not in Composer().intro(None, "2023-04-01")
+
+
+def test_urls_count_as_23_characters():
+    assert toot_length("see https://example.com/" + "a" * 100) == 4 + 23
+
+
+def test_max_characters_read_once(tmp_path):
+    fake = fake_mastodon.FakeMastodon(max_characters=1000)
+    server, url = fake_mastodon.serve(fake)
+    publisher = Publisher(url, "token")
+    cache_path = str(tmp_path / "instance.json")
+    assert get_max_characters(publisher, cache_path) == 1000
+    assert get_max_characters(publisher, cache_path) == 1000
+    assert fake.requests == 1
+    server.shutdown()
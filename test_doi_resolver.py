@@ -0,0 +1,84 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+import pytest
+
+from doi_resolver import DoiResolver
+
+LANDING_PAGES = {
+    "/10.1038/s41586-023-05813-2": "https://www.nature.com/articles/s41586-023-05813-2",
+}
+
+
+class StubDoiHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        StubDoiHandler.requests.append(self.path)
+        if self.path not in LANDING_PAGES:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(
+            {
+                "link": [
+                    {"URL": "https://example.com/paper.pdf", "content-type": "application/pdf"},
+                    {"URL": LANDING_PAGES[self.path], "content-type": "text/html"},
+                ]
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def doi_server():
+    StubDoiHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubDoiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_resolve_many_dedups_and_caches(tmp_path, doi_server):
+    path = str(tmp_path / "doi.sqlite")
+    urls = [
+        "http://dx.doi.org/10.1038/s41586-023-05813-2",
+        "https://doi.org/10.1038/S41586-023-05813-2",
+        "https://doi.org/10.1000/missing",
+        "https://arxiv.org/abs/2304.00001",
+    ]
+    resolver = DoiResolver(path, doi_base_url=doi_server)
+    resolved = resolver.resolve_many(urls)
+
+    assert resolved[urls[0]] == "https://www.nature.com/articles/s41586-023-05813-2"
+    assert resolved[urls[1]] == resolved[urls[0]]
+    assert resolved[urls[2]] == urls[2]
+    assert resolved[urls[3]] == urls[3]
+    assert len(StubDoiHandler.requests) == 2
+    assert resolver.stats() == {"hits": 0, "misses": 2, "failures": 1}
+    resolver.close()
+
+    # A new run is served from disk, including the failed lookup.
+    resolver = DoiResolver(path, doi_base_url=doi_server)
+    assert resolver.resolve_many(urls) == resolved
+    assert len(StubDoiHandler.requests) == 2
+    assert resolver.stats() == {"hits": 2, "misses": 0, "failures": 0}
+    resolver.close()
+
+
+def test_negative_entries_expire(tmp_path, doi_server):
+    resolver = DoiResolver(
+        str(tmp_path / "doi.sqlite"), negative_ttl=0, doi_base_url=doi_server
+    )
+    resolver.resolve("https://doi.org/10.1000/missing")
+    resolver.resolve("https://doi.org/10.1000/missing")
+    assert len(StubDoiHandler.requests) == 2
+    resolver.close()
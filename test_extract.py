@@ -0,0 +1,35 @@
+import glob
+import json
+
+import pytest
+
+from extract import extract_content, extract_links
+
+PAGES = sorted(glob.glob("fixtures/pages/*.html"))
+
+
+@pytest.mark.parametrize("path", PAGES)
+def test_extract_content_matches_saved_output(path):
+    """The .json next to each page holds the title and body output by the
+    original multi-pass BeautifulSoup cleanup, and the meta description and
+    identifiers."""
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    with open(path[:-5] + ".json", encoding="utf-8") as f:
+        expected = json.load(f)
+    assert extract_content(html) == expected
+
+
+def test_extract_links():
+    html = (
+        '<p>New paper! <a href="https://arxiv.org/abs/2304.01234?a=1&amp;b=2" '
+        'rel="nofollow noopener" target="_blank"><span>arxiv.org/abs/2304.01234</span></a> '
+        '<span class="h-card"><a href="https://neuromatch.social/@bob" class="u-url mention">'
+        "@<span>bob</span></a></span> <a class=\"hashtag\" data-href='x' "
+        "href='https://neuromatch.social/tags/neuro'>#neuro</a></p>"
+    )
+    assert extract_links(html) == [
+        "https://arxiv.org/abs/2304.01234?a=1&b=2",
+        "https://neuromatch.social/@bob",
+        "https://neuromatch.social/tags/neuro",
+    ]
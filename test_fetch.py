@@ -0,0 +1,155 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+import time
+
+import pytest
+
+from fetch import Fetcher
+import get_toots
+
+PAGE = b"<html><body><p>Hello</p></body></html>"
+
+
+class StubPageHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        StubPageHandler.requests.append(self.path)
+        if self.path == "/page":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_page(PAGE, ETag='"v1"')
+        elif self.path == "/paper.pdf":
+            self.send_page(b"%PDF-1.4" * 1000, content_type="application/pdf")
+        elif self.path == "/latin":
+            self.send_page("<p>Café</p>".encode("utf-8"), content_type="text/html")
+        elif self.path == "/meta":
+            page = '<meta charset="iso-8859-1"><p>Caf\xe9</p>'.encode("latin-1")
+            self.send_page(page, content_type="text/html")
+        elif self.path == "/huge":
+            self.send_page(b"<p>spam</p>" * 100_000, ETag='"v1"')
+        elif self.path == "/slow":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.end_headers()
+            for _ in range(20):
+                self.wfile.write(b"<p>drip</p>" * 2000)
+                self.wfile.flush()
+                time.sleep(0.1)
+        elif self.path == "/stalled":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            time.sleep(2)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def send_page(self, body, content_type="text/html; charset=utf-8", **headers):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+@pytest.fixture
+def page_server():
+    StubPageHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubPageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_revalidates_cached_page(tmp_path, page_server):
+    fetcher = Fetcher(str(tmp_path))
+    assert fetcher.get(page_server + "/page") == PAGE.decode()
+    assert fetcher.get(page_server + "/page") == PAGE.decode()
+    assert fetcher.stats["fetched"] == 1
+    assert fetcher.stats["revalidated"] == 1
+    # Both requests went over the same host session.
+    assert len(fetcher._sessions) == 1
+
+
+def test_cache_is_pruned(tmp_path):
+    fetcher = Fetcher(str(tmp_path))
+    now = time.time()
+    paths = []
+    for days_unused in [40, 2, 1]:
+        url = f"https://example.com/{days_unused}"
+        fetcher._write_cache(url, {"ETag": '"v1"'}, PAGE.decode())
+        paths.append(fetcher._cache_path(url) + ".json")
+        os.utime(paths[-1], (now - days_unused * 86400,) * 2)
+
+    Fetcher(str(tmp_path), cache_days=30, cache_max_bytes=os.path.getsize(paths[0]))
+    # Unused for too long, then the least recently used past the size cap.
+    assert [os.path.exists(path) for path in paths] == [False, False, True]
+
+
+def test_decodes_pages_without_a_charset_header(tmp_path, page_server):
+    fetcher = Fetcher(str(tmp_path))
+    assert fetcher.get(page_server + "/latin") == "<p>Café</p>"
+    assert fetcher.get(page_server + "/meta").endswith("<p>Café</p>")
+
+
+def test_skips_non_html_and_errors(tmp_path, page_server):
+    fetcher = Fetcher(str(tmp_path))
+    assert fetcher.get(page_server + "/paper.pdf") is None
+    assert fetcher.get(page_server + "/missing") is None
+    assert fetcher.stats["skipped"] == 1
+    assert fetcher.stats["failed"] == 1
+    assert fetcher.stats["bytes"] == 0
+
+
+def test_caps_size_and_time(tmp_path, page_server):
+    fetcher = Fetcher(str(tmp_path), max_bytes=100_000, timeout=(1, 0.5), deadline=0.5)
+    assert len(fetcher.get(page_server + "/huge")) < 200_000
+    # A truncated page isn't cached, to be revalidated as is later.
+    assert fetcher._read_cache(page_server + "/huge") is None
+
+    start = time.time()
+    slow = fetcher.get(page_server + "/slow")
+    assert time.time() - start < 1.5
+    assert slow.startswith("<p>drip</p>")
+
+    assert fetcher.get(page_server + "/stalled") is None
+    assert fetcher.stats["failed"] == 1
+
+
+def test_pipeline_threads_share_one_fetcher(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(get_toots, "_fetcher", None)
+    monkeypatch.setattr(get_toots, "_host_scheduler", None)
+    built = []
+
+    class SlowFetcher:
+        def __init__(self, *args, **kwargs):
+            built.append(self)
+            time.sleep(0.05)
+
+    monkeypatch.setattr(get_toots, "Fetcher", SlowFetcher)
+    fetchers = []
+    threads = [
+        threading.Thread(target=lambda: fetchers.append(get_toots.get_fetcher()))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1
+    assert all(fetcher is built[0] for fetcher in fetchers)
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from hosts import HostScheduler, HostUnavailable, interleave
+
+
+def test_requests_to_a_host_are_capped_and_spaced():
+    scheduler = HostScheduler(max_per_host=2, min_interval=0.05)
+    active, peak, starts = [0], [0], []
+    lock = threading.Lock()
+
+    def request(url):
+        with scheduler.slot(url):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+                starts.append(time.time())
+            time.sleep(0.1)
+            with lock:
+                active[0] -= 1
+
+    threads = [
+        threading.Thread(target=request, args=(f"https://a.com/{i}",))
+        for i in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    starts.sort()
+    assert all(b - a >= 0.045 for a, b in zip(starts, starts[1:]))
+
+
+def test_failing_host_is_skipped_then_probed():
+    scheduler = HostScheduler(min_interval=0, failure_threshold=3, cooldown=60)
+    for _ in range(3):
+        with scheduler.slot("https://down.com/"):
+            scheduler.record("https://down.com/", ok=False, latency=1.0)
+    with pytest.raises(HostUnavailable):
+        with scheduler.slot("https://down.com/page"):
+            pass
+    # Other hosts are unaffected.
+    with scheduler.slot("https://up.com/"):
+        pass
+
+    scheduler.health["down.com"]["opened_at"] -= 61
+    assert scheduler.circuit("down.com") == "half-open"
+    with scheduler.slot("https://down.com/"):
+        # Only one request probes the host.
+        with pytest.raises(HostUnavailable):
+            with scheduler.slot("https://down.com/other"):
+                pass
+        scheduler.record("https://down.com/", ok=True, latency=0.5)
+    assert scheduler.circuit("down.com") == "closed"
+    assert scheduler.health["down.com"]["latency"] == pytest.approx(0.85)
+
+
+def test_no_request_starts_past_the_deadline():
+    scheduler = HostScheduler(max_per_host=1, min_interval=10)
+    with scheduler.deadline(0.1):
+        with scheduler.slot("https://a.com/1"):
+            pass
+        start = time.time()
+        with pytest.raises(HostUnavailable):
+            with scheduler.slot("https://a.com/2"):
+                pass
+        assert time.time() - start < 1
+    assert scheduler.remaining() is None
+
+
+def test_health_is_kept_between_runs(tmp_path):
+    path = str(tmp_path / "hosts.json")
+    scheduler = HostScheduler(path, failure_threshold=1)
+    scheduler.record("https://www.down.com/", ok=False)
+    scheduler.save()
+    assert not HostScheduler(path).available("https://down.com/page")
+
+
+def test_interleave_alternates_hosts():
+    urls = ["https://a.com/1", "https://a.com/2", "https://a.com/3", "https://b.com/1"]
+    assert interleave(urls) == [
+        "https://a.com/1",
+        "https://b.com/1",
+        "https://a.com/2",
+        "https://a.com/3",
+    ]
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta, timezone
+
+from mastodon import Mastodon
+
+import fake_mastodon
+import ingest
+import toot_store
+
+
+def test_incremental_ingest(tmp_path):
+    fake = fake_mastodon.FakeMastodon(fake_mastodon.make_timeline(500, hours=36))
+    server, url = fake_mastodon.serve(fake)
+    mastodon = Mastodon(api_base_url=url, version_check_mode="none")
+    paths = dict(
+        checkpoint_path=str(tmp_path / "min_id.txt"),
+        store_path=str(tmp_path / "toots.jsonl"),
+    )
+
+    first = ingest.ingest(mastodon, overlap=timedelta(0), **paths)
+    # Only the last 24 of the 36 hours are fetched.
+    assert 320 <= len(first) <= 345
+
+    # Nothing new: a single empty page.
+    requests_before = fake.requests
+    assert ingest.ingest(mastodon, overlap=timedelta(0), **paths) == []
+    assert fake.requests - requests_before == 1
+
+    later = datetime.now(timezone.utc) + timedelta(minutes=5)
+    fake.add_toots(fake_mastodon.make_timeline(10, hours=0.01, seed=1, now=later))
+    assert len(ingest.ingest(mastodon, overlap=timedelta(0), **paths)) == 10
+
+    toots = toot_store.load_window(paths["store_path"])
+    assert len(toots) == len(first) + 10
+    assert len(set(x.id for x in toots)) == len(toots)
+    server.shutdown()
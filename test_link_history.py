@@ -0,0 +1,69 @@
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+
+import pytest
+
+import artifacts
+import get_toots
+from link_history import LinkHistory, get_link_history
+import replay
+import settings
+from toot_store import TootRecord
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = LinkHistory(str(tmp_path / "history.sqlite"), keep_days=30)
+    yield history
+    history.close()
+
+
+def test_new_and_rising_links(history):
+    a, b, c = "https://a.com", "https://b.com", "https://c.com"
+    history.record_scores("2023-06-01", {a: (10, 5), b: (3, 2)})
+    history.record_scores("2023-06-02", {a: (4, 2), b: (3, 1)})
+    history.record_scores("2023-06-03", {a: (2, 1), b: (30, 12), c: (8, 4)})
+    assert history.new_links("2023-06-03") == [(c, 8)]
+    # b.com: 30 against (3 + 3) / 2; a.com is below its average.
+    assert history.rising("2023-06-03", days=2) == [(b, 30, 3)]
+    assert history.trend(a, since="2023-06-02") == [
+        ("2023-06-02", 4, 2),
+        ("2023-06-03", 2, 1),
+    ]
+
+
+def test_scores_of_a_day_are_replaced_and_old_ones_forgotten(history):
+    history.record_scores("2023-01-01", {"https://a.com": (1, 1)})
+    history.record_scores("2023-06-01", {"https://a.com": (1, 1)})
+    history.record_scores("2023-06-01", {"https://a.com": (5, 3)})
+    assert history.trend("https://a.com") == [("2023-06-01", 5, 3)]
+
+
+def test_featured_within_the_last_days(history):
+    cluster = ["https://a.com", "https://a.org"]
+    history.record_featured(
+        "2023-06-01", [{"url": "https://a.com", "title": "A", "cluster": cluster}]
+    )
+    history.record_featured("2023-06-05", [{"url": "https://b.com", "tldr": "B"}])
+    assert history.featured_within("2023-06-05", 7) == set(cluster)
+    assert history.featured_within("2023-06-09", 7) == {"https://b.com"}
+    assert history.featured_within("2023-06-09", 0) == set()
+
+
+def test_score_stage_drops_recent_links_of_the_day():
+    today = date.today()
+    now = datetime.now(timezone.utc)
+    links = [f"https://example.com/{i}" for i in range(4)]
+    # Link i is liked 10 * (4 - i) times: the first one is the most popular.
+    toots = [
+        TootRecord(i, f"toot/{i}", now, "u", False, "public", 10 * (4 - i), 0, [link])
+        for i, link in enumerate(links)
+    ]
+    resolved = {link: link for link in links}
+    with replay.fresh_workdir(), mock.patch.object(settings, "candidate_links", 2):
+        get_link_history().record_featured(
+            (today - timedelta(days=1)).isoformat(), [{"url": links[0]}]
+        )
+        run = artifacts.Run(today.isoformat(), root="artifacts")
+        scored = get_toots.stage_score(run, toots, resolved)
+    assert [link["url"] for link in scored] == links[1:3]
@@ -0,0 +1,86 @@
+import json
+import threading
+import time
+
+import pytest
+
+from llm import LLM, LLMError, TokenBudget, parse_json_object
+import mock_llm
+
+
+class ScriptedBackend:
+    """Answers (or raises) from a list, in order."""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.models = []
+
+    def complete(self, model, messages, json_mode=False):
+        self.models.append(model)
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer, 10
+
+
+def test_invalid_answers_are_asked_again_before_the_next_model():
+    backend = ScriptedBackend(["Sure! {", '{"title": "T"}'])
+    llm = LLM(backend, hedge_percentile=None)
+    completion = llm.complete("p", ["a", "b"], parse=parse_json_object, delays=(0,) * 3)
+    assert completion == ({"title": "T"}, 10, "a")
+    assert backend.models == ["a", "a"]
+
+    backend = ScriptedBackend(["[]", "no", '{"title": "T"}'])
+    llm = LLM(backend, hedge_percentile=None)
+    completion = llm.complete("p", ["a", "b"], parse=parse_json_object, delays=(0,) * 3)
+    assert completion == ({"title": "T"}, 10, "b")
+    assert backend.models == ["a", "a", "b"]
+
+
+def test_failed_requests_are_retried_then_given_up():
+    backend = ScriptedBackend([LLMError("rate limited"), "Bats."])
+    llm = LLM(backend, hedge_percentile=None)
+    assert llm.complete("p", ["a"], delays=(0, 0)) == ("Bats.", 10, "a")
+
+    backend = ScriptedBackend([LLMError("down")] * 2)
+    llm = LLM(backend, hedge_percentile=None)
+    assert llm.complete("p", ["a"], delays=(0, 0)) is None
+
+
+def test_slow_requests_are_hedged():
+    backend = mock_llm.MockBackend(
+        mock_llm.MockLLM(latency=0.01), slow_every=12, slow_latency=2.0
+    )
+    llm = LLM(backend, hedge_percentile=0.9)
+    for _ in range(11):
+        llm.complete("p", ["a"])
+    start = time.time()
+    content, _, _ = llm.complete("p", ["a"])
+    assert time.time() - start < 1.0
+    assert content == "Science, more science, and bats."
+    assert backend.calls == 13
+
+
+def test_token_budget_waits_for_room():
+    budget = TokenBudget(100)
+    first = budget.acquire(60)
+    budget.acquire(30)
+    acquired = threading.Event()
+
+    def acquire():
+        budget.acquire(50)
+        acquired.set()
+
+    threading.Thread(target=acquire, daemon=True).start()
+    assert not acquired.wait(0.1)
+    # The first request used fewer tokens than estimated.
+    budget.settle(first, 10)
+    assert acquired.wait(1)
+    assert budget.used == 90
+
+
+@pytest.mark.parametrize("answer", ['["a"]', "not json"])
+def test_parse_json_object_rejects_other_answers(answer):
+    with pytest.raises(ValueError):
+        parse_json_object(answer)
+    assert parse_json_object(json.dumps({"a": 1})) == {"a": 1}
@@ -0,0 +1,52 @@
+from metadata import fallback_tldr, read_head, summary_from_head
+
+
+def read(name):
+    with open(f"fixtures/pages/{name}.html", encoding="utf-8") as f:
+        return f.read()
+
+
+def test_paper_is_summarized_from_its_head():
+    html = read("arxiv_abs")
+    head = read_head(html)
+    assert head["parsed"] == html.index("</head>") + len("</head>")
+    assert summary_from_head("https://arxiv.org/abs/2304.01234", head) == {
+        "website": "arXiv.org",
+        "title": "Emergent grid codes in recurrent networks trained to path integrate",
+        "is_scientific_article": True,
+        "is_news": False,
+        "summary": "We train recurrent neural networks to path integrate and find "
+        "grid-like codes.",
+    }
+
+
+def test_teasers_and_bare_pages_are_left_to_the_llm():
+    url = "https://news.example.com/bats"
+    assert summary_from_head(url, read_head(read("news_article"))) is None
+    assert summary_from_head(url, read_head(read("blog_post"))) is None
+
+
+def test_long_description_counts_as_a_summary():
+    description = "Bats " * 50
+    html = (
+        "<html><head><title>Bats</title>"
+        '<meta property="og:title" content="Bats &amp; grids">'
+        '<meta property="og:type" content="article">'
+        f'<meta name="description" content="{description}">'
+        "<body><p>Never parsed</p></body></html>"
+    )
+    head = read_head(html)
+    assert head["parsed"] == html.index("<body>") + len("<body>")
+    assert summary_from_head("https://www.bats.com/grids", head) == {
+        "website": "bats.com",
+        "title": "Bats & grids",
+        "is_scientific_article": False,
+        "is_news": True,
+        "summary": description.strip(),
+    }
+
+
+def test_fallback_tldr_is_the_start_of_the_abstract():
+    abstract = "Bats navigate. Grid cells help. Here we show how. More."
+    assert fallback_tldr(abstract) == "Bats navigate. Grid cells help."
+    assert fallback_tldr("word " * 100, max_chars=20) == "word word word word…"
@@ -0,0 +1,38 @@
+import json
+import time
+
+from metrics import Metrics
+
+
+def test_report_and_prometheus_textfile(tmp_path):
+    metrics = Metrics()
+
+    @metrics.timed("work")
+    def work(seconds):
+        time.sleep(seconds)
+
+    work(0.01)
+    work(0.03)
+    metrics.incr("openai.retries.gpt-4")
+    metrics.incr("fetch_html.bytes", 1000)
+    metrics.incr("fetch_html.bytes", 500)
+    metrics.set_info("summary_cache", {"hits": 3})
+    try:
+        with metrics.span("failing"):
+            raise ValueError
+    except ValueError:
+        pass
+
+    metrics.write_report(str(tmp_path / "report.json"), "get_toots", str(tmp_path))
+    with open(tmp_path / "report.json") as f:
+        report = json.load(f)
+    assert report["spans"]["work"]["count"] == 2
+    assert 0.04 <= report["spans"]["work"]["total"] < 0.1
+    assert report["spans"]["work"]["max"] >= 0.03
+    assert report["spans"]["failing"]["count"] == 1
+    assert report["counters"] == {"openai.retries.gpt-4": 1, "fetch_html.bytes": 1500}
+    assert report["info"] == {"summary_cache": {"hits": 3}}
+
+    prom = (tmp_path / "lotd_get_toots.prom").read_text()
+    assert 'lotd_span_seconds_count{job="get_toots",span="work"} 2' in prom
+    assert 'lotd_events_total{job="get_toots",name="fetch_html.bytes"} 1500' in prom
@@ -0,0 +1,69 @@
+import time
+
+import get_toots
+from pipeline import Stage, run_pipeline
+
+
+def test_run_pipeline_keeps_order_and_overlaps_stages():
+    def slow_double(x):
+        time.sleep(0.05 * (5 - x))
+        return 2 * x
+
+    def drop_odd(x):
+        time.sleep(0.05)
+        return None if x % 4 else x
+
+    results, report = run_pipeline(
+        list(range(5)), [Stage("double", slow_double, 5), Stage("drop", drop_odd, 5)]
+    )
+    assert results == [0, None, 4, None, 8]
+    assert report["completed"] == 3
+    assert report["stages"]["double"]["calls"] == 5
+    # Serially this would take 0.75 + 0.25 s.
+    assert report["wall_time"] < 0.5
+
+
+def test_batched_stage():
+    batches = []
+
+    def total(xs):
+        batches.append(len(xs))
+        return [sum(xs)] * len(xs)
+
+    results, report = run_pipeline(
+        [1, 2, 3, 4, 5], [Stage("drop", lambda x: x if x != 2 else None), Stage("total", total, 1, 2)]
+    )
+    assert results == [4, None, 4, 9, 9]
+    assert batches == [2, 2]
+    assert report["stages"]["total"]["batch_size"] == 2
+
+
+def test_summarize_links_with_fake_backends():
+    pages = {
+        "https://a.org": "<title>A</title><body><p>Alpha</p></body>",
+        "https://b.org": "<title>B</title><body><p>Same story</p></body>",
+        "https://c.org": "<title>C</title><body><p>Same story, elsewhere</p></body>",
+        "https://d.org": "<title>D</title><body></body>",
+        "https://e.org": "<title>E</title><body><p>A pdf</p></body>",
+    }
+
+    def fetch(url):
+        time.sleep(0.1)
+        return pages.get(url)
+
+    def summarize(webpage_data):
+        time.sleep(0.1)
+        title = "Same" if "Same" in webpage_data["body"] else webpage_data["title"]
+        return {"title": title, "summary": webpage_data["body"]}
+
+    def summarize_many(pages):
+        return [summarize(webpage_data) for webpage_data in pages]
+
+    links = list(pages) + ["https://missing.org"]
+    start = time.time()
+    summarized = get_toots.summarize_links(
+        links, fetch=fetch, summarize_many=summarize_many, batch_size=1
+    )
+    assert time.time() - start < 0.6
+
+    assert [page["url"] for page, _ in summarized] == ["https://a.org", "https://b.org"]
@@ -0,0 +1,90 @@
+from datetime import date, datetime, timezone
+from unittest import mock
+
+import artifacts
+import get_toots
+from popularity import DAY, HOUR, PopularityIndex
+import replay
+import settings
+from toot_store import TootRecord
+
+NOW = 1_700_000_000 // HOUR * HOUR
+
+
+def test_counts_updates_as_deltas():
+    index = PopularityIndex()
+    index.update(1, NOW - 2 * HOUR, ["a", "b"], 3)
+    index.update(2, NOW - 10 * HOUR, ["a"], 5)
+    index.advance(NOW)
+    assert index.top(2) == [("a", 8), ("b", 3)]
+
+    # Seen again with more favourites: only the difference is applied.
+    index.update(1, NOW - 2 * HOUR, ["a", "b"], 10)
+    index.update(1, NOW - 2 * HOUR, ["a", "b"], 10)
+    assert index.score("a") == 15
+    assert index.score("b") == 10
+
+    # Dropping to zero removes the link.
+    index.update(1, NOW - 2 * HOUR, ["a", "b"], 0)
+    assert index.top(5) == [("a", 5)]
+
+
+def test_sliding_windows():
+    index = PopularityIndex(windows=(HOUR, DAY), retention=7 * DAY)
+    index.update(1, NOW - 30 * 60, ["recent"], 2)
+    index.update(2, NOW - 5 * HOUR, ["today"], 4)
+    index.update(3, NOW - 3 * DAY, ["this week"], 6)
+    index.advance(NOW)
+
+    assert index.top(3, HOUR) == [("recent", 2)]
+    assert index.top(3, DAY) == [("today", 4), ("recent", 2)]
+    # Windows that are not tracked are summed from the buckets.
+    assert index.top(3, 7 * DAY) == [("this week", 6), ("today", 4), ("recent", 2)]
+    assert index.score("today", 6 * HOUR) == 4
+
+    index.advance(NOW + 20 * HOUR)
+    assert index.top(3, DAY) == [("recent", 2)]
+    assert index.top(3, HOUR) == []
+
+    # Past the retention, toots are forgotten.
+    index.advance(NOW + 8 * DAY)
+    assert index.toots == {}
+    assert index.top(3, 7 * DAY) == []
+
+
+def test_decayed_score(tmp_path):
+    index = PopularityIndex(half_life=HOUR)
+    index.update(1, NOW - 3 * HOUR, ["old"], 8)
+    index.update(2, NOW - HOUR, ["new"], 3)
+    top = index.top_decayed(2, now=NOW)
+    assert [link for link, _ in top] == ["new", "old"]
+    assert abs(top[0][1] - 1.5) < 1e-9
+    assert abs(top[1][1] - 1.0) < 1e-9
+
+    path = str(tmp_path / "popularity.pickle")
+    index.save(path)
+    assert PopularityIndex.load(path).top_decayed(2, now=NOW) == top
+    assert PopularityIndex.load(str(tmp_path / "missing")).toots == {}
+    # Saved with other settings: rebuilt with the new ones.
+    rebuilt = PopularityIndex.load(path, half_life=2 * HOUR)
+    assert rebuilt.toots == {} and rebuilt.half_life == 2 * HOUR
+
+
+def test_decayed_candidates_are_links_of_the_day():
+    now = datetime.now(timezone.utc).timestamp()
+    index = PopularityIndex(half_life=6 * HOUR, retention=7 * DAY)
+    # Links of the last days, far more popular than today's but not in its toots.
+    for day in range(1, 4):
+        index.update(-day, now - day * DAY, [f"https://old.org/{day}"], 1000)
+    links = [f"https://example.com/{i}" for i in range(3)]
+    toots = [
+        TootRecord(i, f"toot/{i}", now - HOUR, "u", False, "public", 3 - i, 0, [link])
+        for i, link in enumerate(links)
+    ]
+    with replay.fresh_workdir(), mock.patch.multiple(
+        settings, popularity_half_life_hours=6, candidate_links=2
+    ), mock.patch.object(get_toots, "get_popularity_index", lambda: index):
+        run = artifacts.Run(date.today().isoformat(), root="artifacts")
+        scored = get_toots.stage_score(run, toots, {link: link for link in links})
+    assert [link["url"] for link in scored] == links[:2]
+    assert all(link["backlinks"] and link["linked_by"] for link in scored)
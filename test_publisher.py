@@ -0,0 +1,68 @@
+import pytest
+
+from artifacts import ItemLog
+import fake_mastodon
+from publisher import DryRunPublisher, Publisher, PublishError
+
+
+def serve(**kwargs):
+    fake = fake_mastodon.FakeMastodon(**kwargs)
+    server, url = fake_mastodon.serve(fake)
+    return fake, server, Publisher(url, "token", backoff=0.01)
+
+
+def test_paced_by_rate_limit_headers():
+    fake, server, publisher = serve(ratelimit_limit=3, ratelimit_period=0.5)
+    replies = [f"<p>Link {i}</p>" for i in range(5)]
+    posted = publisher.publish_thread("<p>Digest</p>", replies, boost=True)
+
+    intro, *statuses = fake.posted
+    assert [x["content"] for x in statuses] == replies
+    assert all(x["in_reply_to_id"] == intro["id"] for x in statuses)
+    assert posted.get("intro") == intro["id"]
+    assert fake.reblogged == [intro["id"]]
+    # It waited for the resets instead of running into 429s.
+    assert fake.requests == 7
+    assert publisher.stats["retries"] == 0
+    assert publisher.stats["waited"] > 0
+    server.shutdown()
+
+
+def test_retries_429_and_5xx():
+    fake, server, publisher = serve(ratelimit_limit=2, ratelimit_period=0.5)
+    # Another client spent the budget.
+    fake.take_budget()
+    fake.take_budget()
+    fake.failures = 2
+    status = publisher.post_status("<p>Hello</p>", idempotency_key="hello")
+    assert [x["id"] for x in fake.posted] == [status["id"]]
+    assert publisher.stats["retries"] >= 3
+
+    # Retried with the same idempotency key: not posted twice.
+    assert publisher.post_status("<p>Hello</p>", idempotency_key="hello") == status
+    assert len(fake.posted) == 1
+
+    with pytest.raises(PublishError):
+        publisher.reblog("404")
+    server.shutdown()
+
+
+def test_resumes_thread():
+    fake, server, publisher = serve()
+    posted = ItemLog()
+    posted.add("intro", "1")
+    posted.add("reply-0", "2")
+    publisher.publish_thread("<p>Digest</p>", ["<p>A</p>", "<p>B</p>"], posted)
+    assert [x["content"] for x in fake.posted] == ["<p>B</p>"]
+    assert fake.posted[0]["in_reply_to_id"] == "1"
+    server.shutdown()
+
+
+def test_dry_run(tmp_path):
+    publisher = DryRunPublisher()
+    publisher.publish_thread("<p>Digest</p>", ["<p>A & B</p>"], boost=True)
+    publisher.write(str(tmp_path / "thread.html"))
+    thread = (tmp_path / "thread.html").read_text()
+    assert "<p>Digest</p>" in thread and "<p>A & B</p>" in thread
+    assert "in reply to #1" in thread and "boosted" in thread
+    assert publisher.stats["requests"] == 0
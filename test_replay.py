@@ -0,0 +1,34 @@
+import json
+import time
+
+import replay
+
+
+def read_lotd():
+    with open(f"cache/lotd-{time.strftime('%Y-%m-%d', time.localtime())}.json") as f:
+        return json.load(f)
+
+
+def test_record_then_replay_offline(tmp_path):
+    replay.make_bundle(str(tmp_path / "synthetic"), n_toots=300)
+
+    # Record a run against the stand-ins, as if they were the real services.
+    with replay.replaying(str(tmp_path / "synthetic")) as stand_ins:
+        recorder = replay.Recorder()
+        with replay.recording(stand_ins.mastodon, recorder):
+            reports = replay.run(stand_ins.mastodon)
+        lotd = read_lotd()
+        # Nothing was posted while recording.
+        assert stand_ins.fake.posted == []
+    recorder.save(str(tmp_path / "recorded"))
+
+    assert len(recorder.posted) == 1 + len(lotd) > 1
+    assert len(recorder.llm) == stand_ins.llm.requests
+    assert set(recorder.pages) <= set(stand_ins.bundle["pages"])
+    assert reports["get_toots"]["counters"]["fetch_html.pages"] == len(recorder.pages)
+    assert "status_post" in reports["post_toots"]["spans"]
+
+    with replay.replaying(str(tmp_path / "recorded")) as stand_ins:
+        replay.run(stand_ins.mastodon)
+        assert read_lotd() == lotd
+        assert len(stand_ins.fake.posted) == len(recorder.posted)
@@ -0,0 +1,28 @@
+import pytest
+
+import settings
+
+
+@pytest.fixture(autouse=True)
+def restore_settings(monkeypatch):
+    for name in settings._names():
+        monkeypatch.setattr(settings, name, getattr(settings, name))
+
+
+def test_load_from_toml_then_environment(tmp_path):
+    path = tmp_path / "settings.toml"
+    path.write_text('mastodon_url = "https://fediscience.org"\ncandidate_links = 50\n')
+    settings.load(
+        str(path), environ={"LOTD_CANDIDATE_LINKS": "40", "LOTD_DRY_RUN": "true"}
+    )
+    assert settings.mastodon_url == "https://fediscience.org"
+    assert settings.sources == [
+        {"instance": "https://fediscience.org", "timeline": "local"}
+    ]
+    assert settings.candidate_links == 40
+    assert settings.dry_run is True
+
+
+def test_unknown_setting_is_an_error():
+    with pytest.raises(ValueError, match="candidate_linkz"):
+        settings.load(environ={"LOTD_CANDIDATE_LINKZ": "40"})
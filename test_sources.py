@@ -0,0 +1,137 @@
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import urlparse
+
+from mastodon import Mastodon
+
+import fake_mastodon
+import get_toots
+import ingest
+import settings
+from sources import Source, dedupe, get_clients
+import toot_store
+
+
+def federation():
+    """Two fake instances; b.social also has some of a.social's toots, with
+    other ids and lower counts."""
+    a_toots = fake_mastodon.make_timeline(200, hours=20, host="a.social")
+    b_toots = fake_mastodon.make_timeline(150, hours=20, seed=1, host="b.social")
+    federated = [
+        dict(toot, id=str(int(toot["id"]) + 1), favourites_count=0, reblogs_count=0)
+        for toot in a_toots[:50]
+    ]
+    a = fake_mastodon.FakeMastodon(a_toots, latency=0.01)
+    b = fake_mastodon.FakeMastodon(
+        sorted(b_toots + federated, key=lambda x: int(x["id"]), reverse=True),
+        latency=0.01,
+        lists={"7": {toot["account"]["username"] for toot in b_toots[:10]}},
+    )
+    servers = []
+    clients = {}
+    for fake, timelines in [(a, ["local"]), (b, ["public", "tag/preprint", "list/7"])]:
+        server, url = fake_mastodon.serve(fake)
+        servers.append(server)
+        for timeline in timelines:
+            clients[Source(url, timeline)] = Mastodon(
+                api_base_url=url, version_check_mode="none"
+            )
+    return a_toots + b_toots, (a, b), servers, clients
+
+
+def test_ingest_sources(tmp_path):
+    toots, (a, b), servers, clients = federation()
+    paths = dict(
+        checkpoint_dir=str(tmp_path / "checkpoints"),
+        store_path=str(tmp_path / "toots.jsonl"),
+    )
+
+    records = ingest.ingest_sources(clients, overlap=timedelta(0), **paths)
+    # Every toot once, whichever sources saw it.
+    assert sorted(x.uri for x in records) == sorted(x["uri"] for x in toots)
+    by_uri = {x.uri: x for x in records}
+    for toot in toots[:50]:
+        # The copy with the counts of the original instance wins.
+        assert by_uri[toot["uri"]].popularity == (
+            toot["favourites_count"] + toot["reblogs_count"]
+        )
+    assert len(list((tmp_path / "checkpoints").iterdir())) == 4
+
+    # Each source resumes from its own checkpoint: one empty page each.
+    requests_before = a.requests + b.requests
+    assert ingest.ingest_sources(clients, overlap=timedelta(0), **paths) == []
+    assert a.requests + b.requests - requests_before == 4
+
+    assert len(toot_store.load_window(paths["store_path"])) == len(toots)
+    for server in servers:
+        server.shutdown()
+
+
+def test_fetch_day():
+    toots, _, servers, clients = federation()
+    records = get_toots.fetch_day(clients)
+    assert sorted(x.uri for x in records) == sorted(x["uri"] for x in toots)
+
+    # A source that fails is left out.
+    servers[0].shutdown()
+    servers[0].server_close()
+    records = get_toots.fetch_day(clients)
+    assert {x.uri for x in records} == {x["uri"] for x in toots[200:]} | {
+        x["uri"] for x in toots[:50]
+    }
+    servers[1].shutdown()
+
+
+def test_fetch_day_resumes_from_its_log(tmp_path):
+    toots, (a, b), servers, clients = federation()
+    log_path = str(tmp_path / "ingest.items.jsonl")
+    records = get_toots.fetch_day(clients, log_path)
+    requests = a.requests + b.requests
+
+    # A crash after the first pages, mid-line.
+    with open(log_path) as f:
+        lines = f.readlines()
+    with open(log_path, "w") as f:
+        f.writelines(lines[:60])
+        f.write(lines[60][:30])
+    resumed = get_toots.fetch_day(clients, log_path)
+    assert sorted(x.uri for x in resumed) == sorted(x.uri for x in records)
+    assert a.requests + b.requests - requests < requests
+    for server in servers:
+        server.shutdown()
+
+
+def test_accounts_of_other_instances_keep_their_host():
+    clients, servers = {}, []
+    for seed, host in enumerate(["a.social", "b.social"]):
+        toots = fake_mastodon.make_timeline(1, hours=1, seed=seed, host=host)
+        toots[0]["account"].update(username="alice", acct="alice")
+        server, url = fake_mastodon.serve(fake_mastodon.FakeMastodon(toots))
+        servers.append(server)
+        clients[Source(url)] = Mastodon(api_base_url=url, version_check_mode="none")
+    own, other = clients
+
+    with mock.patch.object(settings, "mastodon_url", own.instance):
+        records = get_toots.fetch_day(clients)
+    # @alice is on the bot's instance; the other alice gets the host of theirs.
+    assert sorted(x.acct for x in records) == [
+        "alice",
+        f"alice@{urlparse(other.instance).netloc}",
+    ]
+    for server in servers:
+        server.shutdown()
+
+
+def test_sources():
+    source = Source("https://fake.social/", "tag/neuroscience")
+    assert source.instance == "https://fake.social"
+    assert source.name == "fake.social/tag/neuroscience"
+    assert source.slug == "fake_social_tag_neuroscience"
+
+    mastodon = object()
+    clients = get_clients([Source("https://neuromatch.social")], mastodon)
+    assert list(clients.values()) == [mastodon]
+
+    record = toot_store.TootRecord(1, "u", None, "a", False, "public", 1, 0, [])
+    copy = toot_store.TootRecord(2, "u", None, "a", False, "public", 3, 1, [])
+    assert dedupe([record, copy]) == [copy]
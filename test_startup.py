@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+# Slow to import, and only needed by some stages.
+HEAVY = {"openai", "selenium", "mastodon", "bs4", "pytz", "tqdm"}
+
+
+def import_times(statement):
+    """Cumulative import time of every module imported by statement, in µs."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def heavy(times):
+    return sorted({name.split(".")[0] for name in times} & HEAVY)
+
+
+def test_cli_starts_without_heavy_dependencies():
+    times = import_times("import lotd")
+    assert heavy(times) == []
+    # ~20 ms here; a heavy import slipping in costs 100 ms or more.
+    assert times["lotd"] < 100_000
+
+
+def test_commands_import_only_what_they_need():
+    assert heavy(import_times("import boost_digest, post_toots")) == []
+    assert heavy(import_times("import ingest")) == ["bs4"]
+    assert heavy(import_times("import truncation")) == []
@@ -0,0 +1,99 @@
+import json
+
+import openai
+import pytest
+
+import get_toots
+from llm import LLM
+import mock_llm
+import summary_cache
+from summary_cache import SummaryCache
+from test_llm import ScriptedBackend
+
+
+@pytest.fixture
+def llm(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        summary_cache, "_summary_cache", SummaryCache(str(tmp_path / "s.sqlite"))
+    )
+    monkeypatch.setattr("llm._llm", None)
+    mock = mock_llm.MockLLM(malformed={"https://c.org/"})
+    server, url = mock_llm.serve(mock)
+    monkeypatch.setattr(openai, "api_base", url)
+    monkeypatch.setattr(openai, "api_key_path", None)
+    monkeypatch.setattr(openai, "api_key", "sk-mock")
+    yield mock
+    server.shutdown()
+
+
+def make_page(name):
+    return {
+        "url": f"https://{name}.org/",
+        "title": f"Page {name}",
+        "description": "",
+        "body": f"<p>All about {name}.</p>",
+    }
+
+
+def test_batch_with_fallback_for_malformed_entries(llm):
+    pages = [make_page(name) for name in "abcd"]
+    summaries = get_toots.summarize_webpages(pages)
+    assert [s["title"] for s in summaries] == ["Page a", "Page b", "Page c", "Page d"]
+    # One batch, plus one request for the malformed entry.
+    assert llm.requests == 2
+
+    # Everything is cached now.
+    assert get_toots.summarize_webpages(pages) == summaries
+    assert llm.requests == 2
+
+
+def test_summarize_links_batches_pages(llm, monkeypatch):
+    monkeypatch.setattr(get_toots.settings, "summarize_workers", 1)
+    pages = {f"https://{name}.org/": make_page(name) for name in "abdef"}
+
+    def fetch(url):
+        page = pages[url]
+        return f"<title>{page['title']}</title><body>{page['body']}</body>"
+
+    summarized = get_toots.summarize_links(list(pages), fetch=fetch, batch_size=5)
+    assert [page["url"] for page, _ in summarized] == list(pages)
+    assert llm.requests == 1
+
+
+def test_pages_with_metadata_only_need_a_tldr(llm):
+    with open("fixtures/pages/arxiv_abs.html", encoding="utf-8") as f:
+        paper = get_toots.webpage_data_from_head("https://arxiv.org/abs/1", f.read())
+    pages = [make_page("a"), paper]
+    summaries = get_toots.summarize_webpages(pages)
+    assert summaries[1] == {
+        **paper["metadata"],
+        "tldr": "Emergent grid codes in recurrent networks trained to path "
+        "integrate, in short.",
+    }
+    # The tldr, and the other page on its own.
+    assert llm.requests == 2
+    assert llm.pages == 2
+
+
+def test_summaries_missing_keys_are_asked_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        summary_cache, "_summary_cache", SummaryCache(str(tmp_path / "s.sqlite"))
+    )
+    summary = mock_llm.MockLLM().summary("https://a.org/", "Page a")
+    backend = ScriptedBackend([json.dumps({"title": "Page a"}), json.dumps(summary)])
+    monkeypatch.setattr("llm._llm", LLM(backend, hedge_percentile=None))
+    assert get_toots.summarize_webpages([make_page("a")]) == [summary]
+    assert backend.models == ["gpt-3.5-turbo"] * 2
+
+
+def test_metadata_pages_without_a_tldr_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        summary_cache, "_summary_cache", SummaryCache(str(tmp_path / "s.sqlite"))
+    )
+    backend = ScriptedBackend(["Sorry", "Sorry"])
+    monkeypatch.setattr("llm._llm", LLM(backend, hedge_percentile=None))
+    with open("fixtures/pages/arxiv_abs.html", encoding="utf-8") as f:
+        paper = get_toots.webpage_data_from_head("https://arxiv.org/abs/1", f.read())
+    [summary] = get_toots.summarize_webpages([paper])
+    assert summary["title"] == paper["metadata"]["title"]
+    assert summary["tldr"] == paper["metadata"]["summary"]
@@ -0,0 +1,63 @@
+import json
+
+import openai
+
+import get_toots
+import summary_cache
+from summary_cache import SummaryCache, cache_key
+
+
+def test_get_put_expire_and_evict(tmp_path):
+    cache = SummaryCache(str(tmp_path / "s.sqlite"), max_entries=2)
+    assert cache.get("a") is None
+    cache.put("a", {"title": "A"}, "gpt-4", 1000)
+    cache.put("b", {"title": "B"}, "gpt-3.5-turbo", 1000)
+    assert cache.get("a") == {"title": "A"}
+    # "b" is now the least recently used entry.
+    cache.put("c", {"title": "C"})
+    assert cache.get("b") is None
+    assert cache.get("c") == {"title": "C"}
+
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+    assert stats["tokens_saved"] == 1000
+    assert stats["cost_saved_usd"] == 0.045
+
+    cache.ttl = 0
+    assert cache.get("a") is None
+
+
+def test_cache_key_depends_on_url_and_prompt():
+    assert cache_key("webpage", "https://a.org", "p") == cache_key("webpage", "https://a.org", "p")
+    assert cache_key("webpage", "https://a.org", "p") != cache_key("webpage", "https://b.org", "p")
+    assert cache_key("webpage", "https://a.org", "p") != cache_key("webpage", "https://a.org", "q")
+
+
+def test_summarize_webpage_hits_the_model_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        summary_cache, "_summary_cache", SummaryCache(str(tmp_path / "s.sqlite"))
+    )
+    calls = []
+    summary = {
+        "website": "example.com",
+        "title": "T",
+        "is_scientific_article": False,
+        "is_news": True,
+        "summary": "S",
+        "tldr": "TL;DR",
+    }
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        return {
+            "choices": [{"message": {"content": json.dumps(summary)}}],
+            "usage": {"total_tokens": 500},
+        }
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    monkeypatch.setattr("llm._llm", None)
+    page = {"url": "https://www.example.com/story?utm_source=x", "title": "T", "body": "Body"}
+    assert get_toots.summarize_webpage(page) == summary
+    page["url"] = "https://example.com/story"
+    assert get_toots.summarize_webpage(page) == summary
+    assert len(calls) == 1
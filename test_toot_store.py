@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, timezone
+import json
+import random
+
+from extract import extract_links
+import fake_mastodon
+from toot_store import TootRecord, load_window, write_records
+
+
+def test_records_round_trip_and_compaction(tmp_path):
+    path = str(tmp_path / "toots.jsonl")
+    statuses = fake_mastodon.make_timeline(20, hours=30)
+    records = write_records(map(TootRecord.from_status, statuses), path)
+    assert records[0].links == extract_links(statuses[0]["content"])
+    assert not hasattr(records[0], "__dict__")
+
+    # Re-fetched toots: the last copy wins.
+    statuses[0]["favourites_count"] = 1000
+    write_records([TootRecord.from_status(statuses[0])], path)
+    window = load_window(path)
+    assert len(window) == 16
+    assert window[0].id == records[0].id and window[0].popularity >= 1000
+
+    # 21 lines for 16 live toots: not compacted yet.
+    with open(path) as f:
+        assert len(f.readlines()) == 21
+    assert len(load_window(path, timedelta(hours=6))) == 4
+    with open(path) as f:
+        assert len(f.readlines()) == 4
+
+
+def test_reads_stores_of_full_statuses(tmp_path):
+    path = tmp_path / "toots.jsonl"
+    status = fake_mastodon.make_toot(
+        1 << 16, datetime.now(timezone.utc), random.Random(0)
+    )
+    status["account"]["note"] = "<p>#nobot</p>"
+    path.write_text(json.dumps(status) + "\n")
+    (record,) = load_window(str(path))
+    assert record.id == 1 << 16
+    assert record.nobot
+    assert record.uri == status["uri"]
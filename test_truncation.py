@@ -1,8 +1,44 @@
-from get_toots import truncate_paragraph
+from truncation import count_tokens, find_abstract, truncate_body, truncate_tokens
+
 
 def test_truncate_text():
     sentence = "this is bad text"
-    assert truncate_paragraph(sentence, 3) == "this is bad..."
+    assert truncate_tokens(sentence, 3) == ("this is bad", 3, True)
+    assert truncate_tokens(sentence, 10) == (sentence, 4, False)
 
+    # Never cut inside a tag, however much punctuation there is.
     sentence = "this <is></is> bad text"
-    assert truncate_paragraph(sentence, 3) == "this <is></is>..."
\ No newline at end of file
+    text, _, cut = truncate_tokens(sentence, 3)
+    assert cut and text == "this"
+    text, _, _ = truncate_tokens('<a href="https://x.org/?a=1&amp;b=2">link</a> tail', 8)
+    assert "<" not in text
+
+
+def test_long_words_cost_more():
+    assert count_tokens("cat") == 1
+    assert count_tokens("antidisestablishmentarianism") > 1
+
+
+def test_truncate_body_puts_description_and_abstract_first():
+    contents = {
+        "description": "Grid cells in bats.",
+        "body": "<h1>Menu</h1><p>Lots of boilerplate.</p>"
+        "<h2>Abstract</h2><p>We recorded grid cells.</p><h2>Methods</h2><p>Bats.</p>",
+    }
+    start, end = find_abstract(contents["body"])
+    assert contents["body"][start:end] == "<h2>Abstract</h2><p>We recorded grid cells.</p>"
+
+    text = truncate_body(contents, 1000)
+    assert text.split("\n") == [
+        "Grid cells in bats.",
+        "<h2>Abstract</h2><p>We recorded grid cells.</p>",
+        "<h1>Menu</h1><p>Lots of boilerplate.</p><h2>Methods</h2><p>Bats.</p>",
+    ]
+    assert truncate_body(contents, 10).endswith("...")
+
+
+def test_truncate_body_stops_early_on_huge_pages():
+    contents = {"description": "", "body": "<p>word</p>" * 1_000_000}
+    text = truncate_body(contents, 100)
+    assert len(text) < 1000 and text.endswith("...")
+    assert count_tokens(text) <= 101
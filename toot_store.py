@@ -0,0 +1,139 @@
+"""Compact toot records and their append-only JSONL store.
+
+A status from the API carries the whole account, media attachments, emojis,
+mentions and rendered HTML, but ranking links only needs a handful of fields.
+Each status is reduced to a TootRecord as soon as it arrives and written to
+the store as a stream, so a day of toots is never held as full objects.
+"""
+from datetime import datetime, timedelta, timezone
+import json
+import logging
+import os
+
+from extract import extract_links
+
+logger = logging.getLogger(__name__)
+
+
+class TootRecord:
+    __slots__ = (
+        "id",
+        "uri",
+        "created_at",
+        "acct",
+        "nobot",
+        "visibility",
+        "favourites_count",
+        "reblogs_count",
+        "links",
+    )
+
+    def __init__(
+        self,
+        id,
+        uri,
+        created_at,
+        acct,
+        nobot,
+        visibility,
+        favourites_count,
+        reblogs_count,
+        links,
+    ):
+        self.id = id
+        self.uri = uri
+        self.created_at = created_at
+        self.acct = acct
+        self.nobot = nobot
+        self.visibility = visibility
+        self.favourites_count = favourites_count
+        self.reblogs_count = reblogs_count
+        self.links = links
+
+    @classmethod
+    def from_status(cls, status, host=None):
+        """The record of a status dict from the Mastodon API, read from host.
+        The acct of a local account is a bare username there, which is made
+        user@host unless host is None (the bot's own instance)."""
+        acct = status["account"]["acct"]
+        if host is not None and "@" not in acct:
+            acct = f"{acct}@{host}"
+        return cls(
+            int(status["id"]),
+            status["uri"],
+            _parse_datetime(status["created_at"]),
+            acct,
+            "#nobot" in (status["account"]["note"] or ""),
+            status["visibility"],
+            status["favourites_count"],
+            status["reblogs_count"],
+            extract_links(status["content"]),
+        )
+
+    @classmethod
+    def from_dict(cls, d):
+        if "content" in d:
+            # A full status, from a store written before records existed.
+            return cls.from_status(d)
+        d = dict(d, created_at=_parse_datetime(d["created_at"]))
+        if "username" in d:
+            # Written before records kept the acct.
+            d["acct"] = d.pop("username")
+        return cls(**d)
+
+    def to_dict(self):
+        d = {name: getattr(self, name) for name in self.__slots__}
+        d["created_at"] = self.created_at.isoformat()
+        return d
+
+    @property
+    def popularity(self):
+        return self.favourites_count + self.reblogs_count
+
+    def __repr__(self):
+        return f"TootRecord({self.id}, {self.uri!r})"
+
+
+def _parse_datetime(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value
+
+
+def write_records(records, path, append=True):
+    """Write records to the store one by one, returns them as a list."""
+    written = []
+    with open(path, "a" if append else "w") as f:
+        for record in records:
+            f.write(json.dumps(record.to_dict()) + "\n")
+            written.append(record)
+    return written
+
+
+def load_window(path, window=timedelta(days=1)):
+    """Read the records of the last `window` from a store, newest first.
+
+    A toot can appear several times when it was re-fetched, or read from
+    several instances with different ids; by uri, the last copy wins,
+    since it carries the most recent favourite and reblog counts. The store is
+    compacted when expired or superseded lines outnumber live ones.
+    """
+    cutoff = datetime.now(timezone.utc) - window
+    records = {}
+    n_lines = 0
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                n_lines += 1
+                record = TootRecord.from_dict(json.loads(line))
+                if record.created_at > cutoff:
+                    records[record.uri] = record
+    except FileNotFoundError:
+        return []
+
+    records = sorted(records.values(), key=lambda x: x.created_at, reverse=True)
+    if n_lines > 2 * len(records):
+        logger.info(f"Compacting {path} ({n_lines} lines, {len(records)} live)")
+        write_records(records, path + ".tmp", append=False)
+        os.replace(path + ".tmp", path)
+    return records
@@ -0,0 +1,120 @@
+"""Fitting a webpage into the token budget of a summarization prompt.
+
+Text is counted in approximate model tokens with a regex modelled on the GPT
+tokenizers' pre-tokenization (words with their leading space, numbers by
+groups of three digits, runs of punctuation), long pieces costing extra. The
+scan stops as soon as the budget is spent, so a multi-megabyte body costs no
+more than its first few kilobytes.
+
+The most informative parts go first: the meta description, then the abstract
+if the page has one, then the body from the top.
+"""
+import re
+
+TOKEN_RE = re.compile(
+    r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+(?!\S)|\s+"""
+)
+# Tokenizers split rare long words into pieces of a few characters.
+CHARS_PER_TOKEN = 6
+
+# Context windows, in tokens.
+MODEL_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-4": 8192,
+}
+# Room left for the instructions and the JSON answer.
+RESERVED_TOKENS = 1500
+
+# A heading, paragraph or quote starting with "Abstract", possibly wrapped in
+# inline tags, e.g. <blockquote><span>Abstract:</span>... on arXiv.
+ABSTRACT_RE = re.compile(
+    r"<(h[1-6]|p|blockquote|section|strong|b|span)>\s*(?:<[a-z0-9]+>\s*)*abstract\b",
+    re.IGNORECASE,
+)
+# Don't look for an abstract past the top of the page.
+ABSTRACT_SEARCH_CHARS = 50_000
+HEADING_RE = re.compile(r"<h[1-6]>", re.IGNORECASE)
+BLOCK_TAGS = {"p", "blockquote", "section"}
+
+
+def body_budget(model):
+    """Tokens available for the page in a prompt to model."""
+    return MODEL_CONTEXT_TOKENS[model] - RESERVED_TOKENS
+
+
+def token_cost(piece):
+    return 1 + len(piece.strip()) // CHARS_PER_TOKEN
+
+
+def count_tokens(text):
+    return sum(token_cost(m.group()) for m in TOKEN_RE.finditer(text))
+
+
+def truncate_tokens(text, max_tokens, start=0, end=None):
+    """(text[start:end] cut to max_tokens, tokens used, whether it was cut).
+
+    The cut never falls inside an HTML tag.
+    """
+    end = len(text) if end is None else end
+    used = 0
+    for match in TOKEN_RE.finditer(text, start, end):
+        cost = token_cost(match.group())
+        if used + cost > max_tokens:
+            prefix = text[start : match.start()]
+            if prefix.rfind("<") > prefix.rfind(">"):
+                prefix = prefix[: prefix.rfind("<")]
+            return prefix.rstrip(), used, True
+        used += cost
+    return text[start:end], used, False
+
+
+def find_abstract(body):
+    """(start, end) of the abstract section of body, or None."""
+    match = ABSTRACT_RE.search(body, 0, ABSTRACT_SEARCH_CHARS)
+    if match is None:
+        return None
+    tag = match.group(1).lower()
+    if tag in BLOCK_TAGS:
+        end = body.find(f"</{tag}>", match.end())
+        end = len(body) if end == -1 else end + len(tag) + 3
+    else:
+        # The abstract runs up to the next heading.
+        heading = HEADING_RE.search(body, match.end())
+        end = heading.start() if heading else len(body)
+    return match.start(), end
+
+
+def truncate_body(contents, max_tokens):
+    """The description, abstract and body of a page, within max_tokens.
+
+    contents is the output of extract.extract_content. Parts that didn't fit
+    end with "...".
+    """
+    body = contents["body"]
+    # (text, start, end) spans, so the body is never copied whole. The body
+    # around the abstract is the last section, in two spans.
+    sections = [[(body, 0, len(body))]]
+    abstract = find_abstract(body)
+    if abstract:
+        start, end = abstract
+        sections = [[(body, start, end)], [(body, 0, start), (body, end, len(body))]]
+
+    description = contents.get("description", "")
+    if description and not (abstract and description[:100] in body[start:end]):
+        sections.insert(0, [(description, 0, len(description))])
+
+    parts = []
+    for spans in sections:
+        section = ""
+        for text, start, end in spans:
+            if max_tokens <= 0:
+                break
+            text, used, cut = truncate_tokens(text, max_tokens, start, end)
+            max_tokens -= used
+            section += text + "..." if cut else text
+            if cut:
+                break
+        if section:
+            parts.append(section)
+    return "\n".join(parts)